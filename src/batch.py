@@ -0,0 +1,252 @@
+import numpy as np
+
+from core import HAND_SIZE
+from rules import SUITS, NUM_KINDS, KIND_SUIT, KIND_VALUE, TRICK_RANK
+
+DECK_SIZE = 48
+
+# Lookup arrays for card kinds. Index 0 is "no card" with suit -1 and value 0
+KIND_SUIT_ARRAY = np.array(KIND_SUIT, dtype=np.int8)
+KIND_VALUE_ARRAY = np.array(KIND_VALUE, dtype=np.int16)
+
+# Card strength by trump, lead suit and card kind (shared rank table from rules.py)
+TRICK_RANK_ARRAY = np.array(TRICK_RANK, dtype=np.int16).reshape(len(SUITS), len(SUITS), NUM_KINDS + 1)
+
+
+class BatchGaigelSim:
+    """
+    Simulates many independent gaigel games in lockstep. All games are stored in NumPy arrays and every call of step
+    plays one card in every running game. Since all games deal the same number of cards and play one card per step,
+    the turn, round, stack position and match color phase are shared by all games. Only the cards, points, player
+    queues and game over states differ between games.
+    """
+
+    def __init__(self, num_games: int, players: int, seed=None):
+        self.num_games = num_games
+        self.num_players = players
+        self.rng = np.random.default_rng(seed)
+        self.game_index = np.arange(num_games)
+
+        # General Game state variables
+        self.card_stack = np.tile(np.repeat(np.arange(1, 25, dtype=np.int8), 2), (num_games, 1))
+        self.deck_pos = 0
+        self.trump_card = np.zeros(num_games, dtype=np.int8)
+        self.trump = np.full(num_games, -1, dtype=np.int8)
+        self.match_color = False
+        self.game_over = np.zeros(num_games, dtype=bool)
+        self.game_winners = np.zeros((num_games, players), dtype=bool)
+
+        # Player variables
+        self.hands = np.zeros((num_games, players, HAND_SIZE), dtype=np.int8)
+        self.points = np.zeros((num_games, players), dtype=np.int16)
+
+        # Player queue. Seat that takes the next turn
+        self.front = np.zeros(num_games, dtype=np.int64)
+
+        # Round variables
+        self.card_round_stack = np.zeros((num_games, players), dtype=np.int8)
+        self.card_placed_by = np.zeros((num_games, players), dtype=np.int64)
+        self.current_player = np.zeros(num_games, dtype=np.int64)
+        self.last_round_winner = np.full(num_games, -1, dtype=np.int64)
+
+        # Game time tracking
+        self.current_round = 0
+        self.current_turn = 0
+
+    def reset(self, stacks=None, starting_seats=None):
+        """
+        Shuffles the card stacks, selects random starting players and hands out cards for all games
+        :param stacks: Optional card kinds of the card stacks in deal order, shape (num_games, 48). Not shuffled if set
+        :param starting_seats: Optional seat of the starting player per game. Selected randomly if None
+        """
+        if stacks is None:
+            self.card_stack = self.rng.permuted(self.card_stack, axis=1)
+        else:
+            self.card_stack = np.array(stacks, dtype=np.int8).reshape(self.num_games, DECK_SIZE)
+        self.deck_pos = 0
+        self.match_color = False
+        self.game_over[:] = False
+        self.game_winners[:] = False
+        self.hands[:] = 0
+        self.points[:] = 0
+        self.card_round_stack[:] = 0
+        self.last_round_winner[:] = -1
+        self.current_round = 0
+        self.current_turn = 0
+
+        # Select starting players
+        if starting_seats is None:
+            self.front = self.rng.integers(self.num_players, size=self.num_games)
+        else:
+            self.front = np.array(starting_seats, dtype=np.int64).reshape(self.num_games)
+        self.current_player = self.front.copy()
+
+        # Hand out cards. 3 rounds of cards, then the trump card under the stack is skipped, then 2 more rounds
+        for slot in range(HAND_SIZE):
+            card_offset = slot * self.num_players + (1 if slot >= 3 else 0)
+            for i in range(self.num_players):
+                seats = (self.front + i) % self.num_players
+                self.hands[self.game_index, seats, slot] = self.card_stack[:, card_offset + i]
+
+        self.trump_card = self.card_stack[:, 3 * self.num_players].copy()
+        self.trump = KIND_SUIT_ARRAY[self.trump_card]
+        self.deck_pos = 5 * self.num_players + 1
+
+    def legal_moves(self, seats=None):
+        """
+        Gets the valid moves for one player in every game, including the match color rule
+        :param seats: Seat per game. Defaults to the player with the next turn
+        :return: Boolean array of shape (num_games, 5) with True for every hand slot that can be played
+        """
+        if seats is None:
+            seats = self.front
+
+        hand = self.hands[self.game_index, seats]
+        legal = hand != 0
+
+        if self.match_color and self.current_turn > 0:
+            hand_suits = KIND_SUIT_ARRAY[hand]
+            matching = hand_suits == KIND_SUIT_ARRAY[self.card_round_stack[:, 0]][:, None]
+            must_match = matching.any(axis=1)
+            legal &= matching | ~must_match[:, None]
+
+        return legal
+
+    def get_state(self, seats=None):
+        """
+        Get state arrays for one player in every game, same layout as GaigelSim.get_state
+        :param seats: Seat per game. Defaults to the player with the next turn
+        :return: dict with trump (num_games,), hand (num_games, 5) and stack (num_games, players - 1) arrays
+        """
+        if seats is None:
+            seats = self.front
+
+        stack_state = self.card_round_stack[:, :self.num_players - 1].copy()
+        stack_state[:, self.current_turn:] = 0
+
+        return {"trump_state": self.trump.copy(), "hand_state": self.hands[self.game_index, seats],
+                "stack_state": stack_state}
+
+    def random_actions(self, legal):
+        """
+        Chooses a random legal move for every game
+        :param legal: Boolean array of legal moves as returned by legal_moves
+        :return: Array of move ids (1-5) per game
+        """
+        keys = np.where(legal, self.rng.random(legal.shape), -1.0)
+        return keys.argmax(axis=1) + 1
+
+    def step(self, actions=None):
+        """
+        Plays one card in every running game. Games that are over are not changed
+        :param actions: Optional move ids (1-5) per game for the players with the current turn. Missing or invalid
+        actions are replaced by a random valid move
+        """
+        running = ~self.game_over
+        if not running.any():
+            return
+
+        # Select next player and rotate queue
+        seats = self.front
+        self.current_player = np.where(running, seats, self.current_player)
+        self.front = np.where(running, (seats + 1) % self.num_players, self.front)
+
+        # Get player actions. Replace invalid actions with random valid ones
+        legal = self.legal_moves(seats)
+        random_actions = self.random_actions(legal)
+        if actions is None:
+            actions = random_actions
+        else:
+            actions = np.asarray(actions, dtype=np.int64)
+            in_range = (actions >= 1) & (actions <= HAND_SIZE)
+            valid = in_range & legal[self.game_index, np.clip(actions, 1, HAND_SIZE) - 1]
+            actions = np.where(valid, actions, random_actions)
+
+        # Place cards of running games
+        games = self.game_index[running]
+        seats = seats[running]
+        slots = actions[running] - 1
+        self.card_round_stack[games, self.current_turn] = self.hands[games, seats, slots]
+        self.card_placed_by[games, self.current_turn] = seats
+        self.hands[games, seats, slots] = 0
+
+        # Check if round end was reached, perform post round action if true
+        self.current_turn += 1
+        if self.current_turn == self.num_players:
+            self.post_round_actions(running)
+            self.current_round += 1
+            self.current_turn = 0
+
+    def determine_round_winner(self, running):
+        """
+        Counts up all played cards of the current round and adds the points to the round winners
+        :param running: Boolean array of games that are not over
+        :return: Array of winner seats per game
+        """
+        values = KIND_VALUE_ARRAY[self.card_round_stack]
+
+        # Look up card strengths by trump and round start type. The first of multiple equal cards wins
+        lead = KIND_SUIT_ARRAY[self.card_round_stack[:, 0]]
+        card_round_values = TRICK_RANK_ARRAY[self.trump[:, None], lead[:, None], self.card_round_stack]
+        winner = self.card_placed_by[self.game_index, card_round_values.argmax(axis=1)]
+
+        # Add points for winner
+        self.points[self.game_index[running], winner[running]] += values.sum(axis=1, dtype=np.int16)[running]
+        self.last_round_winner = np.where(running, winner, self.last_round_winner)
+
+        return winner
+
+    def post_round_actions(self, running):
+        """
+        Performs all actions necessary at the end of a round
+        :param running: Boolean array of games that were running during the round
+        """
+        # Select winner and rotate player queue to them
+        winner = self.determine_round_winner(running)
+        self.front = np.where(running, winner, self.front)
+
+        # Check game over conditions
+        hand_counts = (self.hands != 0).sum(axis=2)
+        over = running & (((hand_counts == 0) | (self.points >= 101)).any(axis=1))
+        self.game_over |= over
+        self.game_winners[over] = self.points[over] == self.points[over].max(axis=1, keepdims=True)
+
+        # Every player draws a card starting at the winner
+        drawing = running & ~over
+        if not self.match_color and drawing.any():
+            games = self.game_index[drawing]
+            for i in range(self.num_players):
+                if self.deck_pos == DECK_SIZE:
+                    break
+                seats = (winner[drawing] + i) % self.num_players
+                empty_slots = (self.hands[games, seats] == 0).argmax(axis=1)
+                self.hands[games, seats, empty_slots] = self.card_stack[games, self.deck_pos]
+                self.deck_pos += 1
+
+        # Switch to farbe bekennen, if stack is empty
+        if self.deck_pos == DECK_SIZE:
+            self.match_color = True
+
+    def run(self):
+        """
+        Plays all games until game over with random players
+        :return: Points array of shape (num_games, players)
+        """
+        self.reset()
+        while not self.game_over.all():
+            self.step()
+
+        return self.points
+
+
+if __name__ == '__main__':
+    import time
+
+    batch_sim = BatchGaigelSim(100000, 3, seed=0)
+    start = time.perf_counter()
+    final_points = batch_sim.run()
+    duration = time.perf_counter() - start
+    print(f"[STATUS] Played {batch_sim.num_games} games in {duration:.2f}s "
+          f"({batch_sim.num_games / duration:.0f} games/s)")
+    print(f"[STATUS] Average points per seat {final_points.mean(axis=0)}, "
+          f"win rate per seat {batch_sim.game_winners.mean(axis=0)}")
@@ -0,0 +1,244 @@
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from simulation import GaigelSim
+from core import GaigelCore
+from jit_engine import JitGaigel
+
+LEGACY_SIMULATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "x_old", "simulation.py")
+
+# Metrics where a lower value is better. All other metrics are rates where a higher value is better
+LOWER_IS_BETTER = ("_us", "_bytes")
+
+# Metrics of code that does not change. Reported for comparison, but never counted as regression
+INFORMATIONAL = ("legacy_",)
+
+
+def load_legacy_simulation():
+    """
+    Imports the legacy simulation from x_old/simulation.py under its own module name
+    :return: Legacy simulation module
+    """
+    spec = importlib.util.spec_from_file_location("legacy_simulation", LEGACY_SIMULATION_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure_time(function, calls: int, repeats: int = 3):
+    """
+    Measures the wall time of a function. The fastest of multiple repeats is used to reduce noise
+    :param function: Function to measure
+    :param calls: Number of calls per repeat
+    :param repeats: Number of repeats
+    :return: Seconds per call
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+
+def measure_allocations(game_function, games: int):
+    """
+    Measures the memory allocated while playing games with tracemalloc
+    :param game_function: Function that plays one game
+    :param games: Number of games to play
+    :return: Highest number of bytes allocated at once during a single game
+    """
+    game_function()  # Warm up caches, so only per game allocations are counted
+
+    tracemalloc.start()
+    peak = 0
+    for _ in range(games):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        game_function()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return peak
+
+
+def benchmark_simulation(players: int, games: int):
+    """
+    Benchmarks complete random games, resets and state copies of GaigelSim, GaigelCore, JitGaigel and the legacy
+    simulation
+    :param players: Number of players per game
+    :param games: Number of games per measurement
+    :return: dict of metric name to value
+    """
+    legacy_simulation = load_legacy_simulation()
+    sim = GaigelSim(players, seed=0)
+    core = GaigelCore(players, seed=0)
+
+    def play_sim_game():
+        sim.reset()
+        sim.run()
+
+    def play_core_game():
+        core.reset()
+        core.run()
+
+    def play_legacy_game():
+        legacy_simulation.GaigelSim(players).run()
+
+    # Snapshot in the middle of a game, as used by search agents
+    sim.reset()
+    for _ in range(3 * players):
+        sim.step()
+    snapshot = sim.snapshot()
+    core.restore(snapshot)
+
+    # All games of the typed array engine are played in one batch. The first run compiles the engine with Numba
+    jit = JitGaigel(games, players, seed=0)
+    jit.run()
+
+    allocation_games = max(games // 10, 1)
+    results = {"sim_games_per_sec": 1 / measure_time(play_sim_game, games),
+               "core_games_per_sec": 1 / measure_time(play_core_game, games),
+               "jit_games_per_sec": games / measure_time(jit.run, 1),
+               "sim_reset_us": measure_time(sim.reset, games) * 1e6,
+               "sim_peak_bytes": measure_allocations(play_sim_game, allocation_games),
+               "core_peak_bytes": measure_allocations(play_core_game, allocation_games)}
+
+    sim.restore(snapshot)
+    core.restore(snapshot)
+    results["sim_clone_us"] = measure_time(sim.clone, games) * 1e6
+    results["sim_snapshot_us"] = measure_time(sim.snapshot, games) * 1e6
+    results["sim_restore_us"] = measure_time(lambda: sim.restore(snapshot), games) * 1e6
+    results["core_clone_us"] = measure_time(core.clone, games) * 1e6
+
+    # The legacy simulation prints invalid match color moves even if not verbose
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results["legacy_games_per_sec"] = 1 / measure_time(play_legacy_game, games)
+        results["legacy_peak_bytes"] = measure_allocations(play_legacy_game, allocation_games)
+
+    return results
+
+
+def benchmark_environment(players: int, steps: int):
+    """
+    Benchmarks GaigelEnv.step and GaigelEnv.reset with random legal actions
+    :param players: Number of players per game
+    :param steps: Number of environment steps per measurement
+    :return: dict of metric name to value
+    """
+    from environment import GaigelEnv
+
+    env = GaigelEnv(players)
+    env.action_space.seed(0)
+    _, info = env.reset(seed=0)
+
+    def env_step():
+        nonlocal info
+        _, _, terminated, _, info = env.step(env.action_space.sample(mask=info["action_mask"].astype("int8")))
+        if terminated:
+            _, info = env.reset()
+
+    return {"env_steps_per_sec": 1 / measure_time(env_step, steps),
+            "env_reset_us": measure_time(env.reset, max(steps // 10, 1)) * 1e6}
+
+
+def run_suite(players_list, games: int = 2000, steps: int = 20000):
+    """
+    Runs all benchmarks for every number of players
+    :param players_list: Numbers of players to benchmark
+    :param games: Number of games per simulation measurement
+    :param steps: Number of steps per environment measurement
+    :return: Result dict with metadata and metrics named "<metric>/<players>p"
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+
+    metrics = {}
+    for players in players_list:
+        for name, value in {**benchmark_simulation(players, games), **benchmark_environment(players, steps)}.items():
+            metrics[f"{name}/{players}p"] = value
+            print(f"[BENCHMARK] {name + '/' + str(players) + 'p':<28} {value:14.1f}")
+
+        speedup = metrics[f"sim_games_per_sec/{players}p"] / metrics[f"legacy_games_per_sec/{players}p"]
+        print(f"[BENCHMARK] {players} players: GaigelSim plays {speedup:.2f}x the games/s of the legacy simulation")
+        speedup = metrics[f"jit_games_per_sec/{players}p"] / metrics[f"core_games_per_sec/{players}p"]
+        print(f"[BENCHMARK] {players} players: JitGaigel plays {speedup:.2f}x the games/s of GaigelCore")
+
+    return {"metadata": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit,
+                         "python": sys.version.split()[0], "platform": platform.platform(),
+                         "games": games, "steps": steps},
+            "metrics": metrics}
+
+
+def compare_to_baseline(results, baseline, tolerance: float):
+    """
+    Compares benchmark results to a baseline
+    :param results: Result dict of run_suite
+    :param baseline: Result dict of an earlier run
+    :param tolerance: Allowed relative slowdown, e.g. 0.1 for 10%
+    :return: List of regression descriptions. Empty if there is no regression
+    """
+    regressions = []
+    for name, value in results["metrics"].items():
+        if name not in baseline["metrics"] or name.startswith(INFORMATIONAL):
+            continue
+
+        baseline_value = baseline["metrics"][name]
+        change = (value - baseline_value) / baseline_value if baseline_value else 0.0
+        lower_is_better = name.split("/")[0].endswith(LOWER_IS_BETTER)
+
+        status = "ok"
+        if (lower_is_better and change > tolerance) or (not lower_is_better and change < -tolerance):
+            status = "REGRESSION"
+            regressions.append(f"{name}: {baseline_value:.1f} -> {value:.1f} ({change:+.1%})")
+
+        print(f"[COMPARE] {name:<28} {baseline_value:14.1f} -> {value:14.1f} ({change:+7.1%}) {status}")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark suite for the gaigel simulation and environment")
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 3, 4, 5, 6], help="Numbers of players")
+    parser.add_argument("--games", type=int, default=2000, help="Games per simulation measurement")
+    parser.add_argument("--steps", type=int, default=20000, help="Steps per environment measurement")
+    parser.add_argument("--output", help="Write the results to this json file")
+    parser.add_argument("--baseline", help="Compare the results to this json file and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.players, games=args.games, steps=args.steps)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"[STATUS] Saved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"[STATUS] {len(regressions)} regression(s) against {args.baseline}:\n" + "\n".join(regressions))
+            return 1
+
+        print(f"[STATUS] No regressions against {args.baseline}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
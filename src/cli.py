@@ -0,0 +1,316 @@
+"""
+Command line interface for headless gaigel jobs. Every command imports its modules when it runs, so commands that only
+need the simulation start without loading numpy, gymnasium or torch.
+
+    python cli.py play --policies greedy random random --games 100000 --workers 8 --output games.jsonl
+    python cli.py tournament --policies ismcts greedy random --games 1000 --checkpoint tournament.json
+    python cli.py record --players 4 --games 1000000 --output records/
+    python cli.py export --policies greedy random random --record greedy --games 50000 --output dataset/
+    python cli.py selfplay --players 3 --duration 3600 --output policy.npz
+    python cli.py serve --port 8765 --model selfplay=policy.npz
+    python cli.py profile --players 3 --steps 50000 --collapsed profile.collapsed
+    python cli.py benchmark --players 3 4
+
+Results of play are written as one JSON object per game. Status messages go to stderr, so stdout can be piped.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+
+
+def status(message: str):
+    print(f"[STATUS] {message}", file=sys.stderr)
+
+
+def expand_policies(policies, players: int = None):
+    """
+    :param policies: Policy names. A single policy is used for all seats
+    :param players: Number of players. Defaults to the number of policies, or 3 for a single policy
+    :return: List of policy names, one per seat
+    """
+    if len(policies) == 1:
+        return policies * (players if players is not None else 3)
+    if players is not None and players != len(policies):
+        raise SystemExit(f"Got {len(policies)} policies for {players} players")
+    return list(policies)
+
+
+def play_chunk(policies, seed, first_game: int, num_games: int, rotate: bool = True):
+    """
+    Plays games with one seed per game, so every game can be reproduced from the seed and its index alone
+    :param policies: Policy names, one per seat
+    :param seed: Seed of the run
+    :param first_game: Index of the first game
+    :param num_games: Number of games
+    :param rotate: Rotate the policies through the seats from game to game
+    :return: List of result dicts
+    """
+    from policies import make_policy
+    from simulation import GaigelSim, spawn_seeds
+
+    num_of_players = len(policies)
+    instances = [make_policy(policy) for policy in policies]
+    sim = GaigelSim(num_of_players)
+    results = []
+
+    for game, game_seed in zip(range(first_game, first_game + num_games), spawn_seeds(seed, num_games, first_game)):
+        sim.reset(seed=game_seed)
+        seat_policies = [(seat + game) % num_of_players if rotate else seat for seat in range(num_of_players)]
+        for player, policy_index in zip(sim.player_list, seat_policies):
+            player.policy = instances[policy_index]
+        sim.run()
+
+        results.append({"game": game, "seed": game_seed, "policies": [policies[i] for i in seat_policies],
+                        "points": [player.points for player in sim.player_list],
+                        "winners": [player.seat for player in sim.game_winners]})
+
+    return results
+
+
+def command_play(args):
+    policies = expand_policies(args.policies, args.players)
+    num_chunks = math.ceil(args.games / args.chunk_size)
+    chunks = [(args.first_game + chunk * args.chunk_size, min(args.chunk_size, args.games - chunk * args.chunk_size))
+              for chunk in range(num_chunks)]
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    wins = {policy: 0.0 for policy in policies}
+    start = time.perf_counter()
+    games = 0
+
+    try:
+        if args.workers <= 1:
+            results = (play_chunk(policies, args.seed, first, count, not args.no_rotate) for first, count in chunks)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            from itertools import repeat
+            executor = ProcessPoolExecutor(max_workers=args.workers)
+            firsts, counts = zip(*chunks)
+            results = executor.map(play_chunk, repeat(policies), repeat(args.seed), firsts, counts,
+                                   repeat(not args.no_rotate))
+
+        for chunk_results in results:
+            for result in chunk_results:
+                output.write(json.dumps(result) + "\n")
+                for seat in result["winners"]:
+                    wins[result["policies"][seat]] += 1 / len(result["winners"])
+            output.flush()
+            games += len(chunk_results)
+            if args.verbose:
+                status(f"{games}/{args.games} games ({games / (time.perf_counter() - start):.0f} games/s)")
+    finally:
+        if args.workers > 1:
+            executor.shutdown()
+        if output is not sys.stdout:
+            output.close()
+
+    # Policies that appear on several seats share the wins of all their seats
+    summary = ", ".join(f"{policy} {win / max(games, 1):.4f}" for policy, win in wins.items())
+    status(f"Played {games} games in {time.perf_counter() - start:.2f}s | win rates: {summary}")
+    return 0
+
+
+def command_tournament(args):
+    from tournament import Tournament
+
+    tournament = Tournament(expand_policies(args.policies, args.players), num_games=args.games, seed=args.seed,
+                            workers=args.workers, chunk_size=args.chunk_size, checkpoint_path=args.checkpoint,
+                            verbose=args.verbose)
+    tournament.run()
+    print(tournament.summary())
+    return 0
+
+
+def command_record(args):
+    from records import RecordWriter
+    from simulation import GaigelSim, spawn_seeds
+
+    sim = GaigelSim(args.players)
+    start = time.perf_counter()
+    with RecordWriter(args.output, shard_size=args.shard_size) as writer:
+        writer.attach(sim)
+        for game_seed in spawn_seeds(args.seed, args.games, args.first_game):
+            sim.reset(seed=game_seed)
+            sim.run()
+
+    status(f"Recorded {args.games} games to {args.output} in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+def command_export(args):
+    from dataset import export_dataset
+
+    policies = expand_policies(args.policies, args.players)
+    start = time.perf_counter()
+    samples = export_dataset(args.output, policies, args.games, record=args.record, games_per_shard=args.shard_games,
+                             seed=args.seed, workers=args.workers, verbose=args.verbose)
+    status(f"Exported {samples} samples to {args.output} in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+def command_selfplay(args):
+    from selfplay import SelfPlayTrainer
+
+    trainer = SelfPlayTrainer(num_of_players=args.players, num_actors=args.actors, envs_per_actor=args.envs,
+                              hidden_size=args.hidden_size, learning_rate=args.learning_rate, seed=args.seed)
+    trainer.train(total_samples=args.samples, duration=args.duration, report_interval=args.report_interval)
+    trainer.policy.save(args.output)
+    status(f"Saved policy to {args.output}")
+    return 0
+
+
+def load_model(path: str):
+    """
+    Loads an opponent model. .npz files are policies of selfplay.py, everything else is a stable-baselines3 model
+    """
+    if path.endswith(".npz"):
+        from selfplay import MLPPolicy
+        return MLPPolicy.load(path)
+
+    from opponents import SB3Opponent
+    return SB3Opponent(path)
+
+
+def command_serve(args):
+    import asyncio
+    from server import GaigelServer
+
+    models = {}
+    for spec in args.model:
+        name, _, path = spec.partition("=")
+        if not path:
+            raise SystemExit(f"Expected NAME=PATH, got {spec}")
+        models[name] = load_model(path)
+
+    server = GaigelServer(args.host, args.port, move_timeout=args.move_timeout, models=models, seed=args.seed)
+    try:
+        asyncio.run(server.serve_forever(report_interval=args.report_interval))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def command_profile(args):
+    from environment import GaigelEnv
+    from profiling import Profiler
+
+    env = GaigelEnv(args.players)
+    with Profiler() as profiler:
+        profiler.attach_env(env)
+        _, info = env.reset(seed=args.seed)
+        for _ in range(args.steps):
+            _, _, terminated, _, info = env.step(int(info["action_mask"].argmax()))
+            if terminated:
+                _, info = env.reset()
+
+    print(profiler.summary())
+    if args.collapsed:
+        profiler.write_collapsed(args.collapsed)
+        status(f"Wrote flame graph profile to {args.collapsed}")
+    if args.json:
+        profiler.write_json(args.json)
+        status(f"Wrote profile summary to {args.json}")
+    return 0
+
+
+def command_benchmark(args):
+    import benchmark
+    return benchmark.main(args.arguments)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless gaigel simulation jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(command, policies: bool = True):
+        if policies:
+            command.add_argument("--policies", nargs="+", default=["random"],
+                                 help="Policy per seat (random, greedy, ismcts). A single policy plays all seats")
+        command.add_argument("--players", type=int, help="Number of players")
+        command.add_argument("--games", type=int, default=1000, help="Number of games")
+        command.add_argument("--seed", type=int, default=0, help="Seed of the run")
+        command.add_argument("--verbose", action="store_true", help="Print progress")
+
+    play = commands.add_parser("play", help="Play games and stream one JSON result per game")
+    add_common(play)
+    play.add_argument("--first-game", type=int, default=0, help="Index of the first game, e.g. for array jobs")
+    play.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    play.add_argument("--chunk-size", type=int, default=500, help="Games per worker task")
+    play.add_argument("--no-rotate", action="store_true", help="Keep every policy on its seat")
+    play.add_argument("--output", help="Output file. stdout if not set")
+    play.set_defaults(function=command_play)
+
+    tournament = commands.add_parser("tournament", help="Play a tournament and print the statistics")
+    add_common(tournament)
+    tournament.add_argument("--workers", type=int, help="Number of worker processes. All CPUs if not set")
+    tournament.add_argument("--chunk-size", type=int, default=1000, help="Games per worker task")
+    tournament.add_argument("--checkpoint", help="Checkpoint file to resume from")
+    tournament.set_defaults(function=command_tournament)
+
+    record = commands.add_parser("record", help="Write binary game records of random games")
+    add_common(record, policies=False)
+    record.add_argument("--first-game", type=int, default=0, help="Index of the first game, e.g. for array jobs")
+    record.add_argument("--shard-size", type=int, default=1 << 20, help="Records per shard file")
+    record.add_argument("--output", required=True, help="Output directory")
+    record.set_defaults(function=command_record, players=3)
+
+    export = commands.add_parser("export", help="Export a behaviour cloning dataset")
+    add_common(export)
+    export.add_argument("--record", nargs="+", help="Policies whose moves are recorded. All if not set")
+    export.add_argument("--shard-games", type=int, default=10000, help="Games per shard")
+    export.add_argument("--workers", type=int, help="Number of worker processes. All CPUs if not set")
+    export.add_argument("--output", required=True, help="Output directory")
+    export.set_defaults(function=command_export)
+
+    selfplay = commands.add_parser("selfplay", help="Train a policy by self-play")
+    selfplay.add_argument("--players", type=int, default=3, help="Number of players")
+    selfplay.add_argument("--actors", type=int, help="Number of actor processes. One less than the CPUs if not set")
+    selfplay.add_argument("--envs", type=int, default=64, help="Games per actor")
+    selfplay.add_argument("--hidden-size", type=int, default=64, help="Hidden layer size of the policy")
+    selfplay.add_argument("--learning-rate", type=float, default=1e-3, help="Learning rate")
+    selfplay.add_argument("--samples", type=int, help="Number of training samples")
+    selfplay.add_argument("--duration", type=float, help="Training time in seconds")
+    selfplay.add_argument("--report-interval", type=float, default=5.0, help="Seconds between status reports")
+    selfplay.add_argument("--seed", type=int, default=0, help="Seed of the run")
+    selfplay.add_argument("--output", default="selfplay_policy.npz", help="Output file of the policy")
+    selfplay.set_defaults(function=command_selfplay)
+
+    serve = commands.add_parser("serve", help="Run the game server")
+    serve.add_argument("--host", default="127.0.0.1", help="Host to listen on")
+    serve.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    serve.add_argument("--move-timeout", type=float, default=10.0, help="Seconds a client has for a move")
+    serve.add_argument("--model", action="append", default=[], help="Bot model as NAME=PATH (.npz or SB3 .zip)")
+    serve.add_argument("--report-interval", type=float, default=10.0, help="Seconds between status reports")
+    serve.add_argument("--seed", type=int, help="Seed of the table seeds")
+    serve.set_defaults(function=command_serve)
+
+    profile = commands.add_parser("profile", help="Profile environment steps")
+    profile.add_argument("--players", type=int, default=3, help="Number of players")
+    profile.add_argument("--steps", type=int, default=20000, help="Number of environment steps")
+    profile.add_argument("--seed", type=int, default=0, help="Seed of the first game")
+    profile.add_argument("--collapsed", help="Write a collapsed stack profile for flame graphs to this file")
+    profile.add_argument("--json", help="Write the profile summary to this json file")
+    profile.set_defaults(function=command_profile)
+
+    # All other arguments of the benchmark command are passed on to benchmark.py
+    benchmark = commands.add_parser("benchmark", help="Run the benchmark suite. Takes the arguments of benchmark.py")
+    benchmark.set_defaults(function=command_benchmark)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, unknown = parser.parse_known_args(argv)
+    if args.command == "benchmark":
+        args.arguments = unknown
+    elif unknown:
+        parser.error(f"unrecognized arguments: {' '.join(unknown)}")
+
+    return args.function(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,523 @@
+import random
+
+from rules import SUITS, KIND_SUIT, KIND_NAMES, GameSnapshot, resolve_trick
+
+HAND_SIZE = 5
+INITIAL_DECK = tuple(kind for kind in range(1, len(KIND_SUIT)) for _ in range(2))  # 2 cards of every kind
+
+
+class GaigelCore:
+    """
+    Compact version of GaigelSim. The deck, hands, round stack and player order are stored in flat integer lists
+    instead of Card/Player objects and queues, so a game can be reset and replayed without allocating new objects.
+    Players are addressed by their seat index (0 to players-1). Given the same seed, a game played by the core is
+    identical to a game played by GaigelSim. GaigelSim keeps its own object based implementation for its players,
+    policies and observers, tests/test_core.py checks that both play the same games.
+    """
+
+    def __init__(self, players: int, verbose: bool = False, seed=None):
+        self.num_players = players
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+
+        # Card stack. Cards are drawn from the front, deck_pos points to the next card to be drawn
+        self.deck = list(INITIAL_DECK)
+        self.deck_pos = 0
+
+        # General Game state variables
+        self.trump_card = 0  # trump card under stack (card kind)
+        self.trump = -1  # "Trumpf" (suit index)
+        self.match_color = False  # "Farben bekennen" if card stack is empty
+        self.game_over = False
+        self.game_winners = []
+
+        # Player variables. Hand slot s (1-5) of seat p is stored at hands[p * 5 + s - 1]
+        self.hands = [0] * (players * HAND_SIZE)
+        self.hand_counts = [0] * players
+        self.points = [0] * players
+        self.next_actions = [None] * players
+
+        # Player queue. The queue is always a rotation of the seat order, so only the front seat is stored
+        self.front = 0
+
+        # Round variables
+        self.card_round_stack = [0] * players  # Cards placed in a round (only the first round_len entries are used)
+        self.card_placed_by = [0] * players  # Seat that placed each card in the card_round_stack
+        self.round_len = 0
+        self.current_player = -1  # Seat that has the current turn
+        self.last_round_winner = -1
+
+        # Game time tracking
+        self.current_round = 0
+        self.current_turn = 0
+
+    def __str__(self):
+        return_string = f"{'='*30} Round {self.current_round} | Turn {self.current_turn} {'='*30}\n"
+        banner_width = len(return_string)
+
+        return_string += (f"[CARD STACK] ({len(self.deck) - self.deck_pos} cards) "
+                          f"{', '.join([KIND_NAMES[kind] for kind in self.deck[self.deck_pos:]])}")
+
+        if self.match_color:
+            return_string += "--MATCH COLOR ACTIVE--"
+
+        return_string += f"\n[TRUMP SUIT] {KIND_NAMES[self.trump_card]}"
+        return_string += f" | [TRUMP] {SUITS[self.trump] if self.trump >= 0 else None}"
+        return_string += (f" | [CURRENT ROUND STACK] "
+                          f"{', '.join([KIND_NAMES[kind] for kind in self.card_round_stack[:self.round_len]])}")
+
+        for seat in range(self.num_players):
+            hand = self.hands[seat * HAND_SIZE:(seat + 1) * HAND_SIZE]
+            current_turn_marker = '(current turn) ' if seat == self.current_player else ''
+            return_string += (f"\n[PLAYER: player_{seat + 1}] {current_turn_marker}"
+                              f"({self.hand_counts[seat]} cards, {self.points[seat]} points) "
+                              f"{', '.join([KIND_NAMES[kind] if kind else '-' for kind in hand])}")
+
+        return_string += "\n" + "="*(banner_width - 1)
+
+        return return_string
+
+    def reset(self, seed=None):
+        """
+        Resets all game variables in place, so the core can be used for a new game without allocating anything.
+        The deck is put back in its initial order and has to be shuffled again
+        :param seed: Optional seed for the random number generator. If not set, the current random stream continues
+        """
+        if seed is not None:
+            self.rng.seed(seed)
+
+        self.deck[:] = INITIAL_DECK
+        self.deck_pos = 0
+        self.trump_card = 0
+        self.trump = -1
+        self.match_color = False
+        self.game_over = False
+        self.game_winners.clear()
+
+        for i in range(len(self.hands)):
+            self.hands[i] = 0
+        for seat in range(self.num_players):
+            self.hand_counts[seat] = 0
+            self.points[seat] = 0
+            self.next_actions[seat] = None
+
+        self.front = 0
+        self.round_len = 0
+        self.current_player = -1
+        self.last_round_winner = -1
+        self.current_round = 0
+        self.current_turn = 0
+
+    def snapshot(self, include_rng: bool = False):
+        """
+        Saves the game state in a compact, immutable GameSnapshot. Same format as GaigelSim.snapshot
+        :param include_rng: Also save the state of the random number generator
+        :return: GameSnapshot
+        """
+        return GameSnapshot(
+            stack=tuple(self.deck[self.deck_pos:]),
+            trump_card=self.trump_card,
+            hands=tuple(self.hands),
+            points=tuple(self.points),
+            round_stack=tuple(self.card_round_stack[:self.round_len]),
+            placed_by=tuple(self.card_placed_by[:self.round_len]),
+            front=self.front,
+            current_player=self.current_player,
+            last_round_winner=self.last_round_winner,
+            match_color=self.match_color,
+            game_over=self.game_over,
+            game_winners=tuple(self.game_winners),
+            current_round=self.current_round,
+            current_turn=self.current_turn,
+            rng_state=self.rng.getstate() if include_rng else None)
+
+    def restore(self, snapshot: GameSnapshot):
+        """
+        Restores a game state saved with snapshot of a GaigelCore or GaigelSim with the same number of players.
+        The remaining card stack becomes the whole deck, cards that were already drawn are not kept
+        :param snapshot: GameSnapshot
+        """
+        self.deck[:] = snapshot.stack
+        self.deck_pos = 0
+        self.trump_card = snapshot.trump_card
+        self.trump = KIND_SUIT[snapshot.trump_card] if snapshot.trump_card else -1
+
+        self.hands[:] = snapshot.hands
+        for seat in range(self.num_players):
+            self.hand_counts[seat] = sum(1 for kind in self.hands[seat * HAND_SIZE:(seat + 1) * HAND_SIZE] if kind)
+            self.points[seat] = snapshot.points[seat]
+            self.next_actions[seat] = None
+
+        self.round_len = len(snapshot.round_stack)
+        self.card_round_stack[:self.round_len] = snapshot.round_stack
+        self.card_placed_by[:self.round_len] = snapshot.placed_by
+
+        self.front = snapshot.front
+        self.current_player = snapshot.current_player
+        self.last_round_winner = snapshot.last_round_winner
+        self.match_color = snapshot.match_color
+        self.game_over = snapshot.game_over
+        self.game_winners[:] = snapshot.game_winners
+        self.current_round = snapshot.current_round
+        self.current_turn = snapshot.current_turn
+
+        if snapshot.rng_state is not None:
+            self.rng.setstate(snapshot.rng_state)
+
+    def clone(self):
+        """
+        Creates an independent copy of the core, including the state of the random number generator
+        :return: GaigelCore class instance
+        """
+        core = GaigelCore(self.num_players, verbose=self.verbose, seed=0)  # Seed is replaced by restore
+        core.restore(self.snapshot(include_rng=True))
+        return core
+
+    def shuffle_stack(self):
+        """
+        Randomly shuffles the card stack
+        """
+        self.rng.shuffle(self.deck)
+
+        if self.verbose:
+            print("[STATUS] Shuffled card stack")
+
+    def hand_out_cards(self):
+        """
+        Hands out cards from the stack to all players according to gaigel rules. First hand out 3 rounds of cards,
+        then select the trump suit, the hand out the remaining 2 rounds of cards.
+        """
+        if self.verbose:
+            print("[STATUS] Handing out cards to players")
+
+        # Hand out first 3 cards for every player
+        for _ in range(3 * self.num_players):
+            self.draw_card_and_rotate()
+
+        # Define card under stack (trump suit)
+        self.trump_card = self.deck[self.deck_pos]
+        self.trump = KIND_SUIT[self.trump_card]
+        self.deck_pos += 1
+
+        # Hand out last 2 cards for every player
+        for _ in range(2 * self.num_players):
+            self.draw_card_and_rotate()
+
+    def select_starting_player(self):
+        """
+        Selects a random starting player and rotates queue to that player
+        """
+        self.current_player = self.rng.randrange(self.num_players)
+        self.front = self.current_player
+
+        if self.verbose:
+            print(f"[STATUS] Selected starting player player_{self.current_player + 1}")
+
+    def rotate(self):
+        """
+        Takes the front seat of the player queue as current player and moves the queue forward by one
+        :return: Seat index of the current player
+        """
+        self.current_player = self.front
+        self.front = self.front + 1 if self.front + 1 < self.num_players else 0
+        return self.current_player
+
+    def draw_card(self, seat: int):
+        """
+        Gives the specified player a card from the stack
+        :param seat: Seat index of the player
+        """
+        slot = seat * HAND_SIZE
+        while self.hands[slot]:
+            slot += 1
+
+        self.hands[slot] = self.deck[self.deck_pos]
+        self.deck_pos += 1
+        self.hand_counts[seat] += 1
+
+        if self.verbose:
+            print(f"[ACTION] player_{seat + 1} draws card {KIND_NAMES[self.hands[slot]]}")
+
+    def draw_card_and_rotate(self):
+        """
+        Gives the current player a card from the stack and rotates the current player queue once forward
+        """
+        self.draw_card(self.rotate())
+
+    def determine_round_winner(self):
+        """
+        Counts up all played cards during current round and selects round winner. Winners points are added.
+        :return: Seat index of winner
+        """
+        best_index, played_cards_points = resolve_trick(self.trump, self.card_round_stack, self.round_len)
+
+        # Add points for winner
+        winner = self.card_placed_by[best_index]
+        self.points[winner] += played_cards_points
+
+        if self.verbose:
+            print(f"[STATUS] player_{winner + 1} wins the round (+{played_cards_points} points)")
+
+        self.last_round_winner = winner
+        return winner
+
+    def determine_game_winner(self):
+        """
+        Sets the game winner in the class variable. Multiple winners are possible
+        :return: Game winner seat(s)
+        """
+        max_points = max(self.points)
+
+        # Same order as GaigelSim, which lists the winners in player queue order
+        for i in range(self.num_players):
+            seat = (self.front + i) % self.num_players
+            if self.points[seat] == max_points:
+                self.game_winners.append(seat)
+
+        return self.game_winners
+
+    def legal_action_mask(self, seat: int):
+        """
+        Computes which cards the player is allowed to play in the current state of the game
+        :param seat: Seat index of the player
+        :return: Integer bitmask. Bit i is set if the card in position i + 1 can be played
+        """
+        type_to_be_matched = KIND_SUIT[self.card_round_stack[0]] if self.match_color and self.round_len else -2
+        offset = seat * HAND_SIZE
+        mask = 0
+        matching_mask = 0
+
+        for i in range(HAND_SIZE):
+            kind = self.hands[offset + i]
+            if kind:
+                mask |= 1 << i
+                if KIND_SUIT[kind] == type_to_be_matched:
+                    matching_mask |= 1 << i
+
+        # If match color is active and the player has the type, only cards of that type can be played
+        return matching_mask if matching_mask else mask
+
+    def validate_move(self, seat: int, move_id: int, action_mask: int = None):
+        """
+        Takes a player and move id and checks if the move is valid in the current state of the game
+        :param seat: Seat index of the player
+        :param move_id: move id of the players action according to GaigelSim.moves
+        :param action_mask: Legal action mask of the player, if already computed for this turn
+        :return: Boolean if move is valid or not
+        """
+        # CASE: Play card from hand
+        if 1 <= move_id <= 5:
+            if action_mask is None:
+                action_mask = self.legal_action_mask(seat)
+
+            if not action_mask >> (move_id - 1) & 1:
+                if self.verbose:
+                    kind = self.hands[seat * HAND_SIZE + move_id - 1]
+                    # Check if player has card on position
+                    if not kind:
+                        print(f"[INVALID MOVE] player_{seat + 1} tried playing card in position {move_id}, but has "
+                              f"no card in position {move_id}")
+                    # Otherwise match color was not followed
+                    else:
+                        print(f"[INVALID MOVE] player_{seat + 1} tried playing card type {SUITS[KIND_SUIT[kind]]}, "
+                              f"when type match for type {SUITS[KIND_SUIT[self.card_round_stack[0]]]} is active")
+                return False
+
+        # All checks passed
+        return True
+
+    def validate_game_over(self):
+        """
+        Checks if a game over condition is reached. Game over if player cards are empty or player has over 101 points
+        :return: Boolean if game over
+        """
+        for seat in range(self.num_players):
+            if self.hand_counts[seat] == 0 or self.points[seat] >= 101:
+                self.game_over = True
+                return self.game_over
+
+        return self.game_over
+
+    def get_state(self, seat: int, action_mask: int = None):
+        """
+        Get state for a player. Same layout as GaigelSim.get_state
+        :param seat: Seat index of the player
+        :param action_mask: Legal action mask of the player, if already computed for this turn
+        :return: state dict including ids for all cards on the players hand and cards placed in the round
+        """
+        stack_state = self.card_round_stack[:self.num_players - 1]
+        for i in range(self.round_len, self.num_players - 1):
+            stack_state[i] = 0
+
+        if action_mask is None:
+            action_mask = self.legal_action_mask(seat)
+
+        return {"trump_state": self.trump,
+                "hand_state": self.hands[seat * HAND_SIZE:(seat + 1) * HAND_SIZE],
+                "stack_state": stack_state,
+                "action_mask": [action_mask >> i & 1 for i in range(HAND_SIZE)]}
+
+    def set_next_action(self, seat: int, action):
+        self.next_actions[seat] = action
+
+    def get_action(self, seat: int, action_mask: int):
+        """
+        Returns the action of a player. Works like Player.get_action, chooses a random legal card if no action is set
+        :param seat: Seat index of the player
+        :param action_mask: Legal action mask of the player
+        :return: Player action choice
+        """
+        # If no action is given, chose randomly from the legal moves
+        if self.next_actions[seat] is None:
+            choice = self.rng.randrange(action_mask.bit_count())
+            slot = 0
+            while True:
+                if action_mask >> slot & 1:
+                    if choice == 0:
+                        return slot + 1
+                    choice -= 1
+                slot += 1
+
+        # Return specific action if set
+        else:
+            action_to_return = int(self.next_actions[seat])
+            self.next_actions[seat] = None
+            return action_to_return
+
+    def new_round_actions(self):
+        """
+        Performs all actions necessary for starting a new round in the simulation
+        """
+        # Reset current turn count and increment round count
+        self.current_round += 1
+        self.current_turn = 0
+
+        # Reset turn variables
+        self.round_len = 0
+
+        if self.verbose:
+            print(f"[STATUS] Starting round {self.current_round}")
+
+    def post_round_actions(self):
+        """
+        Performs all actions necessary at the end of a round
+        """
+        # Select winner and rotate player queue to them
+        self.front = self.determine_round_winner()
+
+        # Check game over conditions
+        if self.validate_game_over():
+
+            self.determine_game_winner()
+
+            if self.verbose:
+                print(f"[STATUS] Game over. {'Winner is' if len(self.game_winners) == 1 else 'Winners are'} "
+                      f"{', '.join(['player_' + str(seat + 1) for seat in self.game_winners])}")
+
+            return
+
+        # Every player draws a card starting at the winner
+        for _ in range(self.num_players):
+            if self.deck_pos < len(self.deck) and not self.match_color:
+                self.draw_card_and_rotate()
+            else:
+                # Stack used up. Rotate player without drawing card (Ab hier farbe bekennen)
+                self.rotate()
+                if not self.match_color and self.verbose:
+                    print(f"[STATUS] player_{self.current_player + 1} skipped card draw due to empty stack")
+
+        # Switch to farbe bekennen, if stack is empty
+        if self.deck_pos == len(self.deck):
+            self.match_color = True
+
+    def step(self):
+        """
+        Performs one step in the simulation. One step is one action from a player
+        """
+        if not self.game_over:
+            # Next player turn
+            self.next_player_turn()
+
+            # Check if round end was reached, perform post round action if true
+            if self.current_turn == self.num_players:
+                self.post_round_actions()
+
+                # Also initiate new round of game not over
+                if not self.game_over:
+                    self.new_round_actions()
+
+    def step_to_player_turn(self, seat: int):
+
+        # Step until player is next in queue
+        while self.front != seat and not self.game_over:
+            self.step()
+
+    def next_player_turn(self):
+        """
+        Perform one turn for the next player in the queue
+        """
+        seat = self.rotate()
+
+        # Advance turn count
+        self.current_turn += 1
+
+        # Compute legal moves once per turn
+        action_mask = self.legal_action_mask(seat)
+
+        # Get player action. Repeat if move was not valid
+        while True:
+            player_action = self.get_action(seat, action_mask)
+            if self.validate_move(seat, player_action, action_mask):
+                break
+
+        # Place card
+        if 1 <= player_action <= 5:
+            slot = seat * HAND_SIZE + player_action - 1
+
+            if self.verbose:
+                print(f"[ACTION] player_{seat + 1} played {KIND_NAMES[self.hands[slot]]}")
+
+            # Add selected card to current round stack and remove from players hand
+            self.card_round_stack[self.round_len] = self.hands[slot]
+            self.card_placed_by[self.round_len] = seat
+            self.round_len += 1
+            self.hands[slot] = 0
+            self.hand_counts[seat] -= 1
+
+    def run(self, manual_player: bool = False):
+        """
+        Runs a complete gaigel simulation until game over with the step function version
+        """
+        if self.verbose:
+            print(f"[STATUS] Starting Gaigel simulation with {self.num_players} players")
+
+        # Initial actions. Skipped if the game was restored after the cards were handed out
+        if self.trump < 0:
+            self.shuffle_stack()
+            self.select_starting_player()
+            self.hand_out_cards()
+        manual_player_seat = self.front
+
+        # Game loop
+        while not self.game_over:
+
+            if manual_player:
+                self.step_to_player_turn(manual_player_seat)
+
+                if self.verbose:
+                    print(self)
+
+                action = input(f"[PLAYER: player_{manual_player_seat + 1}] Select action: ")
+                self.set_next_action(manual_player_seat, action)
+                self.step()
+
+            else:
+                self.step()
+
+                if self.verbose:
+                    print(self)
+
+
+if __name__ == '__main__':
+    core = GaigelCore(3, verbose=True)
+    core.run(manual_player=True)
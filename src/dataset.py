@@ -0,0 +1,334 @@
+"""
+Offline datasets of (observation, action, reward) samples, e.g. for behaviour cloning. export_dataset plays games
+between policies on a process pool and writes the moves of the chosen policies into columnar shards: one directory per
+shard with one .npy file per column. DatasetLoader memory maps the shards and yields shuffled minibatches, only the
+rows of the current batch are read from disk.
+
+Columns (one row per move):
+    trump_state, hand_state, stack_state, action_mask: Observation of the moving player as in GaigelSim.get_state
+    action: Played hand slot (0-4) as in the gaigel environments
+    reward: 1 if the player won the round of the move, else 0 (same as the reward of GaigelEnv)
+    done: True for the last move of the player in the game
+    policy: Index of the policy in the export
+    game: Index of the game in the export
+"""
+import json
+import math
+import os
+import shutil
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from policies import make_policy, policy_name
+from simulation import GaigelSim, spawn_seeds
+
+COLUMNS = {"trump_state": np.int8, "hand_state": np.int8, "stack_state": np.int8, "action_mask": np.bool_,
+           "action": np.int8, "reward": np.float32, "done": np.bool_, "policy": np.int8, "game": np.int64}
+
+
+class SampleCollector:
+    """
+    GaigelSim observer that collects the moves of chosen seats as samples. See GaigelSim.observers
+    """
+
+    def __init__(self, num_of_players: int):
+        self.num_of_players = num_of_players
+        self.columns = {"trump_state": array("b"), "hand_state": array("b"), "stack_state": array("b"),
+                        "action_mask": array("b"), "action": array("b"), "reward": array("f"), "done": array("b"),
+                        "policy": array("b"), "game": array("q")}
+        self.seat_policies = {}  # Seat to policy index of the seats that are recorded in the current game
+        self.game = 0
+        self.round_samples = []  # (sample index, seat) of the moves in the current round
+        self.last_samples = {}  # Seat to index of its last sample in the current game
+
+    def __len__(self):
+        return len(self.columns["action"])
+
+    def start_game(self, game: int, seat_policies):
+        """
+        :param game: Index of the game
+        :param seat_policies: dict of recorded seat to policy index
+        """
+        self.game = game
+        self.seat_policies = seat_policies
+        self.round_samples.clear()
+        self.last_samples.clear()
+
+    def on_deal(self, sim):
+        pass
+
+    def on_action(self, sim, player, slot: int, card):
+        if player.seat not in self.seat_policies:
+            return
+
+        columns = self.columns
+        index = len(self)
+        self.round_samples.append((index, player.seat))
+        self.last_samples[player.seat] = index
+
+        # The card already left the hand and lies on the round stack. Rebuild the observation before the move
+        hand = list(player.hand_state)
+        hand[slot - 1] = card.kind
+        stack = list(sim.stack_state)
+        if len(sim.card_round_stack) <= len(stack):
+            stack[len(sim.card_round_stack) - 1] = 0
+
+        columns["trump_state"].append(sim.trump_state)
+        columns["hand_state"].extend(hand)
+        columns["stack_state"].extend(stack)
+        columns["action_mask"].extend([sim.action_mask >> i & 1 for i in range(5)])
+        columns["action"].append(slot - 1)
+        columns["reward"].append(0.0)
+        columns["done"].append(0)
+        columns["policy"].append(self.seat_policies[player.seat])
+        columns["game"].append(self.game)
+
+    def on_round_end(self, sim, winner):
+        for index, seat in self.round_samples:
+            if seat == winner.seat:
+                self.columns["reward"][index] = 1.0
+        self.round_samples.clear()
+
+    def on_game_over(self, sim):
+        for index in self.last_samples.values():
+            self.columns["done"][index] = 1
+
+    def arrays(self):
+        """
+        :return: dict of column name to NumPy array
+        """
+        shapes = {"hand_state": (-1, 5), "stack_state": (-1, self.num_of_players - 1), "action_mask": (-1, 5)}
+        return {name: np.frombuffer(column, dtype=np.dtype(column.typecode)).astype(COLUMNS[name]).reshape(
+                shapes.get(name, (-1,))) for name, column in self.columns.items()}
+
+
+def write_shard(path: str, columns):
+    """
+    Writes the columns of a shard. The shard directory is only visible once all columns are written
+    :param path: Shard directory
+    :param columns: dict of column name to NumPy array
+    """
+    temporary_path = path + ".tmp"
+    os.makedirs(temporary_path, exist_ok=True)
+    for name, column in columns.items():
+        np.save(os.path.join(temporary_path, name + ".npy"), column)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(temporary_path, path)
+
+
+def export_shard(path: str, policies, recorded, num_of_players: int, seed: int, first_game: int, num_games: int):
+    """
+    Plays the games of one shard and writes their samples. The policies rotate through the seats from game to game
+    :param path: Shard directory
+    :param policies: List of policies (names or picklable callables), one per seat
+    :param recorded: Indices of the policies whose moves are recorded
+    :param num_of_players: Number of players per game
+    :param seed: Seed of the shard
+    :param first_game: Index of the first game in this shard
+    :param num_games: Number of games to play
+    :return: Number of samples in the shard
+    """
+    policies = [make_policy(policy) for policy in policies]
+    sim = GaigelSim(num_of_players, seed=seed)
+    collector = SampleCollector(num_of_players)
+    sim.observers.append(collector)
+
+    for game in range(first_game, first_game + num_games):
+        sim.reset()
+
+        seat_policies = [(seat + game) % num_of_players for seat in range(num_of_players)]
+        for player, policy_index in zip(sim.player_list, seat_policies):
+            player.policy = policies[policy_index]
+        collector.start_game(game, {seat: policy_index for seat, policy_index in enumerate(seat_policies)
+                                    if policy_index in recorded})
+        sim.run()
+
+    write_shard(path, collector.arrays())
+    return len(collector)
+
+
+def export_dataset(directory: str, policies, num_games: int, record=None, games_per_shard: int = 10000, seed: int = 0,
+                   workers: int = None, verbose: bool = False):
+    """
+    Plays games between policies and writes the moves as dataset shards. Existing shards in the directory are kept,
+    new shards are numbered after them and continue the seeds and game indices of the earlier exports. Appending to a
+    dataset of other policies or recorded seats is refused
+    :param directory: Dataset directory
+    :param policies: List of policies (names or picklable callables), one per seat
+    :param num_games: Number of games to play
+    :param record: Names or indices of the policies whose moves are recorded. A name records every policy of that
+    name. All policies if None
+    :param games_per_shard: Number of games per shard
+    :param seed: Seed of the export
+    :param workers: Number of worker processes. None uses all CPUs
+    :param verbose: Print progress
+    :return: Number of written samples
+    """
+    names = [policy_name(policy) for policy in policies]
+    if record is None:
+        recorded = set(range(len(policies)))
+    else:
+        recorded = set()
+        for policy in record:
+            if not isinstance(policy, str):
+                recorded.add(policy)
+            elif policy in names:
+                recorded.update(index for index, name in enumerate(names) if name == policy)
+            else:
+                raise ValueError(f"Policy {policy} is not one of the exported policies {names}")
+
+    metadata = {"num_of_players": len(policies), "policies": names, "recorded": sorted(recorded),
+                "columns": list(COLUMNS), "num_games": 0}
+    metadata_path = os.path.join(directory, "dataset.json")
+    os.makedirs(directory, exist_ok=True)
+
+    # Continue an existing dataset. Its policy and game columns only keep their meaning for the same policies
+    first_shard = 0
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as file:
+            existing = json.load(file)
+        for key in ("num_of_players", "policies", "recorded", "columns"):
+            if existing.get(key) != metadata[key]:
+                raise ValueError(f"Dataset {directory} has {key} {existing.get(key)}, can not append {metadata[key]}")
+        metadata["num_games"] = existing["num_games"] if "num_games" in existing else max(
+            [int(np.load(os.path.join(path, "game.npy"), mmap_mode="r").max(initial=-1)) + 1
+             for path in shard_paths(directory)], default=0)
+        first_shard = max([int(os.path.basename(path)[len("shard-"):]) + 1 for path in shard_paths(directory)],
+                          default=0)
+
+    first_game = metadata["num_games"]
+    num_shards = math.ceil(num_games / games_per_shard)
+    shard_seeds = spawn_seeds(seed, num_shards, start=first_shard)
+    tasks = [(os.path.join(directory, f"shard-{first_shard + shard:05d}"), policies, recorded, len(policies),
+              shard_seeds[shard], first_game + shard * games_per_shard,
+              min(games_per_shard, num_games - shard * games_per_shard))
+             for shard in range(num_shards)]
+
+    # The games are counted before they are played, so an interrupted export never leads to reused game indices
+    metadata["num_games"] = first_game + num_games
+    with open(metadata_path + ".tmp", "w") as file:
+        json.dump(metadata, file)
+    os.replace(metadata_path + ".tmp", metadata_path)
+
+    start = time.perf_counter()
+    num_samples = 0
+    workers = workers if workers is not None else os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor is None:
+            results = (export_shard(*task) for task in tasks)
+        else:
+            results = (future.result() for future in as_completed([executor.submit(export_shard, *task)
+                                                                   for task in tasks]))
+
+        for shard, samples in enumerate(results):
+            num_samples += samples
+            if verbose:
+                samples_per_second = num_samples / (time.perf_counter() - start)
+                print(f"[STATUS] {shard + 1}/{num_shards} shards written ({samples_per_second:.0f} samples/s)")
+    finally:
+        # Shards that did not start yet are dropped if one failed
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    return num_samples
+
+
+def shard_paths(directory: str):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith("shard-") and not name.endswith(".tmp"))
+
+
+class DatasetLoader:
+    """
+    Iterates over a dataset in shuffled minibatches. Shards are memory mapped. Every epoch visits the shards in random
+    order and the samples of each shard in random order, so only one shard permutation is held in memory
+    """
+
+    def __init__(self, directory: str, batch_size: int = 256, shuffle: bool = True, drop_last: bool = False,
+                 columns=None, seed=None):
+        """
+        :param directory: Dataset directory
+        :param batch_size: Number of samples per batch
+        :param shuffle: Shuffle shards and samples every epoch
+        :param drop_last: Skip the last batch of an epoch if it is smaller than batch_size
+        :param columns: Names of the columns to load. All columns if None
+        :param seed: Seed of the shuffling
+        """
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.columns = list(columns) if columns is not None else list(COLUMNS)
+        self.rng = np.random.default_rng(seed)
+
+        self.shards = [{name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in self.columns}
+                       for path in shard_paths(directory)]
+        self.shard_sizes = [len(shard[self.columns[0]]) for shard in self.shards]
+        self.num_samples = sum(self.shard_sizes)
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_samples // self.batch_size
+        return math.ceil(self.num_samples / self.batch_size)
+
+    def __iter__(self):
+        """
+        Yields the batches of one epoch
+        :return: Generator of dicts of column name to NumPy array
+        """
+        shard_order = self.rng.permutation(len(self.shards)) if self.shuffle else range(len(self.shards))
+        pending = []  # Parts of the next batch from the end of previous shards
+        pending_size = 0
+
+        for shard_index in shard_order:
+            shard = self.shards[shard_index]
+            size = self.shard_sizes[shard_index]
+            order = self.rng.permutation(size) if self.shuffle else np.arange(size)
+
+            start = 0
+            while start < size:
+                count = min(self.batch_size - pending_size, size - start)
+                indices = np.sort(order[start:start + count])  # Sorted reads are faster, the batch is a set anyway
+                pending.append({name: column[indices] for name, column in shard.items()})
+                pending_size += count
+                start += count
+
+                if pending_size == self.batch_size:
+                    yield self.join(pending)
+                    pending, pending_size = [], 0
+
+        if pending and not self.drop_last:
+            yield self.join(pending)
+
+    @staticmethod
+    def join(parts):
+        if len(parts) == 1:
+            return parts[0]
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+
+    start = time.perf_counter()
+    samples = export_dataset(directory, ["greedy", "random", "random"], num_games=20000, record=["greedy"],
+                             games_per_shard=2500, verbose=True)
+    print(f"[BENCHMARK] Exported {samples} samples in {time.perf_counter() - start:.2f}s")
+
+    loader = DatasetLoader(directory, batch_size=1024, seed=0)
+    start = time.perf_counter()
+    for epoch in range(3):
+        rewards = 0.0
+        for batch in loader:
+            rewards += batch["reward"].sum()
+    print(f"[BENCHMARK] Loaded 3 epochs of {loader.num_samples} samples in {time.perf_counter() - start:.2f}s "
+          f"(mean reward {rewards / loader.num_samples:.4f})")
+
+    shutil.rmtree(directory)
@@ -0,0 +1,261 @@
+"""
+Sampling of the hidden cards of an information set ("determinization") for search agents and belief-based observations.
+A player has seen its own hand, the trump card and all played cards. Every other card lies on the card stack or in a
+hidden slot of an opponent hand. While matching color, opponents that did not follow the round start type have no
+card of that suit left (Player.void_suits), and since no cards are drawn in this phase they never get one again.
+
+DealSampler draws deals that respect these void suits uniformly at random among all consistent deals, without
+rejection. Holders of hidden cards (opponent hands and the card stack) with the same void suits are merged into one
+group, then a table over the remaining capacity of every group counts the consistent deals suit by suit. A sample picks
+how many cards of every suit go to every group from the table, then shuffles the cards of each suit and each group.
+Tables only depend on the number of hidden cards per suit, the void suits and the hidden slots, so they are built once
+per move and cached, and every further sample costs a few table lookups and shuffles.
+"""
+import math
+import random
+from bisect import bisect_right
+
+from core import HAND_SIZE
+from rules import KIND_SUIT, SUITS
+
+HIDDEN = -1  # Marks a hidden card in the snapshot of an information set
+STACK = None  # Holder of the card stack in the groups of a layout
+
+
+def observe(sim, player):
+    """
+    Builds the information set of a player: the game state with all cards hidden that the player has not seen
+    :param sim: GaigelSim instance
+    :param player: Player class instance of the observing player
+    :return: Tuple of (snapshot with HIDDEN cards, observer seat, sorted hidden card kinds, void suits per seat)
+    """
+    snapshot = sim.snapshot()
+    seat = player.seat
+
+    # Policies are asked for a move after the player was taken from the queue. Rewind the turn, so the player is next
+    if len(snapshot.round_stack) < snapshot.current_turn:
+        snapshot = snapshot._replace(front=snapshot.current_player, current_turn=snapshot.current_turn - 1)
+
+    hands = list(snapshot.hands)
+    hidden = list(snapshot.stack)
+    for i, kind in enumerate(hands):
+        if kind and i // HAND_SIZE != seat:
+            hidden.append(kind)
+            hands[i] = HIDDEN
+
+    snapshot = snapshot._replace(stack=(HIDDEN,) * len(snapshot.stack), hands=tuple(hands))
+    return snapshot, seat, tuple(sorted(hidden)), tuple(p.void_suits for p in sim.player_list)
+
+
+def compositions(count: int, caps, allowed):
+    """
+    Splits a number of cards over groups
+    :param count: Number of cards
+    :param caps: Remaining capacity per group
+    :param allowed: Boolean per group, False if the group can not take cards
+    :return: Generator of tuples with the number of cards per group
+    """
+    if not caps:
+        if count == 0:
+            yield ()
+        return
+
+    if not allowed[0]:
+        for rest in compositions(count, caps[1:], allowed[1:]):
+            yield (0,) + rest
+        return
+
+    # The other groups have to be able to take the cards that are left
+    rest_capacity = sum(cap for cap, group_allowed in zip(caps[1:], allowed[1:]) if group_allowed)
+    for first in range(max(count - rest_capacity, 0), min(count, caps[0]) + 1):
+        for rest in compositions(count - first, caps[1:], allowed[1:]):
+            yield (first,) + rest
+
+
+class DealSampler:
+    """
+    Draws uniformly random deals of the hidden cards that are consistent with an information set. The two cards of a
+    kind are counted as different cards, like in a shuffled deck
+    """
+
+    def __init__(self, rng: random.Random = None, cache_size: int = 64):
+        """
+        :param rng: Random number generator. A new unseeded generator if None
+        :param cache_size: Number of count tables to keep
+        """
+        self.rng = rng if rng is not None else random.Random()
+        self.cache_size = cache_size
+        self.tables = {}  # (cards per suit, void suits per group, capacity per group) to count table
+        self.info_set = None  # Information set of the current layout
+        self.layout = None
+
+    def prepare(self, info_set):
+        """
+        Splits the holders of hidden cards into groups and gets the count table of the information set. Called by
+        sample, repeated calls with the same information set return the cached layout
+        :param info_set: Information set as returned by observe
+        :return: Tuple of (cards per suit, holders per group, capacity per group, count table)
+        """
+        if info_set is self.info_set:
+            return self.layout
+
+        snapshot, seat, hidden, void_suits = info_set
+        suit_cards = tuple(tuple(kind for kind in hidden if KIND_SUIT[kind] == suit) for suit in range(len(SUITS)))
+
+        # Holders with equal void suits take the same cards and form one group. The card stack has no void suits
+        holders_by_voids = {0: [STACK]} if snapshot.stack else {}
+        for other in range(len(void_suits)):
+            slots = [i for i in range(other * HAND_SIZE, (other + 1) * HAND_SIZE) if snapshot.hands[i] == HIDDEN]
+            if slots and other != seat:
+                holders_by_voids.setdefault(void_suits[other], []).append(slots)
+
+        group_voids = tuple(sorted(holders_by_voids))
+        groups = tuple(holders_by_voids[voids] for voids in group_voids)
+        caps = tuple(sum(len(snapshot.stack) if holder is STACK else len(holder) for holder in holders)
+                     for holders in groups)
+        if sum(caps) != len(hidden):
+            raise ValueError(f"Information set has {len(hidden)} hidden cards, but {sum(caps)} hidden places")
+
+        key = (tuple(len(cards) for cards in suit_cards), group_voids, caps)
+        table = self.tables.get(key)
+        if table is None:
+            if len(self.tables) >= self.cache_size:
+                self.tables.clear()
+            table = self.tables[key] = self.build_table(key[0], group_voids, caps)
+        if not table[(0, caps)][0]:
+            raise ValueError("Information set can not be determinized")
+
+        self.info_set = info_set
+        self.layout = (suit_cards, groups, caps, table)
+        return self.layout
+
+    @staticmethod
+    def build_table(counts, group_voids, caps):
+        """
+        Counts the deals of the hidden cards suit by suit. Entry (suit, remaining capacity per group) holds the number
+        of ways to deal the cards of this and all later suits into the remaining capacity, and the cumulative counts
+        of every split of the cards of this suit over the groups
+        :param counts: Number of hidden cards per suit
+        :param group_voids: Void suit bitmask per group
+        :param caps: Capacity per group
+        :return: dict of (suit, capacity tuple) to (number of deals, cumulative counts, splits)
+        """
+        table = {}
+        allowed = [tuple(not voids >> suit & 1 for voids in group_voids) for suit in range(len(SUITS))]
+
+        def count_deals(suit, remaining):
+            entry = table.get((suit, remaining))
+            if entry is not None:
+                return entry[0]
+
+            if suit == len(SUITS):
+                table[(suit, remaining)] = (0 if any(remaining) else 1, None, None)
+                return table[(suit, remaining)][0]
+
+            # Number of ways to choose which cards of the suit go to which group, times the deals of the later suits
+            total = 0
+            cumulative = []
+            splits = []
+            for split in compositions(counts[suit], remaining, allowed[suit]):
+                later = count_deals(suit + 1, tuple(cap - count for cap, count in zip(remaining, split)))
+                if later:
+                    ways = math.factorial(counts[suit])
+                    for count in split:
+                        ways //= math.factorial(count)
+                    total += ways * later
+                    cumulative.append(total)
+                    splits.append(split)
+
+            table[(suit, remaining)] = (total, cumulative, splits)
+            return total
+
+        count_deals(0, caps)
+        return table
+
+    def count(self, info_set):
+        """
+        Counts the deals that are consistent with an information set
+        :param info_set: Information set as returned by observe
+        :return: Number of deals (cards per holder, the order of cards in a hand or on the stack is not counted)
+        """
+        _, groups, caps, table = self.prepare(info_set)
+        deals = table[(0, caps)][0]
+
+        # Every group splits its cards freely between its holders
+        for holders, cap in zip(groups, caps):
+            deals *= math.factorial(cap)
+            for holder in holders:
+                deals //= math.factorial(len(info_set[0].stack) if holder is STACK else len(holder))
+        return deals
+
+    def sample(self, info_set):
+        """
+        Samples a complete game state from an information set
+        :param info_set: Information set as returned by observe
+        :return: GameSnapshot without hidden cards
+        """
+        suit_cards, groups, caps, table = self.prepare(info_set)
+        snapshot = info_set[0]
+        rng = self.rng
+
+        # Choose how many cards of every suit every group gets and which ones
+        pools = [[] for _ in groups]
+        for suit, cards in enumerate(suit_cards):
+            total, cumulative, splits = table[(suit, caps)]
+            split = splits[bisect_right(cumulative, rng.randrange(total))]
+            caps = tuple(cap - count for cap, count in zip(caps, split))
+
+            cards = list(cards)
+            rng.shuffle(cards)
+            start = 0
+            for pool, count in zip(pools, split):
+                pool.extend(cards[start:start + count])
+                start += count
+
+        # Shuffle the cards of every group over its holders
+        hands = list(snapshot.hands)
+        stack = ()
+        for pool, holders in zip(pools, groups):
+            rng.shuffle(pool)
+            start = 0
+            for holder in holders:
+                if holder is STACK:
+                    stack = tuple(pool[start:start + len(snapshot.stack)])
+                    start += len(snapshot.stack)
+                else:
+                    for slot in holder:
+                        hands[slot] = pool[start]
+                        start += 1
+
+        return snapshot._replace(stack=stack, hands=tuple(hands))
+
+
+if __name__ == '__main__':
+    import time
+    from simulation import GaigelSim
+
+    # Sample the hidden cards of the first positions with known void suits
+    sim = GaigelSim(4, seed=0)
+    sampler = DealSampler(random.Random(0))
+    positions = 0
+    samples = 0
+    duration = 0.0
+
+    for game in range(200):
+        sim.reset()
+        while not sim.game_over:
+            player = sim.players.queue[0]
+            voids = [other.void_suits for other in sim.player_list if other is not player]
+            if sim.match_color and any(voids):
+                info_set = observe(sim, player)
+                start = time.perf_counter()
+                for _ in range(1000):
+                    sampler.sample(info_set)
+                duration += time.perf_counter() - start
+                positions += 1
+                samples += 1000
+                break
+            sim.step()
+
+    print(f"[BENCHMARK] {samples} samples of {positions} positions with void suits in {duration:.2f}s "
+          f"({samples / duration:.0f} samples/s)")
@@ -0,0 +1,487 @@
+"""
+Distributed rollouts over plain TCP. A Coordinator in the main process hands out tasks to worker processes on any
+number of machines and collects their results:
+
+    games:   Plays games with policies in a GaigelSim, returns the points and winners of every game
+    rollout: Steps a batch of games in a GaigelVectorEnv, returns the observations, actions, rewards and dones
+
+Messages are length-prefixed frames: two uint32 lengths, a JSON header and the raw bytes of the NumPy arrays listed in
+the header. Every worker gets at most max_in_flight tasks at a time and a new task only once a result was taken, and
+results wait in a bounded queue for the consumer, so a slow consumer stops the workers instead of filling memory.
+Tasks of a worker that disconnects are handed out again. Task seeds are derived from the run seed and the task id,
+so results do not depend on which worker runs a task. LocalCluster starts workers as local processes and restarts
+them when they die.
+
+    python distributed.py worker --host 10.0.0.1 --port 8766
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from simulation import spawn_seeds
+
+FRAME = struct.Struct("!II")  # Header length, body length
+MAX_FRAME = 1 << 30
+
+
+def encode_message(header, arrays=None):
+    """
+    :param header: JSON serializable dict
+    :param arrays: Optional dict of name to NumPy array
+    :return: Frame bytes
+    """
+    arrays = arrays or {}
+    header = dict(header, arrays=[[name, array.dtype.str, array.shape] for name, array in arrays.items()])
+    header_bytes = json.dumps(header).encode()
+    body = b"".join(np.ascontiguousarray(array).tobytes() for array in arrays.values())
+    return FRAME.pack(len(header_bytes), len(body)) + header_bytes + body
+
+
+def decode_message(header_bytes: bytes, body: bytes):
+    """
+    :return: Tuple of (header dict, dict of name to NumPy array)
+    """
+    header = json.loads(header_bytes)
+    arrays = {}
+    offset = 0
+    for name, dtype, shape in header.pop("arrays"):
+        array = np.frombuffer(body, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        arrays[name] = array
+        offset += array.nbytes
+    return header, arrays
+
+
+def check_frame(header_length: int, body_length: int):
+    if header_length + body_length > MAX_FRAME:
+        raise ConnectionError(f"Frame of {header_length + body_length} bytes exceeds the limit")
+
+
+def receive_exactly(sock: socket.socket, size: int):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Connection closed")
+        received += count
+    return bytes(buffer)
+
+
+def receive_message(sock: socket.socket):
+    header_length, body_length = FRAME.unpack(receive_exactly(sock, FRAME.size))
+    check_frame(header_length, body_length)
+    return decode_message(receive_exactly(sock, header_length), receive_exactly(sock, body_length))
+
+
+async def read_message(reader: asyncio.StreamReader):
+    header_length, body_length = FRAME.unpack(await reader.readexactly(FRAME.size))
+    check_frame(header_length, body_length)
+    return decode_message(await reader.readexactly(header_length), await reader.readexactly(body_length))
+
+
+def run_games(task):
+    """
+    Plays games with policies. Game i uses the seed spawn_seeds(task seed)[i]
+    """
+    from policies import make_policy
+    from simulation import GaigelSim
+
+    policies = [make_policy(policy) for policy in task["policies"]]
+    num_games = task["num_games"]
+    sim = GaigelSim(len(policies))
+    for player, policy in zip(sim.player_list, policies):
+        player.policy = policy
+
+    points = np.zeros((num_games, len(policies)), dtype=np.int16)
+    winners = np.zeros(num_games, dtype=np.uint16)  # Bitmask of the winning seats
+    for game, game_seed in enumerate(spawn_seeds(task["seed"], num_games)):
+        sim.reset(seed=game_seed)
+        sim.run()
+        points[game] = [player.points for player in sim.player_list]
+        winners[game] = sum(1 << player.seat for player in sim.game_winners)
+
+    return {"points": points, "winners": winners}
+
+
+def run_rollout(task, arrays):
+    """
+    Steps a batch of games. Actions are sampled from a selfplay.MLPPolicy if its weights are sent with the task,
+    otherwise uniformly from the legal actions
+    """
+    from vector_env import GaigelVectorEnv
+
+    num_envs, steps = task["num_envs"], task["steps"]
+    rng = np.random.default_rng(task["seed"])
+    env = GaigelVectorEnv(num_envs, task["num_of_players"])
+    observations, info = env.reset(seed=task["seed"])
+    action_masks = info["action_mask"]
+
+    policy = None
+    if "weights" in arrays:
+        from selfplay import MLPPolicy
+        policy = MLPPolicy(task["num_of_players"], task["hidden_size"], seed=task["seed"])
+        policy.set_flat(arrays["weights"])
+
+    result = {"trump": np.zeros((steps, num_envs), dtype=np.int8),
+              "hand": np.zeros((steps, num_envs, 5), dtype=np.int8),
+              "stack": np.zeros((steps, num_envs, task["num_of_players"] - 1), dtype=np.int8),
+              "action_masks": np.zeros((steps, num_envs, 5), dtype=bool),
+              "actions": np.zeros((steps, num_envs), dtype=np.int8),
+              "rewards": np.zeros((steps, num_envs), dtype=np.float32),
+              "dones": np.zeros((steps, num_envs), dtype=bool)}
+
+    for t in range(steps):
+        for name in ("trump", "hand", "stack"):
+            result[name][t] = observations[name]
+        result["action_masks"][t] = action_masks
+
+        if policy is not None:
+            actions = policy.predict(observations, action_masks)
+        else:
+            scores = rng.random(action_masks.shape)
+            scores[~action_masks] = -1.0
+            actions = scores.argmax(axis=1)
+
+        observations, rewards, terminated, _, info = env.step(actions)
+        action_masks = info["action_mask"]
+        result["actions"][t] = actions
+        result["rewards"][t] = rewards
+        result["dones"][t] = terminated
+
+    env.close()
+    return result
+
+
+TASKS = {"games": lambda task, arrays: run_games(task), "rollout": run_rollout}
+
+
+def execute_task(task, arrays):
+    """
+    Runs a task. The result only depends on the task, so every worker computes the same result
+    :param task: Task header with kind, seed and parameters
+    :param arrays: Arrays sent with the task
+    :return: dict of result arrays
+    """
+    return TASKS[task["kind"]](task, arrays)
+
+
+def worker_main(host: str, port: int, worker_id: int = 0, connect_timeout: float = 30.0):
+    """
+    Worker process. Connects to the coordinator and runs tasks until the coordinator shuts it down
+    """
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            sock = socket.create_connection((host, port))
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(encode_message({"type": "hello", "worker_id": worker_id, "pid": os.getpid(),
+                                 "host": socket.gethostname()}))
+
+    with sock:
+        while True:
+            try:
+                header, arrays = receive_message(sock)
+            except ConnectionError:
+                return
+
+            if header["type"] == "shutdown":
+                return
+
+            start = time.perf_counter()
+            result = execute_task(header, arrays)
+            sock.sendall(encode_message({"type": "result", "task_id": header["task_id"],
+                                         "duration": time.perf_counter() - start}, result))
+
+
+class WorkerConnection:
+    def __init__(self, coordinator, reader, writer, hello):
+        self.coordinator = coordinator
+        self.reader = reader
+        self.writer = writer
+        self.worker_id = hello.get("worker_id")
+        self.pid = hello.get("pid")
+        self.in_flight = {}  # Task id to task
+
+    def has_credit(self):
+        return len(self.in_flight) < self.coordinator.max_in_flight
+
+    def send_task(self, task):
+        header, arrays = task
+        self.in_flight[header["task_id"]] = task
+        self.writer.write(encode_message(header, arrays))
+
+
+class Coordinator:
+    """
+    Hands out tasks to connected workers and collects the results
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8766, seed=0, max_in_flight: int = 2,
+                 result_queue_size: int = 64, verbose: bool = False):
+        """
+        :param host: Host to listen on
+        :param port: Port to listen on. 0 picks a free port
+        :param seed: Seed of the run. Task seeds are derived from it and the task id
+        :param max_in_flight: Tasks per worker that are sent before a result came back
+        :param result_queue_size: Results that are kept for the consumer before the workers get no new tasks
+        :param verbose: Print worker connects and disconnects
+        """
+        self.host = host
+        self.port = port
+        self.seed = seed
+        self.max_in_flight = max_in_flight
+        self.verbose = verbose
+        self.results = asyncio.Queue(maxsize=result_queue_size)
+        self.pending = deque()
+        self.workers = set()
+        self.handlers = set()  # Connection handler tasks
+        self.outstanding = set()  # Ids of the submitted tasks whose result was not delivered yet
+        self.next_task_id = 0
+        self.server = None
+
+        # Statistics
+        self.requeued = 0
+        self.worker_connects = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.connect, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        for worker in list(self.workers):
+            worker.writer.write(encode_message({"type": "shutdown"}))
+        for handler in list(self.handlers):
+            handler.cancel()
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def submit(self, kind: str, arrays=None, seed: int = None, **params):
+        """
+        Queues a task
+        :param kind: Task kind (see TASKS)
+        :param arrays: Optional dict of arrays sent with the task
+        :param seed: Task seed. Derived from the run seed and the task id if None
+        :param params: Task parameters
+        :return: Task id
+        """
+        task_id = self.next_task_id
+        self.next_task_id += 1
+        self.outstanding.add(task_id)
+        if seed is None:
+            seed = spawn_seeds(self.seed, 1, task_id)[0]
+
+        self.pending.append(({"type": "task", "kind": kind, "task_id": task_id, "seed": seed, **params}, arrays))
+        self.dispatch()
+        return task_id
+
+    def dispatch(self):
+        for worker in self.workers:
+            while self.pending and worker.has_credit():
+                worker.send_task(self.pending.popleft())
+
+    async def connect(self, reader, writer):
+        self.handlers.add(asyncio.current_task())
+        try:
+            await self.handle(reader, writer)
+        except asyncio.CancelledError:
+            pass  # Coordinator closed
+        finally:
+            self.handlers.discard(asyncio.current_task())
+
+    async def handle(self, reader, writer):
+        try:
+            hello, _ = await read_message(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        worker = WorkerConnection(self, reader, writer, hello)
+        self.workers.add(worker)
+        self.worker_connects += 1
+        if self.verbose:
+            print(f"[STATUS] Worker {worker.worker_id} (pid {worker.pid}) connected")
+        self.dispatch()
+
+        try:
+            while True:
+                header, arrays = await read_message(reader)
+                task = worker.in_flight.pop(header["task_id"], None)
+                if task is None or header["task_id"] not in self.outstanding:
+                    continue
+
+                # Waits while the result queue is full. The worker gets no new task meanwhile
+                self.outstanding.discard(header["task_id"])
+                await self.results.put((task[0], header, arrays))
+                self.dispatch()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # Hand out the unfinished tasks of the worker again, in their original order
+            self.workers.discard(worker)
+            self.requeued += len(worker.in_flight)
+            self.pending.extendleft(reversed(list(worker.in_flight.values())))
+            writer.close()
+            if self.verbose:
+                print(f"[STATUS] Worker {worker.worker_id} disconnected, {len(worker.in_flight)} tasks requeued")
+            self.dispatch()
+
+    async def next_result(self):
+        """
+        :return: Tuple of (task header, result header, result arrays) of the next finished task
+        """
+        return await self.results.get()
+
+
+class LocalCluster:
+    """
+    Runs workers as local processes and restarts them when they exit
+    """
+
+    def __init__(self, host: str, port: int, num_workers: int = None, max_restarts: int = 10):
+        """
+        :param host: Host of the coordinator
+        :param port: Port of the coordinator
+        :param num_workers: Number of worker processes. All CPUs if None
+        :param max_restarts: Maximum number of restarts over all workers
+        """
+        self.host = host
+        self.port = port
+        self.num_workers = num_workers if num_workers is not None else os.cpu_count()
+        self.max_restarts = max_restarts
+        self.processes = []
+        self.restarts = 0
+        self.monitor_task = None
+
+    def spawn(self, worker_id: int):
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", "--host", self.host,
+                                 "--port", str(self.port), "--worker-id", str(worker_id)])
+
+    def start(self):
+        self.processes = [self.spawn(i) for i in range(self.num_workers)]
+        self.monitor_task = asyncio.get_running_loop().create_task(self.monitor())
+
+    async def monitor(self, interval: float = 0.2):
+        while True:
+            await asyncio.sleep(interval)
+            for worker_id, process in enumerate(self.processes):
+                if process.poll() is not None and self.restarts < self.max_restarts:
+                    print(f"[STATUS] Worker {worker_id} exited with code {process.returncode}, restarting")
+                    self.processes[worker_id] = self.spawn(worker_id)
+                    self.restarts += 1
+
+    def stop(self):
+        """
+        Stops the monitor and terminates all workers. Call before closing the coordinator, so the workers that are shut
+        down by the coordinator are not restarted
+        """
+        if self.monitor_task is not None:
+            self.monitor_task.cancel()
+        for process in self.processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            process.wait()
+
+
+async def run_local(tasks, num_workers: int = None, seed=0, max_in_flight: int = 2):
+    """
+    Runs tasks on local worker processes
+    :param tasks: List of (kind, params dict) or (kind, params dict, arrays dict)
+    :param num_workers: Number of worker processes. All CPUs if None
+    :param seed: Seed of the run
+    :param max_in_flight: Tasks per worker that are sent before a result came back
+    :return: List of result array dicts in task order
+    """
+    coordinator = Coordinator(port=0, seed=seed, max_in_flight=max_in_flight)
+    await coordinator.start()
+    cluster = LocalCluster(coordinator.host, coordinator.port, num_workers)
+    cluster.start()
+
+    try:
+        for task in tasks:
+            coordinator.submit(task[0], task[2] if len(task) > 2 else None, **task[1])
+
+        results = [None] * len(tasks)
+        for _ in range(len(tasks)):
+            task, _, arrays = await coordinator.next_result()
+            results[task["task_id"]] = arrays
+        return results
+    finally:
+        cluster.stop()
+        await coordinator.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed gaigel rollouts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="Run a worker that connects to a coordinator")
+    worker.add_argument("--host", default="127.0.0.1", help="Host of the coordinator")
+    worker.add_argument("--port", type=int, default=8766, help="Port of the coordinator")
+    worker.add_argument("--worker-id", type=int, default=0, help="Id of the worker in status messages")
+    commands.add_parser("demo", help="Run rollouts on local workers and restart a killed worker")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        worker_main(args.host, args.port, args.worker_id)
+    else:
+        asyncio.run(demo())
+    return 0
+
+
+async def demo():
+    coordinator = Coordinator(port=0, seed=0, verbose=True)
+    await coordinator.start()
+    cluster = LocalCluster(coordinator.host, coordinator.port, num_workers=4)
+    cluster.start()
+
+    num_tasks = 64
+    for _ in range(num_tasks):
+        coordinator.submit("rollout", num_envs=64, num_of_players=3, steps=64)
+
+    start = time.perf_counter()
+    samples = 0
+    rewards = []
+    for i in range(num_tasks):
+        task, header, arrays = await coordinator.next_result()
+        samples += arrays["actions"].size
+        rewards.append((task["task_id"], float(arrays["rewards"].sum())))
+
+        # Kill a worker in the middle of the run, its tasks are handed out again
+        if i == num_tasks // 4:
+            cluster.processes[0].kill()
+
+    duration = time.perf_counter() - start
+    print(f"[BENCHMARK] {samples} samples in {duration:.2f}s ({samples / duration:.0f} samples/s) | "
+          f"{coordinator.requeued} tasks requeued | {cluster.restarts} worker restarts")
+
+    # Results are the same as running the tasks in this process
+    task = {"kind": "rollout", "num_envs": 64, "num_of_players": 3, "steps": 64, "seed": spawn_seeds(0, 1, 5)[0]}
+    expected = float(execute_task(task, {})["rewards"].sum())
+    print(f"[STATUS] Task 5 reward sum {dict(rewards)[5]} (local {expected})")
+    assert dict(rewards)[5] == expected, "Remote result differs from the local result"
+
+    cluster.stop()
+    await coordinator.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
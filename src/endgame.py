@@ -0,0 +1,290 @@
+"""
+Exact solver for the match color phase ("Farbe bekennen"). Once the card stack is empty no more cards are drawn, so a
+game with all hands known can be searched to the end. The solver plays paranoid alpha-beta: the solving seat
+maximizes its win share (1 for a win, 1/n for a win shared by n players, 0 otherwise) and all other seats minimize
+it. Positions with equal win share are ranked by the points of the solving seat. Moves follow the legal action mask
+of GaigelCore, transpositions are looked up with the Zobrist hash and moves are searched strongest first in the
+current round.
+"""
+from core import GaigelCore, HAND_SIZE
+from rules import NUM_KINDS, KIND_SUIT, SUITS, TRICK_RANK, resolve_trick
+from transposition import (HAND_KEYS, ROUND_KEYS, LEAD_KEYS, POINTS_KEYS, FRONT_KEYS, KIND_COUNT, MAX_POINTS,
+                           TranspositionTable, compute_hash)
+
+# Bound types of transposition table entries
+EXACT, LOWER, UPPER = 0, 1, 2
+
+POINTS_WEIGHT = 1e-4  # Value of one point. 240 points stay below the smallest difference of two win shares
+
+
+class EndgameSolver:
+    """
+    Solves match color positions with all cards known. The transposition table is kept between solves, so a solver
+    can be reused for all moves of a game and for many sampled deals of the same position.
+    """
+
+    def __init__(self, table_size: int = 1 << 18):
+        """
+        :param table_size: Number of entries of the transposition table
+        """
+        self.table = TranspositionTable(table_size)
+        self.core = None
+        self.root = -1  # Seat the values are computed for
+        self.hash = 0
+        self.nodes = 0  # Number of searched positions
+
+    def load(self, snapshot):
+        """
+        Loads a position into the solver
+        :param snapshot: GameSnapshot of a game in the match color phase. The seat at the front moves next
+        """
+        if not snapshot.match_color or snapshot.stack:
+            raise ValueError("The endgame solver can only be used when the card stack is empty")
+
+        if self.core is None or self.core.num_players != len(snapshot.points):
+            self.core = GaigelCore(len(snapshot.points), seed=0)
+
+        self.core.restore(snapshot)
+        self.root = snapshot.front
+        self.hash = compute_hash(snapshot)
+        self.table.new_search()
+
+    def move_values(self, snapshot):
+        """
+        Computes the exact value of every legal move of the seat at the front
+        :param snapshot: GameSnapshot of a game in the match color phase
+        :return: dict of card kind to value of the move for the moving seat with perfect play
+        """
+        self.load(snapshot)
+        seat = self.core.front
+        values = {}
+
+        for slot in self.ordered_moves(seat):
+            undo = self.play(seat, slot)
+            values[undo[1]] = self.search(-1.0, 2.0)
+            self.undo(undo)
+
+        return values
+
+    def best_move(self, snapshot):
+        """
+        Finds the best move of the seat at the front
+        :param snapshot: GameSnapshot of a game in the match color phase
+        :return: Tuple of (card kind, value of the move for the moving seat with perfect play)
+        """
+        self.load(snapshot)
+        seat = self.core.front
+        best_kind, best_value = 0, -1.0
+
+        for slot in self.ordered_moves(seat):
+            undo = self.play(seat, slot)
+            value = self.search(best_value, 2.0)
+            self.undo(undo)
+
+            if value > best_value:
+                best_kind, best_value = undo[1], value
+
+        return best_kind, best_value
+
+    def ordered_moves(self, seat: int):
+        """
+        Gets the legal hand slots of a seat, strongest card in the current round first. Of two cards of the same kind
+        only one is searched
+        :param seat: Seat index of the player
+        :return: List of hand slots (0-4)
+        """
+        core = self.core
+        action_mask = core.legal_action_mask(seat)
+        offset = seat * HAND_SIZE
+        lead = KIND_SUIT[core.card_round_stack[0]] if core.round_len else -1
+        base = core.trump * len(SUITS)
+
+        moves = []
+        kinds = []
+        for slot in range(HAND_SIZE):
+            kind = core.hands[offset + slot]
+            if action_mask >> slot & 1 and kind not in kinds:
+                kinds.append(kind)
+                rank = TRICK_RANK[(base + (lead if lead >= 0 else KIND_SUIT[kind])) * (NUM_KINDS + 1) + kind]
+                moves.append((rank, slot))
+
+        moves.sort(reverse=True)
+        return [slot for _, slot in moves]
+
+    def play(self, seat: int, slot: int):
+        """
+        Plays a card and resolves the round if it is complete. Works like GaigelCore.next_player_turn and
+        post_round_actions in the match color phase, but can be undone
+        :param seat: Seat index of the player
+        :param slot: Hand slot (0-4)
+        :return: Undo information for undo
+        """
+        core = self.core
+        undo = (seat * HAND_SIZE + slot, core.hands[seat * HAND_SIZE + slot], core.front, core.round_len, self.hash,
+                core.game_over, core.last_round_winner, list(core.points), core.card_round_stack[core.round_len],
+                core.card_placed_by[core.round_len])
+
+        # Move the card from the hand to the round stack
+        index, kind = undo[0], undo[1]
+        core.hands[index] = 0
+        core.hand_counts[seat] -= 1
+        copy = kind in core.hands[seat * HAND_SIZE:(seat + 1) * HAND_SIZE]
+        self.hash ^= (HAND_KEYS[(seat * KIND_COUNT + kind) * 2 + copy] ^ ROUND_KEYS[core.round_len * KIND_COUNT + kind]
+                      ^ FRONT_KEYS[core.front])
+        if core.round_len == 0:
+            self.hash ^= LEAD_KEYS[seat]
+
+        core.card_round_stack[core.round_len] = kind
+        core.card_placed_by[core.round_len] = seat
+        core.round_len += 1
+
+        if core.round_len < core.num_players:
+            core.front = seat + 1 if seat + 1 < core.num_players else 0
+            self.hash ^= FRONT_KEYS[core.front]
+            return undo
+
+        # Round complete. The winner takes the points and starts the next round
+        winner_index, points = resolve_trick(core.trump, core.card_round_stack, core.round_len)
+        winner = core.card_placed_by[winner_index]
+
+        for position in range(core.round_len):
+            self.hash ^= ROUND_KEYS[position * KIND_COUNT + core.card_round_stack[position]]
+        self.hash ^= LEAD_KEYS[core.card_placed_by[0]]
+
+        points_index = winner * (MAX_POINTS + 1)
+        self.hash ^= POINTS_KEYS[points_index + core.points[winner]]
+        core.points[winner] += points
+        self.hash ^= POINTS_KEYS[points_index + min(core.points[winner], MAX_POINTS)] ^ FRONT_KEYS[winner]
+
+        core.front = winner
+        core.last_round_winner = winner
+        core.round_len = 0
+        core.game_over = core.points[winner] >= 101 or 0 in core.hand_counts
+
+        return undo
+
+    def undo(self, undo):
+        """
+        Takes back a move made with play
+        :param undo: Undo information returned by play
+        """
+        core = self.core
+        index, kind, front, round_len, zobrist, game_over, last_round_winner, points, stack_kind, placed_by = undo
+
+        core.hands[index] = kind
+        core.hand_counts[index // HAND_SIZE] += 1
+        core.front = front
+        core.round_len = round_len
+        core.card_round_stack[round_len] = stack_kind  # Entries of a finished round are overwritten by the next round
+        core.card_placed_by[round_len] = placed_by
+        core.game_over = game_over
+        core.last_round_winner = last_round_winner
+        core.points[:] = points
+        self.hash = zobrist
+
+    def result(self):
+        """
+        Value of a finished game for the solving seat: win share plus a small bonus for its points
+        """
+        points = self.core.points
+        max_points = max(points)
+        bonus = points[self.root] * POINTS_WEIGHT
+        if points[self.root] < max_points:
+            return bonus
+        return 1 / points.count(max_points) + bonus
+
+    def search(self, alpha: float, beta: float):
+        """
+        Paranoid alpha-beta search
+        :param alpha: Lower bound of the search window
+        :param beta: Upper bound of the search window
+        :return: Value of the position for the solving seat with perfect play
+        """
+        core = self.core
+        if core.game_over:
+            return self.result()
+
+        self.nodes += 1
+        key = self.hash
+        entry = self.table.lookup(key)
+        if entry is not None and entry[0] == self.root:
+            _, value, bound = entry
+            if bound == EXACT:
+                return value
+            elif bound == LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        seat = core.front
+        maximizing = seat == self.root
+        window = (alpha, beta)
+        best = -1.0 if maximizing else 2.0
+
+        for slot in self.ordered_moves(seat):
+            undo = self.play(seat, slot)
+            value = self.search(alpha, beta)
+            self.undo(undo)
+
+            if maximizing:
+                if value > best:
+                    best = value
+                    alpha = max(alpha, value)
+            elif value < best:
+                best = value
+                beta = min(beta, value)
+
+            if alpha >= beta:
+                break
+
+        bound = EXACT
+        if best <= window[0]:
+            bound = UPPER
+        elif best >= window[1]:
+            bound = LOWER
+        self.table.store(key, (self.root, best, bound), depth=sum(core.hand_counts))
+
+        return best
+
+
+def average_move_values(solver: EndgameSolver, snapshots):
+    """
+    Averages the exact move values over multiple deals, e.g. samples of the hidden cards of an information set. The
+    seat at the front and its hand have to be the same in all deals
+    :param solver: EndgameSolver instance
+    :param snapshots: Iterable of GameSnapshots
+    :return: dict of card kind to average value
+    """
+    totals = {}
+    count = 0
+    for snapshot in snapshots:
+        for kind, value in solver.move_values(snapshot).items():
+            totals[kind] = totals.get(kind, 0.0) + value
+        count += 1
+
+    return {kind: total / count for kind, total in totals.items()}
+
+
+if __name__ == '__main__':
+    import time
+    from simulation import GaigelSim
+
+    # Solve the first match color position of some games
+    sim = GaigelSim(3, seed=0)
+    solver = EndgameSolver()
+    start = time.perf_counter()
+
+    for game in range(20):
+        sim.reset()
+        while not sim.match_color and not sim.game_over:
+            sim.step()
+        if sim.game_over:
+            continue
+
+        kind, value = solver.best_move(sim.snapshot())
+        print(f"[RESULT] Game {game}: {sim.players.queue[0].name} plays {sim.cards_by_id[kind]} "
+              f"(value {value:.4f}, {solver.nodes} positions searched)")
+
+    print(f"[STATUS] Solved in {time.perf_counter() - start:.1f}s")
@@ -1,28 +1,56 @@
+import numpy as np
 import gymnasium as gym
 from simulation import GaigelSim
+from opponents import ModelPolicy, make_opponents
+
+
+def make_observation_space(num_of_players: int):
+    """
+    Creates the observation space of one gaigel environment
+    :param num_of_players: Number of players in the simulation
+    :return: Dict space with trump, hand and stack observations
+    """
+    trump_obs_space = gym.spaces.Discrete(4)
+    hand_obs_space = gym.spaces.MultiDiscrete([25]*5)
+    stack_obs_space = gym.spaces.MultiDiscrete([25]*(num_of_players-1))
+
+    return gym.spaces.Dict({
+        "trump": trump_obs_space,
+        "hand": hand_obs_space,
+        "stack": stack_obs_space
+    })
 
 
 class GaigelEnv(gym.Env):
-    def __init__(self, num_of_players: int):
+    def __init__(self, num_of_players: int, opponents=None, copy_observations: bool = True):
+        """
+        :param num_of_players: Number of players in the simulation
+        :param opponents: Optional opponent models (see opponents.py), a single model for all opponents or one per
+        opponent seat. Opponents without model play random moves
+        :param copy_observations: Return copies of the hand and stack observations. If False, reset and step return
+        zero-copy views of the simulation buffers, which every later step overwrites. Only disable this if the caller
+        copies or consumes the observations before the next step, e.g. not with rollout buffers that keep references
+        like the terminal_observation of DummyVecEnv
+        """
         super().__init__()
 
         # Action Space
         self.action_space = gym.spaces.Discrete(5)
 
         # Observation space
-        trump_obs_space = gym.spaces.Discrete(4)
-        hand_obs_space = gym.spaces.MultiDiscrete([25]*5)
-        stack_obs_space = gym.spaces.MultiDiscrete([25]*(num_of_players-1))
-
-        self.observation_space = gym.spaces.Dict({
-            "trump": trump_obs_space,
-            "hand": hand_obs_space,
-            "stack": stack_obs_space
-        })
+        self.observation_space = make_observation_space(num_of_players)
 
         # Simulation
         self.sim = GaigelSim(players=num_of_players)
         self.player = self.sim.players.queue[0]  # Select first player for agent
+        for player, model in zip(self.sim.player_list[1:], make_opponents(opponents, num_of_players)):
+            if model is not None:
+                player.policy = ModelPolicy(model, num_of_players)
+
+        # Zero-copy views of the observation buffers of the simulation. Always show the current game state
+        self.hand_obs = np.frombuffer(self.player.hand_state, dtype=np.int64)
+        self.stack_obs = np.frombuffer(self.sim.stack_state, dtype=np.int64)
+        self.copy_observations = copy_observations
 
         self.render_mode = None
         self.num_of_players = num_of_players
@@ -31,11 +59,20 @@ class GaigelEnv(gym.Env):
         self.episode_reward = 0
 
     def _get_obs(self):
-        sim_state = self.sim.get_state(self.player)
-        return {"trump": sim_state["trump_state"], "hand": sim_state["hand_state"], "stack": sim_state["stack_state"]}
+        if self.copy_observations:
+            return {"trump": self.sim.trump_state, "hand": self.hand_obs.copy(), "stack": self.stack_obs.copy()}
+        return {"trump": self.sim.trump_state, "hand": self.hand_obs, "stack": self.stack_obs}
 
     def _get_info(self):
-        return {"points": self.player.points}
+        return {"points": self.player.points, "action_mask": self.action_masks()}
+
+    def action_masks(self):
+        """
+        Legal actions of the agents player. Used by maskable agents, e.g. MaskablePPO from sb3-contrib
+        :return: Boolean array with True for every action that plays a valid card
+        """
+        action_mask = self.sim.legal_action_mask(self.player)
+        return np.array([action_mask >> i & 1 for i in range(5)], dtype=bool)
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
@@ -43,13 +80,8 @@ class GaigelEnv(gym.Env):
         self.total_reward.append(self.episode_reward)
         self.episode_reward = 0
 
-        # New Simulation
-        self.sim = GaigelSim(players=self.num_of_players)
-        self.player = self.sim.players.queue[0]  # Select first player for agent
-        # Initial actions
-        self.sim.shuffle_stack()
-        self.sim.select_starting_player()
-        self.sim.hand_out_cards()
+        # Reuse the simulation for a new game. Reshuffles and hands out the cards again
+        self.sim.reset(seed=seed)
 
         observation = self._get_obs()
         info = self._get_info()
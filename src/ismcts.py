@@ -0,0 +1,224 @@
+"""
+Information set Monte Carlo tree search (single observer ISMCTS) for GaigelSim players. Every iteration samples the
+hidden cards (opponent hands and card stack) consistent with what the player has seen, restores the sample into a
+GaigelCore and runs one tree descent followed by a random playout. Moves in the tree are card kinds, so statistics
+are shared between samples with different hands. Root parallel search runs independent trees on a process pool and
+adds up their root visit counts.
+"""
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from core import GaigelCore, HAND_SIZE
+from determinization import DealSampler, observe
+from endgame import EndgameSolver, average_move_values
+from simulation import spawn_seeds
+
+
+class Node:
+    """
+    Node of the search tree. Reached by the card kind played by seat
+    """
+    __slots__ = ("kind", "seat", "parent", "children", "visits", "availability", "reward_sum")
+
+    def __init__(self, kind: int = 0, seat: int = -1, parent=None):
+        self.kind = kind
+        self.seat = seat
+        self.parent = parent
+        self.children = {}
+        self.visits = 0
+        self.availability = 0  # Number of descents in which this move was legal
+        self.reward_sum = 0.0
+
+    def ucb_score(self, exploration: float):
+        return self.reward_sum / self.visits + exploration * math.sqrt(math.log(self.availability) / self.visits)
+
+
+def play_kind(core: GaigelCore, seat: int, kind: int):
+    """
+    Plays the first card of a kind from the hand of a seat
+    :param core: GaigelCore instance
+    :param seat: Seat index of the player
+    :param kind: Card kind
+    """
+    core.set_next_action(seat, core.hands.index(kind, seat * HAND_SIZE, (seat + 1) * HAND_SIZE) + 1 - seat * HAND_SIZE)
+    core.step()
+
+
+def search(info_set, iterations: int = 1000, time_limit: float = None, exploration: float = 0.7, seed=None):
+    """
+    Runs ISMCTS from an information set
+    :param info_set: Information set as returned by observe
+    :param iterations: Maximum number of iterations
+    :param time_limit: Maximum search time in seconds. No limit if None
+    :param exploration: Exploration constant of the UCB score
+    :param seed: Seed of the search
+    :return: Tuple of (dict of card kind to root visit count, number of iterations)
+    """
+    rng = random.Random(seed)
+    snapshot = info_set[0]
+    num_players = len(snapshot.points)
+    core = GaigelCore(num_players, seed=rng.getrandbits(64))
+    sampler = DealSampler(rng)
+    root = Node()
+    deadline = time.perf_counter() + time_limit if time_limit is not None else None
+
+    iteration = 0
+    while iteration < iterations and (deadline is None or time.perf_counter() < deadline):
+        iteration += 1
+        core.restore(sampler.sample(info_set))
+        node = root
+
+        # Selection and expansion
+        while not core.game_over:
+            seat = core.front
+            action_mask = core.legal_action_mask(seat)
+            legal_kinds = set(core.hands[seat * HAND_SIZE + i] for i in range(HAND_SIZE) if action_mask >> i & 1)
+
+            untried = [kind for kind in legal_kinds if kind not in node.children]
+            for kind in legal_kinds:
+                if kind in node.children:
+                    node.children[kind].availability += 1
+
+            if untried:
+                kind = untried[rng.randrange(len(untried))]
+                child = Node(kind, seat, node)
+                child.availability = 1
+                node.children[kind] = child
+                play_kind(core, seat, kind)
+                node = child
+                break
+
+            node = max((node.children[kind] for kind in legal_kinds), key=lambda n: n.ucb_score(exploration))
+            play_kind(core, seat, node.kind)
+
+        # Random playout
+        while not core.game_over:
+            core.step()
+
+        # Backpropagation. Every node is scored from the view of the seat that played its card
+        while node is not None:
+            node.visits += 1
+            if node.seat in core.game_winners:
+                node.reward_sum += 1 / len(core.game_winners)
+            node = node.parent
+
+    return {kind: child.visits for kind, child in root.children.items()}, iteration
+
+
+class ISMCTSPolicy:
+    """
+    Policy that chooses moves with ISMCTS. See policies.py for the policy interface. With more than one worker the
+    iterations are split over independent trees on a process pool (root parallelization). Once the card stack is
+    empty, the policy can switch to exact endgame solves averaged over sampled deals instead of the tree search
+    """
+    name = "ismcts"
+
+    def __init__(self, iterations: int = 1000, time_limit: float = None, workers: int = 1, exploration: float = 0.7,
+                 endgame_samples: int = 0, seed=None):
+        """
+        :param iterations: Iterations per move, split over all workers
+        :param time_limit: Maximum search time per move in seconds. No limit if None
+        :param workers: Number of search processes. 1 searches in the calling process, None uses all CPUs
+        :param exploration: Exploration constant of the UCB score
+        :param endgame_samples: Number of sampled deals solved exactly in the match color phase. 0 to always search
+        :param seed: Seed of the searches
+        """
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.exploration = exploration
+        self.endgame_samples = endgame_samples
+        self.rng = random.Random(seed)
+        self.executor = None
+        self.solver = None  # Created on first use, keeps its transposition table over all moves
+        self.last_iterations = 0  # Number of iterations of the last search, summed over all workers
+
+    def __getstate__(self):
+        # The process pool can not be pickled, e.g. when the policy is sent to tournament workers. The solver is
+        # dropped as well, its transposition table is large
+        state = self.__dict__.copy()
+        state["executor"] = None
+        state["solver"] = None
+        return state
+
+    def __call__(self, sim, player):
+        action_mask = sim.legal_action_mask(player)
+        if action_mask & (action_mask - 1) == 0:
+            return action_mask.bit_length()  # Only one legal move
+
+        info_set = observe(sim, player)
+
+        if self.endgame_samples and info_set[0].match_color:
+            best_kind = self.solve_endgame(info_set)
+        else:
+            best_kind = self.search(info_set)
+
+        for slot in range(1, 6):
+            if action_mask >> (slot - 1) & 1 and player.hand_state[slot - 1] == best_kind:
+                return slot
+
+    def solve_endgame(self, info_set):
+        """
+        Chooses a move by exact endgame solves of sampled deals
+        :param info_set: Information set as returned by observe
+        :return: Card kind to play
+        """
+        if self.solver is None:
+            self.solver = EndgameSolver()
+
+        sampler = DealSampler(random.Random(self.rng.getrandbits(64)))
+        values = average_move_values(self.solver, (sampler.sample(info_set) for _ in range(self.endgame_samples)))
+        return max(sorted(values), key=values.get)
+
+    def search(self, info_set):
+        """
+        Chooses a move by ISMCTS, split over the workers
+        :param info_set: Information set as returned by observe
+        :return: Card kind to play
+        """
+        seeds = spawn_seeds(self.rng.getrandbits(64), self.workers)
+
+        if self.workers <= 1:
+            visits, self.last_iterations = search(info_set, self.iterations, self.time_limit, self.exploration,
+                                                  seeds[0])
+        else:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+            iterations = math.ceil(self.iterations / self.workers)
+            futures = [self.executor.submit(search, info_set, iterations, self.time_limit, self.exploration, seed)
+                       for seed in seeds]
+
+            visits = {}
+            self.last_iterations = 0
+            for future in futures:
+                worker_visits, worker_iterations = future.result()
+                self.last_iterations += worker_iterations
+                for kind, count in worker_visits.items():
+                    visits[kind] = visits.get(kind, 0) + count
+
+        # Play the most visited card
+        return max(sorted(visits), key=visits.get)
+
+    def close(self):
+        """
+        Shuts down the process pool
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+if __name__ == '__main__':
+    from tournament import Tournament
+
+    policy = ISMCTSPolicy(iterations=500, seed=0)
+    tournament = Tournament([policy, "random", "random"], num_games=60, workers=1, chunk_size=60)
+
+    start = time.perf_counter()
+    tournament.run()
+    print(tournament.summary())
+    print(f"[STATUS] Played 60 games in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,541 @@
+"""
+Game engine on typed arrays that is compiled with Numba if it is installed. Every game is one row of an int64 array
+(fields, deck, hands, hand counts, points, round stack and the policy of every seat) and all game functions only work
+on such rows, so Numba can compile them without Python objects. Without Numba the same functions run as plain Python
+on list copies of the rows. Random numbers come from a xorshift generator stored in the row instead of the random
+module, so both paths play exactly the same games for a given seed. The rules are the same as in GaigelCore, but the
+random stream differs, so a seed does not give the same game as in GaigelSim.
+
+Seats can be played by built-in scripted policies (random and greedy, see ENGINE_POLICIES) or by actions passed to
+JitGaigel.step.
+"""
+import random
+
+import numpy as np
+
+from core import HAND_SIZE
+from rules import KIND_SUIT, KIND_VALUE, NUM_KINDS, SUITS, TRICK_RANK
+from simulation import spawn_seeds
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        # Without Numba the functions stay plain Python functions
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+DECK_SIZE = 48
+NUM_SUITS = len(SUITS)
+INITIAL_DECK = tuple(kind for kind in range(1, NUM_KINDS + 1) for _ in range(2))
+
+# Built-in policies by name. Policy ids are stored per seat in the game rows
+POLICY_RANDOM = 0
+POLICY_GREEDY = 1
+ENGINE_POLICIES = {"random": POLICY_RANDOM, "greedy": POLICY_GREEDY}
+
+# Fields at the start of every game row
+NUM_PLAYERS = 0
+RNG = 1  # xorshift32 state, never 0
+DECK_POS = 2
+TRUMP_CARD = 3
+TRUMP = 4
+MATCH_COLOR = 5
+FRONT = 6
+CURRENT_PLAYER = 7
+ROUND_LEN = 8
+CURRENT_ROUND = 9
+CURRENT_TURN = 10
+GAME_OVER = 11
+LAST_ROUND_WINNER = 12
+WINNERS = 13  # Bitmask of the winning seats
+NUM_FIELDS = 14
+
+# Blocks after the fields. Blocks behind the hands depend on the number of players p:
+# hands (5p), hand counts (p), points (p), round stack (p), placed by (p), policies (p)
+DECK = NUM_FIELDS
+HANDS = DECK + DECK_SIZE
+
+# Lookup tables. Compiled functions read them as constant arrays, plain Python is faster with tuples
+if NUMBA_AVAILABLE:
+    INITIAL_DECK_TABLE = np.array(INITIAL_DECK, dtype=np.int64)
+    KIND_SUIT_TABLE = np.array(KIND_SUIT, dtype=np.int64)
+    KIND_VALUE_TABLE = np.array(KIND_VALUE, dtype=np.int64)
+    TRICK_RANK_TABLE = np.array(TRICK_RANK, dtype=np.int64)
+else:
+    INITIAL_DECK_TABLE = INITIAL_DECK
+    KIND_SUIT_TABLE = KIND_SUIT
+    KIND_VALUE_TABLE = KIND_VALUE
+    TRICK_RANK_TABLE = TRICK_RANK
+
+
+def game_size(players: int):
+    """
+    :param players: Number of players
+    :return: Length of a game row
+    """
+    return HANDS + (HAND_SIZE + 5) * players
+
+
+def rng_state(seed: int):
+    """
+    Turns a 64 bit seed into a valid xorshift32 state
+    :param seed: Integer seed
+    :return: Non-zero 32 bit integer
+    """
+    seed &= 0xFFFFFFFFFFFFFFFF
+    return (seed ^ seed >> 32) & 0xFFFFFFFF or 0x9E3779B9
+
+
+@njit(cache=True)
+def rand_below(g, n):
+    """
+    Advances the xorshift32 generator of a game
+    :param g: Game row
+    :param n: Upper bound
+    :return: Random integer from 0 to n - 1
+    """
+    x = g[RNG]
+    x ^= (x << 13) & 0xFFFFFFFF
+    x ^= x >> 17
+    x ^= (x << 5) & 0xFFFFFFFF
+    g[RNG] = x
+    return (x * n) >> 32
+
+
+@njit(cache=True)
+def shuffle_stack(g):
+    # Fisher-Yates shuffle of the deck block
+    for i in range(DECK_SIZE - 1, 0, -1):
+        j = rand_below(g, i + 1)
+        card = g[DECK + i]
+        g[DECK + i] = g[DECK + j]
+        g[DECK + j] = card
+
+
+@njit(cache=True)
+def rotate(g):
+    """
+    Takes the front seat of the player queue as current player and moves the queue forward by one
+    :return: Seat index of the current player
+    """
+    seat = g[FRONT]
+    g[CURRENT_PLAYER] = seat
+    g[FRONT] = seat + 1 if seat + 1 < g[NUM_PLAYERS] else 0
+    return seat
+
+
+@njit(cache=True)
+def draw_card(g, seat):
+    """
+    Gives the specified player the next card of the stack. The card goes into the first empty hand slot
+    """
+    slot = HANDS + seat * HAND_SIZE
+    while g[slot]:
+        slot += 1
+
+    g[slot] = g[DECK + g[DECK_POS]]
+    g[DECK_POS] += 1
+    g[HANDS + HAND_SIZE * g[NUM_PLAYERS] + seat] += 1
+
+
+@njit(cache=True)
+def reset_game(g, state):
+    """
+    Resets a game row in place, shuffles the deck, selects the starting player and hands out the cards. The number of
+    players and the policies are kept
+    :param g: Game row
+    :param state: xorshift32 state of the game, see rng_state
+    """
+    players = g[NUM_PLAYERS]
+    policies = HANDS + 9 * players
+    for i in range(1, policies):
+        g[i] = 0
+    for i in range(DECK_SIZE):
+        g[DECK + i] = INITIAL_DECK_TABLE[i]
+
+    g[RNG] = state
+    g[TRUMP] = -1
+    g[CURRENT_PLAYER] = -1
+    g[LAST_ROUND_WINNER] = -1
+    shuffle_stack(g)
+
+    # Select starting player
+    g[FRONT] = rand_below(g, players)
+    g[CURRENT_PLAYER] = g[FRONT]
+
+    # Hand out 3 cards per player, take the trump card under the stack and hand out 2 more cards per player
+    for _ in range(3 * players):
+        draw_card(g, rotate(g))
+    g[TRUMP_CARD] = g[DECK + g[DECK_POS]]
+    g[TRUMP] = KIND_SUIT_TABLE[g[TRUMP_CARD]]
+    g[DECK_POS] += 1
+    for _ in range(2 * players):
+        draw_card(g, rotate(g))
+
+
+@njit(cache=True)
+def legal_action_mask(g, seat):
+    """
+    Computes which cards the player is allowed to play, including the match color rule
+    :return: Integer bitmask. Bit i is set if the card in position i + 1 can be played
+    """
+    hand = HANDS + seat * HAND_SIZE
+    type_to_be_matched = -2
+    if g[MATCH_COLOR] and g[ROUND_LEN]:
+        type_to_be_matched = KIND_SUIT_TABLE[g[HANDS + (HAND_SIZE + 2) * g[NUM_PLAYERS]]]
+
+    mask = 0
+    matching_mask = 0
+    for i in range(HAND_SIZE):
+        kind = g[hand + i]
+        if kind:
+            mask |= 1 << i
+            if KIND_SUIT_TABLE[kind] == type_to_be_matched:
+                matching_mask |= 1 << i
+
+    return matching_mask if matching_mask else mask
+
+
+@njit(cache=True)
+def validate_move(action_mask, move_id):
+    return 1 <= move_id <= HAND_SIZE and action_mask >> (move_id - 1) & 1 == 1
+
+
+@njit(cache=True)
+def card_strength(g, kind):
+    # Strength of a card if it is played in the current round. Opening cards count as cards of the round start type
+    round_stack = HANDS + (HAND_SIZE + 2) * g[NUM_PLAYERS]
+    lead = KIND_SUIT_TABLE[g[round_stack]] if g[ROUND_LEN] else KIND_SUIT_TABLE[kind]
+    return TRICK_RANK_TABLE[(g[TRUMP] * NUM_SUITS + lead) * (NUM_KINDS + 1) + kind]
+
+
+@njit(cache=True)
+def choose_action(g, seat, action_mask):
+    """
+    Asks the policy of a seat for a move. Same choices as RandomPolicy and GreedyPolicy of policies.py
+    :return: Move id (1-5)
+    """
+    hand = HANDS + seat * HAND_SIZE
+    policy = g[HANDS + 9 * g[NUM_PLAYERS] + seat]
+
+    if policy == POLICY_GREEDY:
+        # Weakest card that beats the round stack, else the weakest card
+        best_on_stack = -1
+        round_stack = HANDS + (HAND_SIZE + 2) * g[NUM_PLAYERS]
+        for i in range(g[ROUND_LEN]):
+            best_on_stack = max(best_on_stack, card_strength(g, g[round_stack + i]))
+
+        winning_move = 0
+        winning_strength = 0
+        weakest_move = 0
+        weakest_strength = 0
+        for slot in range(HAND_SIZE):
+            if action_mask >> slot & 1:
+                strength = card_strength(g, g[hand + slot])
+                if g[ROUND_LEN] and strength > best_on_stack and (not winning_move or strength < winning_strength):
+                    winning_move = slot + 1
+                    winning_strength = strength
+                if not weakest_move or strength < weakest_strength:
+                    weakest_move = slot + 1
+                    weakest_strength = strength
+        return winning_move if winning_move else weakest_move
+
+    # Random legal card
+    count = 0
+    for slot in range(HAND_SIZE):
+        count += action_mask >> slot & 1
+    choice = rand_below(g, count)
+    slot = 0
+    while True:
+        if action_mask >> slot & 1:
+            if choice == 0:
+                return slot + 1
+            choice -= 1
+        slot += 1
+
+
+@njit(cache=True)
+def next_player_turn(g, move_id):
+    """
+    Performs one turn for the next player in the queue
+    :param g: Game row
+    :param move_id: Move id (1-5) of the player. Invalid moves, e.g. 0, are replaced by the move of the seat policy
+    """
+    players = g[NUM_PLAYERS]
+    seat = rotate(g)
+    g[CURRENT_TURN] += 1
+
+    action_mask = legal_action_mask(g, seat)
+    if not validate_move(action_mask, move_id):
+        move_id = choose_action(g, seat, action_mask)
+
+    # Add selected card to current round stack and remove it from the players hand
+    slot = HANDS + seat * HAND_SIZE + move_id - 1
+    round_stack = HANDS + (HAND_SIZE + 2) * players
+    g[round_stack + g[ROUND_LEN]] = g[slot]
+    g[round_stack + players + g[ROUND_LEN]] = seat
+    g[ROUND_LEN] += 1
+    g[slot] = 0
+    g[HANDS + HAND_SIZE * players + seat] -= 1
+
+
+@njit(cache=True)
+def determine_round_winner(g):
+    """
+    Selects the round winner with the rank table and adds the points of the played cards. Of multiple cards with the
+    same strength the first one wins
+    :return: Seat index of winner
+    """
+    players = g[NUM_PLAYERS]
+    round_stack = HANDS + (HAND_SIZE + 2) * players
+    base = (g[TRUMP] * NUM_SUITS + KIND_SUIT_TABLE[g[round_stack]]) * (NUM_KINDS + 1)
+
+    best_index = 0
+    best_rank = TRICK_RANK_TABLE[base + g[round_stack]]
+    played_cards_points = KIND_VALUE_TABLE[g[round_stack]]
+    for i in range(1, g[ROUND_LEN]):
+        rank = TRICK_RANK_TABLE[base + g[round_stack + i]]
+        played_cards_points += KIND_VALUE_TABLE[g[round_stack + i]]
+        if rank > best_rank:
+            best_rank = rank
+            best_index = i
+
+    winner = g[round_stack + players + best_index]
+    g[HANDS + (HAND_SIZE + 1) * players + winner] += played_cards_points
+    g[LAST_ROUND_WINNER] = winner
+    return winner
+
+
+@njit(cache=True)
+def post_round_actions(g):
+    """
+    Resolves the round, checks the game over conditions and lets every player draw a card starting at the winner
+    """
+    players = g[NUM_PLAYERS]
+    g[FRONT] = determine_round_winner(g)
+
+    # Game over if a player has no cards or at least 101 points. Multiple winners are possible
+    counts = HANDS + HAND_SIZE * players
+    points = counts + players
+    for seat in range(players):
+        if g[counts + seat] == 0 or g[points + seat] >= 101:
+            g[GAME_OVER] = 1
+    if g[GAME_OVER]:
+        max_points = 0
+        for seat in range(players):
+            max_points = max(max_points, g[points + seat])
+        for seat in range(players):
+            if g[points + seat] == max_points:
+                g[WINNERS] |= 1 << seat
+        return
+
+    # Every player draws a card starting at the winner. Players rotate without drawing once the stack is used up
+    for _ in range(players):
+        if g[DECK_POS] < DECK_SIZE and not g[MATCH_COLOR]:
+            draw_card(g, rotate(g))
+        else:
+            rotate(g)
+
+    # Switch to match color, if stack is empty
+    if g[DECK_POS] == DECK_SIZE:
+        g[MATCH_COLOR] = 1
+
+
+@njit(cache=True)
+def step(g, move_id):
+    """
+    Performs one turn of a game and resolves the round after the last turn. Games that are over are not changed
+    :param g: Game row
+    :param move_id: Move id (1-5) of the player with the turn, 0 to use the seat policy
+    """
+    if g[GAME_OVER]:
+        return
+
+    next_player_turn(g, move_id)
+    if g[CURRENT_TURN] == g[NUM_PLAYERS]:
+        post_round_actions(g)
+        if not g[GAME_OVER]:
+            g[CURRENT_ROUND] += 1
+            g[CURRENT_TURN] = 0
+            g[ROUND_LEN] = 0
+
+
+@njit(cache=True)
+def play_game(g):
+    while not g[GAME_OVER]:
+        step(g, 0)
+
+
+# Batch functions over all rows of a game array. Compiled versions run the games on all cores, the fallback works on
+# list copies of the rows because indexing NumPy arrays element by element is slow in plain Python
+if NUMBA_AVAILABLE:
+    @njit(cache=True, parallel=True)
+    def reset_games(games, states):
+        for i in prange(games.shape[0]):
+            reset_game(games[i], states[i])
+
+    @njit(cache=True, parallel=True)
+    def step_games(games, move_ids):
+        for i in prange(games.shape[0]):
+            step(games[i], move_ids[i])
+
+    @njit(cache=True, parallel=True)
+    def play_games(games):
+        for i in prange(games.shape[0]):
+            play_game(games[i])
+
+    @njit(cache=True, parallel=True)
+    def action_masks(games, seats, masks):
+        for i in prange(games.shape[0]):
+            masks[i] = legal_action_mask(games[i], seats[i])
+
+else:
+    def reset_games(games, states):
+        for i in range(len(games)):
+            g = games[i].tolist()
+            reset_game(g, int(states[i]))
+            games[i] = g
+
+    def step_games(games, move_ids):
+        for i in range(len(games)):
+            g = games[i].tolist()
+            step(g, int(move_ids[i]))
+            games[i] = g
+
+    def play_games(games):
+        for i in range(len(games)):
+            g = games[i].tolist()
+            play_game(g)
+            games[i] = g
+
+    def action_masks(games, seats, masks):
+        for i in range(len(games)):
+            masks[i] = legal_action_mask(games[i].tolist(), int(seats[i]))
+
+
+class JitGaigel:
+    """
+    Plays many independent games stored as rows of one int64 array. run plays all games to the end with the seat
+    policies, step plays one turn in every running game and can take the moves of the players with the turn
+    """
+
+    def __init__(self, num_games: int, players: int, policies=None, seed=None):
+        """
+        :param num_games: Number of games
+        :param players: Number of players per game
+        :param policies: Policy names from ENGINE_POLICIES, one per seat. Random players if None
+        :param seed: Seed of the games. Random if None
+        """
+        policies = policies if policies is not None else ["random"] * players
+        if len(policies) != players:
+            raise ValueError(f"Expected {players} policies, got {len(policies)}")
+        for policy in policies:
+            if policy not in ENGINE_POLICIES:
+                raise ValueError(f"Unknown engine policy {policy}. Available policies: {', '.join(ENGINE_POLICIES)}")
+
+        self.num_games = num_games
+        self.num_players = players
+        self.policies = list(policies)
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.num_resets = 0
+
+        self.games = np.zeros((num_games, game_size(players)), dtype=np.int64)
+        self.games[:, NUM_PLAYERS] = players
+        self.games[:, HANDS + 9 * players:] = [ENGINE_POLICIES[policy] for policy in policies]
+        self.masks = np.zeros(num_games, dtype=np.int64)
+
+    def block(self, index: int, width: int = 1):
+        # View of a block after the hands, in seat order
+        start = HANDS + (HAND_SIZE + index) * self.num_players
+        return self.games[:, start:start + width * self.num_players]
+
+    @property
+    def hands(self):
+        return self.games[:, HANDS:HANDS + HAND_SIZE * self.num_players].reshape(self.num_games, self.num_players,
+                                                                                HAND_SIZE)
+
+    @property
+    def points(self):
+        return self.block(1)
+
+    @property
+    def game_over(self):
+        return self.games[:, GAME_OVER].astype(bool)
+
+    @property
+    def winners(self):
+        """
+        :return: Boolean array of shape (num_games, players), True for every winning seat of finished games
+        """
+        return (self.games[:, WINNERS, None] >> np.arange(self.num_players) & 1).astype(bool)
+
+    def reset(self, seed=None):
+        """
+        Deals new games. Every game gets its own seed derived from the seed of the engine, consecutive resets continue
+        the seed sequence
+        :param seed: Optional new seed. If not set, the current seed sequence continues
+        """
+        if seed is not None:
+            self.seed = seed
+            self.num_resets = 0
+
+        seeds = spawn_seeds(self.seed, self.num_games, start=self.num_resets * self.num_games)
+        reset_games(self.games, np.array([rng_state(game_seed) for game_seed in seeds], dtype=np.int64))
+        self.num_resets += 1
+
+    def legal_moves(self):
+        """
+        Gets the valid moves of the players with the next turn
+        :return: Boolean array of shape (num_games, 5)
+        """
+        action_masks(self.games, self.games[:, FRONT].copy(), self.masks)
+        return (self.masks[:, None] >> np.arange(HAND_SIZE) & 1).astype(bool)
+
+    def get_state(self):
+        """
+        Get state arrays of the players with the next turn, same layout as GaigelSim.get_state
+        :return: dict with trump (num_games,), hand (num_games, 5) and stack (num_games, players - 1) arrays
+        """
+        stack_state = self.block(2)[:, :self.num_players - 1].copy()
+        stack_state[np.arange(self.num_players - 1) >= self.games[:, ROUND_LEN, None]] = 0
+        return {"trump_state": self.games[:, TRUMP].copy(),
+                "hand_state": self.hands[np.arange(self.num_games), self.games[:, FRONT]],
+                "stack_state": stack_state}
+
+    def step(self, actions=None):
+        """
+        Plays one turn in every running game
+        :param actions: Optional move ids (1-5) per game. Missing (0) or invalid moves are chosen by the seat policy
+        """
+        if actions is None:
+            actions = np.zeros(self.num_games, dtype=np.int64)
+        step_games(self.games, np.asarray(actions, dtype=np.int64))
+
+    def run(self):
+        """
+        Deals and plays all games until game over
+        :return: Points array of shape (num_games, players)
+        """
+        self.reset()
+        play_games(self.games)
+        return self.points
+
+
+if __name__ == '__main__':
+    import time
+
+    engine = JitGaigel(100000, 3, seed=0)
+    engine.run()  # Compiles the functions if Numba is installed
+
+    start = time.perf_counter()
+    points = engine.run()
+    duration = time.perf_counter() - start
+    print(f"[BENCHMARK] {'Numba' if NUMBA_AVAILABLE else 'Python'} engine played {engine.num_games} games in "
+          f"{duration:.2f}s ({engine.num_games / duration:.0f} games/s)")
+    print(f"[STATUS] Average points per seat {points.mean(axis=0)}, win rate per seat {engine.winners.mean(axis=0)}")
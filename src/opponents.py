@@ -0,0 +1,121 @@
+"""
+Opponent models for the gaigel environments. An opponent model decides the moves of one seat for a whole batch of
+games at once: predict gets the observations of all games in which the seat has to move (same layout as the
+observations of the agent) and their action masks, and returns one action (0-4) per game. GaigelVectorEnv calls every
+model once per seat and forwarding step, GaigelEnv wraps the models with ModelPolicy.
+"""
+import numpy as np
+
+
+class RandomOpponent:
+    """
+    Plays a random legal card
+    """
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def predict(self, observations, action_masks):
+        # Random scores, only legal actions can win
+        scores = self.rng.random(action_masks.shape)
+        scores[~action_masks] = -1.0
+        return scores.argmax(axis=1)
+
+
+class SB3Opponent:
+    """
+    Plays with a saved stable-baselines3 model, e.g. a PPO checkpoint trained with agent.py. The model is loaded on the
+    first prediction, so the opponent can be sent to worker processes before torch is imported. Illegal actions are
+    masked out of the action distribution of the policy.
+    """
+
+    def __init__(self, path: str, algorithm=None, deterministic: bool = True, device: str = "cpu", seed=None):
+        """
+        :param path: Path of the saved model
+        :param algorithm: stable-baselines3 algorithm class of the model. PPO if None
+        :param deterministic: Play the most likely legal action instead of sampling one
+        :param device: Torch device of the forward pass
+        :param seed: Seed for sampled actions
+        """
+        self.path = path
+        self.algorithm = algorithm
+        self.deterministic = deterministic
+        self.device = device
+        self.rng = np.random.default_rng(seed)
+        self.model = None
+
+    def __getstate__(self):
+        # Loaded models are not sent to worker processes, every process loads its own copy
+        state = self.__dict__.copy()
+        state["model"] = None
+        return state
+
+    def load(self):
+        algorithm = self.algorithm
+        if algorithm is None:
+            from stable_baselines3 import PPO
+            algorithm = PPO
+
+        self.model = algorithm.load(self.path, device=self.device)
+        self.model.policy.set_training_mode(False)
+
+    def predict(self, observations, action_masks):
+        import torch
+
+        if self.model is None:
+            self.load()
+
+        # One forward pass for the whole batch
+        with torch.no_grad():
+            observation_tensor, _ = self.model.policy.obs_to_tensor(observations)
+            distribution = self.model.policy.get_distribution(observation_tensor)
+            probabilities = distribution.distribution.probs.cpu().numpy()
+
+        probabilities[~action_masks] = 0.0
+        if self.deterministic:
+            return probabilities.argmax(axis=1)
+
+        # Sample from the distribution of the legal actions. Rows without probability mass play a random legal card
+        probabilities += action_masks * 1e-12
+        cumulative = probabilities.cumsum(axis=1)
+        samples = self.rng.random(len(cumulative)) * cumulative[:, -1]
+        return (cumulative < samples[:, None]).sum(axis=1)
+
+
+class ModelPolicy:
+    """
+    Wraps an opponent model as GaigelSim player policy (see policies.py). Every move is a batch of one game
+    """
+
+    def __init__(self, model, num_of_players: int):
+        self.model = model
+        self.observations = {"trump": np.zeros(1, dtype=np.int64),
+                             "hand": np.zeros((1, 5), dtype=np.int64),
+                             "stack": np.zeros((1, num_of_players - 1), dtype=np.int64)}
+        self.action_masks = np.zeros((1, 5), dtype=bool)
+
+    def __call__(self, sim, player):
+        self.observations["trump"][0] = sim.trump_state
+        self.observations["hand"][0] = player.hand_state
+        self.observations["stack"][0] = sim.stack_state
+        for i in range(5):
+            self.action_masks[0, i] = sim.action_mask >> i & 1
+
+        return int(self.model.predict(self.observations, self.action_masks)[0]) + 1
+
+
+def make_opponents(opponents, num_of_players: int):
+    """
+    Creates the list of opponent models for all seats except the agents seat 0
+    :param opponents: None, a single model for all opponents or a list with one model (or None) per opponent seat
+    :param num_of_players: Number of players per game
+    :return: List of num_of_players - 1 models or Nones. None plays random moves of the simulation
+    """
+    if opponents is None or hasattr(opponents, "predict"):
+        return [opponents] * (num_of_players - 1)
+
+    opponents = list(opponents)
+    if len(opponents) != num_of_players - 1:
+        raise ValueError(f"Expected {num_of_players - 1} opponents, got {len(opponents)}")
+
+    return opponents
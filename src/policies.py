@@ -0,0 +1,91 @@
+"""
+Built-in policies for GaigelSim players. A policy is any callable policy(sim, player) that returns a move id.
+Policies are assigned to a player with player.policy and are asked for a move whenever no next action is set.
+"""
+from ismcts import ISMCTSPolicy
+
+
+def legal_moves(sim, player):
+    """
+    Gets all valid moves of a player in the current state of the simulation
+    :param sim: GaigelSim instance
+    :param player: Player class instance
+    :return: List of valid move ids
+    """
+    action_mask = sim.legal_action_mask(player)
+    return [slot for slot in range(1, 6) if action_mask >> (slot - 1) & 1]
+
+
+def card_strength(sim, card):
+    """
+    Strength of a card if it is played in the current round, as used by GaigelSim.determine_round_winner
+    :param sim: GaigelSim instance
+    :param card: Card class instance
+    :return: Integer card strength
+    """
+    start_type = sim.card_round_stack[0].type if sim.card_round_stack else card.type
+
+    if card.type == sim.trump:
+        return card.value + 1000
+    elif card.type == start_type:
+        return card.value + 100
+    return card.value
+
+
+class RandomPolicy:
+    """
+    Plays a random valid card
+    """
+    name = "random"
+
+    def __call__(self, sim, player):
+        return sim.rng.choice(legal_moves(sim, player))
+
+
+class GreedyPolicy:
+    """
+    Wins the round with the weakest card that beats the round stack. Plays the lowest card if the round can not be
+    won or if the player opens the round
+    """
+    name = "greedy"
+
+    def __call__(self, sim, player):
+        moves = legal_moves(sim, player)
+
+        if sim.card_round_stack:
+            best_on_stack = max(card_strength(sim, card) for card in sim.card_round_stack)
+            winning_moves = [move for move in moves if card_strength(sim, player.cards_hand[move]) > best_on_stack]
+            if winning_moves:
+                return min(winning_moves, key=lambda move: card_strength(sim, player.cards_hand[move]))
+
+        return min(moves, key=lambda move: card_strength(sim, player.cards_hand[move]))
+
+
+POLICIES = {"random": RandomPolicy, "greedy": GreedyPolicy, "ismcts": ISMCTSPolicy}
+
+
+def make_policy(spec):
+    """
+    Creates a policy from its name. Callables are returned unchanged
+    :param spec: Policy name from POLICIES or a callable policy
+    :return: Callable policy
+    """
+    if callable(spec):
+        return spec
+
+    if spec not in POLICIES:
+        raise ValueError(f"Unknown policy {spec}. Available policies: {', '.join(POLICIES)}")
+
+    return POLICIES[spec]()
+
+
+def policy_name(policy):
+    """
+    Gets a readable name of a policy
+    :param policy: Policy name or callable policy
+    :return: String name
+    """
+    if isinstance(policy, str):
+        return policy
+
+    return getattr(policy, "name", type(policy).__name__)
@@ -0,0 +1,209 @@
+"""
+Instrumentation of GaigelSim and GaigelEnv. A Profiler replaces methods of single objects with timed wrappers and
+restores the original methods when it is detached, so objects that are not profiled run without any overhead. Clones
+of a profiled simulation (GaigelSim.clone) are not profiled. Every wrapped method gets a call counter, total and self
+time and a log2 histogram of its call durations. Self times are also collected per call stack and can be written in
+the collapsed stack format of flamegraph.pl and speedscope.
+"""
+import json
+import time
+
+# Methods instrumented by default
+SIM_METHODS = ("step", "next_player_turn", "get_state", "legal_action_mask", "validate_move", "determine_round_winner",
+               "post_round_actions", "new_round_actions")
+ENV_METHODS = ("reset", "step")
+
+# Counters of special results. validate_move returns False for every move that has to be chosen again
+RESULT_COUNTERS = {"validate_move": ("rejected", lambda result: not result)}
+
+
+class MethodStats:
+    __slots__ = ("calls", "total_ns", "self_ns", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ns = 0
+        self.self_ns = 0
+        self.histogram = [0] * 64  # Bucket i counts calls of less than 2^i ns
+
+    def percentile(self, percentile: float):
+        """
+        Upper bound of the histogram bucket that contains the percentile
+        :return: Duration in ns
+        """
+        threshold = percentile / 100 * self.calls
+        count = 0
+        for bucket, bucket_count in enumerate(self.histogram):
+            count += bucket_count
+            if count >= threshold and count > 0:
+                return 1 << bucket
+        return 0
+
+    def to_dict(self):
+        return {"calls": self.calls, "total_ns": self.total_ns, "self_ns": self.self_ns,
+                "histogram": {1 << bucket: count for bucket, count in enumerate(self.histogram) if count}}
+
+
+class Profiler:
+    """
+    Collects counters, timers and call stacks of instrumented objects
+    """
+
+    def __init__(self):
+        self.stats = {}  # Label to MethodStats
+        self.counters = {}
+        self.collapsed = {}  # Call stack to self time in ns
+        self.patched = []  # (object, method name) of all wrapped methods
+        self.stack = [""]  # Call stack paths of the running wrapped methods
+        self.child_ns = [0]  # Time spent in wrapped children of the running wrapped methods
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.detach()
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def instrument(self, obj, methods, prefix: str = None):
+        """
+        Wraps methods of one object. Other objects of the same class are not affected
+        :param obj: Object to instrument
+        :param methods: Names of the methods to wrap
+        :param prefix: Label prefix of the methods. The class name if None
+        :return: The object
+        """
+        prefix = prefix if prefix is not None else type(obj).__name__
+        for name in methods:
+            if name in obj.__dict__:
+                raise ValueError(f"{prefix}.{name} is already instrumented")
+            setattr(obj, name, self.wrap(f"{prefix}.{name}", getattr(obj, name), RESULT_COUNTERS.get(name)))
+            self.patched.append((obj, name))
+        return obj
+
+    def attach_sim(self, sim, methods=SIM_METHODS):
+        return self.instrument(sim, methods)
+
+    def attach_env(self, env, methods=ENV_METHODS, sim_methods=SIM_METHODS):
+        """
+        Instruments a GaigelEnv and its simulation
+        """
+        self.instrument(env, methods)
+        self.attach_sim(env.sim, sim_methods)
+        return env
+
+    def detach(self):
+        """
+        Restores the original methods of all instrumented objects. The collected data is kept
+        """
+        for obj, name in self.patched:
+            del obj.__dict__[name]
+        self.patched.clear()
+
+    def wrap(self, label: str, method, result_counter=None):
+        stats = self.stats.setdefault(label, MethodStats())
+        stack = self.stack
+        child_ns = self.child_ns
+        collapsed = self.collapsed
+        counters = self.counters
+        perf_counter_ns = time.perf_counter_ns
+        if result_counter is not None:
+            counter_name, counter_condition = f"{label}.{result_counter[0]}", result_counter[1]
+
+        def wrapper(*args, **kwargs):
+            path = label if len(stack) == 1 else stack[-1] + ";" + label
+            stack.append(path)
+            child_ns.append(0)
+            start = perf_counter_ns()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                elapsed = perf_counter_ns() - start
+                stack.pop()
+                self_ns = elapsed - child_ns.pop()
+                child_ns[-1] += elapsed
+
+                stats.calls += 1
+                stats.total_ns += elapsed
+                stats.self_ns += self_ns
+                stats.histogram[min(elapsed.bit_length(), 63)] += 1
+                collapsed[path] = collapsed.get(path, 0) + self_ns
+
+            if result_counter is not None and counter_condition(result):
+                counters[counter_name] = counters.get(counter_name, 0) + 1
+            return result
+
+        return wrapper
+
+    def reset(self):
+        """
+        Clears the collected data
+        """
+        for stats in self.stats.values():
+            stats.__init__()
+        self.counters.clear()
+        self.collapsed.clear()
+
+    def summary(self):
+        """
+        Creates a readable summary sorted by self time
+        :return: Summary string
+        """
+        lines = []
+        for label, stats in sorted(self.stats.items(), key=lambda item: -item[1].self_ns):
+            if not stats.calls:
+                continue
+            lines.append(f"[RESULT] {label:<30} | {stats.calls:>9} calls | total {stats.total_ns / 1e6:9.1f}ms | "
+                         f"self {stats.self_ns / 1e6:9.1f}ms | mean {stats.total_ns / stats.calls / 1e3:7.2f}us | "
+                         f"p50 <{stats.percentile(50) / 1e3:.2f}us | p99 <{stats.percentile(99) / 1e3:.2f}us")
+
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"[RESULT] {name:<30} | {value}")
+
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {"methods": {label: stats.to_dict() for label, stats in self.stats.items()},
+                "counters": dict(self.counters)}
+
+    def write_json(self, path: str):
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def write_collapsed(self, path: str):
+        """
+        Writes the self times per call stack in the collapsed stack format ("a;b;c <ns>" per line). Render with
+        flamegraph.pl or load into speedscope
+        :param path: Output file path
+        """
+        with open(path, "w") as file:
+            for stack, self_ns in sorted(self.collapsed.items()):
+                file.write(f"{stack} {self_ns}\n")
+
+
+if __name__ == '__main__':
+    import tempfile
+    from environment import GaigelEnv
+
+    def play(env, steps: int):
+        _, info = env.reset(seed=0)
+        start = time.perf_counter()
+        for _ in range(steps):
+            _, _, terminated, _, info = env.step(int(info["action_mask"].argmax()))
+            if terminated:
+                _, info = env.reset()
+        return time.perf_counter() - start
+
+    env = GaigelEnv(3)
+    print(f"[BENCHMARK] 20000 steps without profiler: {play(env, 20000):.2f}s")
+
+    with Profiler() as profiler:
+        profiler.attach_env(env)
+        print(f"[BENCHMARK] 20000 steps with profiler: {play(env, 20000):.2f}s")
+    print(f"[BENCHMARK] 20000 steps after detaching: {play(env, 20000):.2f}s")
+
+    print(profiler.summary())
+    path = tempfile.mktemp(suffix=".collapsed")
+    profiler.write_collapsed(path)
+    print(f"[STATUS] Wrote flame graph profile to {path}")
@@ -0,0 +1,300 @@
+"""
+Compact binary game records. Every game is one fixed-width record with the seed, the deal order of the card stack,
+the starting seat, the trump card, every action with the played card, the round winners and the final points. A game
+can be replayed from its record alone. RecordWriter observes GaigelSim games and writes the records in chunks into
+numbered shard files, RecordReader memory maps the shards for random access.
+
+Shard layout: 16 byte header (MAGIC, uint32 format version, uint32 record size) followed by the records.
+"""
+import glob
+import os
+import struct
+
+import numpy as np
+
+from transposition import MAX_SEATS, DECK_SIZE
+
+MAGIC = b"GAIGELRC"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+MAX_ACTIONS = DECK_SIZE  # Every action plays a card
+MAX_ROUNDS = DECK_SIZE // 2  # Rounds of a two player game
+NO_SEAT = 255  # Unused round winner entry
+
+RECORD_DTYPE = np.dtype([
+    ("seed", "<u8"),
+    ("seeded", "u1"),  # 0 if the game was not started from an integer seed
+    ("num_players", "u1"),
+    ("starting_seat", "u1"),
+    ("trump_card", "u1"),  # Card kind
+    ("num_actions", "u1"),
+    ("num_rounds", "u1"),
+    ("winners", "<u2"),  # Bitmask of the winning seats
+    ("deck", "u1", (DECK_SIZE,)),  # Card kinds of the card stack in deal order
+    ("actions", "u1", (MAX_ACTIONS,)),  # Hand slots (1-5)
+    ("cards", "u1", (MAX_ACTIONS,)),  # Card kinds of the actions
+    ("round_winners", "u1", (MAX_ROUNDS,)),  # Seats
+    ("points", "<u2", (MAX_SEATS,)),
+])
+
+
+class RecordWriter:
+    """
+    Streams the records of observed games to shard files. Records are collected in a chunk buffer and written once
+    the buffer is full, a new shard is started every shard_size records. Shards of earlier runs in the directory are
+    kept, numbering continues after them. One writer can observe many simulations.
+    """
+
+    def __init__(self, directory: str, shard_size: int = 1 << 20, chunk_size: int = 4096, prefix: str = "games"):
+        """
+        :param directory: Output directory. Created if it does not exist
+        :param shard_size: Maximum number of records per shard file
+        :param chunk_size: Number of records written at once
+        :param prefix: File name prefix of the shards
+        """
+        self.directory = directory
+        self.shard_size = shard_size
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+
+        self.buffer = np.zeros(chunk_size, dtype=RECORD_DTYPE)
+        self.buffered = 0
+        self.games = {}  # Record in progress of every observed simulation
+
+        # Continue after the highest existing shard, so no shard is overwritten if earlier ones were deleted
+        self.shard_index = max([int(os.path.basename(path)[len(prefix) + 1:-len(".rec")]) + 1
+                                for path in shard_paths(directory, prefix)], default=0)
+        self.file = None
+        self.shard_records = 0
+
+        # Statistics
+        self.records_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def attach(self, sim):
+        """
+        Starts recording the games of a simulation. Games already in progress are not recorded
+        :param sim: GaigelSim class instance
+        """
+        sim.observers.append(self)
+
+    def detach(self, sim):
+        sim.observers.remove(self)
+        self.games.pop(id(sim), None)
+
+    def on_deal(self, sim):
+        record = np.zeros((), dtype=RECORD_DTYPE)
+        if isinstance(sim.seed, int) and 0 <= sim.seed < 1 << 64:
+            record["seed"] = sim.seed
+            record["seeded"] = 1
+        record["num_players"] = len(sim.player_list)
+        record["starting_seat"] = sim.players.queue[0].seat
+        record["deck"] = [card.kind for card in sim.card_stack.queue]
+        record["trump_card"] = record["deck"][3 * len(sim.player_list)]
+
+        self.games[id(sim)] = (record, [], [], [])
+
+    def on_action(self, sim, player, slot: int, card):
+        game = self.games.get(id(sim))
+        if game is not None:
+            game[1].append(slot)
+            game[2].append(card.kind)
+
+    def on_round_end(self, sim, winner):
+        game = self.games.get(id(sim))
+        if game is not None:
+            game[3].append(winner.seat)
+
+    def on_game_over(self, sim):
+        game = self.games.pop(id(sim), None)
+        if game is None:
+            return
+
+        record, actions, cards, round_winners = game
+        record["num_actions"] = len(actions)
+        record["actions"][:len(actions)] = actions
+        record["cards"][:len(cards)] = cards
+        record["num_rounds"] = len(round_winners)
+        record["round_winners"] = NO_SEAT
+        record["round_winners"][:len(round_winners)] = round_winners
+        record["points"][:len(sim.player_list)] = [player.points for player in sim.player_list]
+        record["winners"] = sum(1 << player.seat for player in sim.game_winners)
+        self.write(record)
+
+    def write(self, record):
+        """
+        Adds a record to the chunk buffer
+        :param record: Record of RECORD_DTYPE
+        """
+        self.buffer[self.buffered] = record
+        self.buffered += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        """
+        Writes all buffered records to the shard files
+        """
+        start = 0
+        while start < self.buffered:
+            if self.file is None or self.shard_records == self.shard_size:
+                self.open_shard()
+
+            count = min(self.buffered - start, self.shard_size - self.shard_records)
+            self.buffer[start:start + count].tofile(self.file)
+            self.shard_records += count
+            self.records_written += count
+            start += count
+
+        self.buffered = 0
+        if self.file is not None:
+            self.file.flush()
+
+    def open_shard(self):
+        if self.file is not None:
+            self.file.close()
+
+        path = os.path.join(self.directory, f"{self.prefix}-{self.shard_index:05d}.rec")
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize))
+        self.shard_index += 1
+        self.shard_records = 0
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def shard_paths(directory: str, prefix: str = "games"):
+    return sorted(glob.glob(os.path.join(directory, f"{prefix}-*.rec")))
+
+
+def open_shard(path: str):
+    """
+    Memory maps a shard file. A record that was cut off at the end of the file is ignored
+    :param path: Path of the shard
+    :return: Read only NumPy array of RECORD_DTYPE
+    """
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path} is not a game record shard")
+
+    magic, version, record_size = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path} is not a game record shard of version {VERSION}")
+
+    count = (os.path.getsize(path) - HEADER.size) // record_size
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+
+
+class RecordReader:
+    """
+    Random access to the records of all shards in a directory (or a single shard file)
+    """
+
+    def __init__(self, path: str, prefix: str = "games"):
+        """
+        :param path: Directory with shard files or path of a single shard
+        :param prefix: File name prefix of the shards in a directory
+        """
+        paths = shard_paths(path, prefix) if os.path.isdir(path) else [path]
+        self.shards = [open_shard(shard_path) for shard_path in paths]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, index: int):
+        """
+        :param index: Index of the record over all shards. Negative indices count from the end
+        :return: Record of RECORD_DTYPE
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Record index out of range")
+
+        shard = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        return self.shards[shard][index - self.offsets[shard]]
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard
+
+    def replay(self, index: int, sim=None, num_actions: int = None):
+        return replay(self[index], sim, num_actions)
+
+
+def replay(record, sim=None, num_actions: int = None):
+    """
+    Replays a recorded game
+    :param record: Record of RECORD_DTYPE
+    :param sim: GaigelSim instance with the number of players of the record. A new one is created if None
+    :param num_actions: Number of actions to replay. The whole game if None
+    :return: GaigelSim in the state after the replayed actions
+    """
+    from simulation import GaigelSim
+
+    num_players = int(record["num_players"])
+    if sim is None:
+        sim = GaigelSim(num_players)
+    elif len(sim.player_list) != num_players:
+        raise ValueError(f"Record of a {num_players} player game can not be replayed with {len(sim.player_list)} "
+                         f"players")
+
+    sim.reset(seed=int(record["seed"]) if record["seeded"] else None,
+              stack=[int(kind) for kind in record["deck"]],
+              starting_seat=int(record["starting_seat"]))
+
+    if num_actions is None:
+        num_actions = int(record["num_actions"])
+    for slot in record["actions"][:num_actions]:
+        sim.players.queue[0].set_next_action(int(slot))
+        sim.step()
+
+    return sim
+
+
+if __name__ == '__main__':
+    import shutil
+    import tempfile
+    import time
+    from simulation import GaigelSim, spawn_seeds
+
+    directory = tempfile.mkdtemp()
+    num_games = 10000
+
+    # Record games
+    sim = GaigelSim(3)
+    start = time.perf_counter()
+    with RecordWriter(directory, shard_size=4000) as writer:
+        writer.attach(sim)
+        for seed in spawn_seeds(0, num_games):
+            sim.reset(seed)
+            while not sim.game_over:
+                sim.step()
+    print(f"[BENCHMARK] Recorded {num_games} games in {time.perf_counter() - start:.2f}s "
+          f"({RECORD_DTYPE.itemsize} bytes per game)")
+
+    # Read and replay records
+    reader = RecordReader(directory)
+    start = time.perf_counter()
+    for index in range(0, len(reader), 10):
+        record = reader[index]
+        replayed = reader.replay(index)
+        if [player.points for player in replayed.player_list] != list(record["points"][:3]):
+            raise AssertionError(f"Replay of record {index} differs from the recorded game")
+    print(f"[STATUS] Replayed {len(reader) // 10} of {len(reader)} records from {len(reader.shards)} shards in "
+          f"{time.perf_counter() - start:.2f}s")
+
+    shutil.rmtree(directory)
@@ -0,0 +1,129 @@
+"""
+Card encoding and precomputed rule tables shared by all game engines (GaigelSim, GaigelCore and BatchGaigelSim).
+Card kinds use the same ids as GaigelSim.ids_by_card: 0 is "no card", 1-24 are the card kinds ordered by type
+(k, h, p, z) and then by value (0, 2, 3, 4, 10, 11).
+"""
+from collections import namedtuple
+
+SUITS = ("k", "h", "p", "z")
+VALUES = (0, 2, 3, 4, 10, 11)
+NUM_KINDS = len(SUITS) * len(VALUES)
+
+KIND_SUIT = (-1,) + tuple(suit for suit in range(len(SUITS)) for _ in VALUES)
+KIND_VALUE = (0,) + tuple(value for _ in SUITS for value in VALUES)
+KIND_NAMES = (None,) + tuple(suit + str(value) for suit in SUITS for value in VALUES)
+KIND_IDS = {name: kind for kind, name in enumerate(KIND_NAMES)}  # Card kind by short card string, e.g. "k0"
+MAX_POINTS = 2 * sum(KIND_VALUE)  # Sum of all card values in the deck (240)
+
+# Bitboards of cards. Each of the 48 cards has one bit, the 2 cards of kind k use bits 2 * (k - 1) and 2 * k - 1.
+# So the cards of one suit form a block of 12 bits and suit and count queries are single bit operations
+ALL_CARDS = (1 << 2 * NUM_KINDS) - 1
+KIND_BITS = (0,) + tuple(3 << 2 * (kind - 1) for kind in range(1, NUM_KINDS + 1))
+SUIT_BITS = tuple(((1 << 2 * len(VALUES)) - 1) << 2 * len(VALUES) * suit for suit in range(len(SUITS)))
+
+
+def bitboard_kinds(bits: int):
+    """
+    Gets the card kinds of all cards in a bitboard
+    :param bits: Bitboard of cards
+    :return: Sorted list of card kinds, a kind appears once per card
+    """
+    kinds = []
+    while bits:
+        lowest = bits & -bits
+        kinds.append((lowest.bit_length() + 1) // 2)
+        bits ^= lowest
+    return kinds
+
+
+# Compact, immutable game state used by snapshot/restore of GaigelSim and GaigelCore. Cards are stored as card kinds,
+# players as seat indices (-1 for no player). Hands hold 5 kinds per seat in seat order. rng_state is None if the
+# random state was not included
+GameSnapshot = namedtuple("GameSnapshot", ["stack", "trump_card", "hands", "points", "round_stack", "placed_by",
+                                           "front", "current_player", "last_round_winner", "match_color", "game_over",
+                                           "game_winners", "current_round", "current_turn", "rng_state"])
+
+
+def card_rank(kind: int, trump: int, lead: int):
+    """
+    Strength of a card in a round. Trumps get +1000, cards of the round start type get +100
+    :param kind: Card kind
+    :param trump: Trump suit index
+    :param lead: Suit index of the first card of the round
+    :return: Integer card strength
+    """
+    if KIND_SUIT[kind] == trump:
+        return KIND_VALUE[kind] + 1000
+    elif KIND_SUIT[kind] == lead:
+        return KIND_VALUE[kind] + 100
+    return KIND_VALUE[kind]
+
+
+# Card strength by trump, lead suit and card kind. Index with (trump * 4 + lead) * 25 + kind
+TRICK_RANK = tuple(card_rank(kind, trump, lead) if kind else -1
+                   for trump in range(len(SUITS)) for lead in range(len(SUITS)) for kind in range(NUM_KINDS + 1))
+
+
+def resolve_trick(trump: int, kinds, count: int = None):
+    """
+    Determines the winner and the points of a round with the rank table. Of multiple cards with the same strength
+    the first one wins, like in GaigelSim.determine_round_winner
+    :param trump: Trump suit index
+    :param kinds: Card kinds in the order they were played
+    :param count: Number of cards in the round, if kinds is longer than the round
+    :return: Tuple of (index of the winning card, sum of the card values)
+    """
+    if count is None:
+        count = len(kinds)
+
+    base = (trump * len(SUITS) + KIND_SUIT[kinds[0]]) * (NUM_KINDS + 1)
+    winner_index = 0
+    best_rank = TRICK_RANK[base + kinds[0]]
+    points = KIND_VALUE[kinds[0]]
+
+    for i in range(1, count):
+        rank = TRICK_RANK[base + kinds[i]]
+        points += KIND_VALUE[kinds[i]]
+        if rank > best_rank:
+            best_rank = rank
+            winner_index = i
+
+    return winner_index, points
+
+
+def _reference_trick(trump: int, kinds):
+    # Original list based version of GaigelSim.determine_round_winner, used to verify the tables
+    start_type = KIND_SUIT[kinds[0]]
+    card_round_values = []
+    for kind in kinds:
+        card_value = KIND_VALUE[kind]
+        if KIND_SUIT[kind] == trump:
+            card_value += 1000
+        elif KIND_SUIT[kind] == start_type:
+            card_value += 100
+        card_round_values.append(card_value)
+
+    return card_round_values.index(max(card_round_values)), sum(KIND_VALUE[kind] for kind in kinds)
+
+
+def verify_tables(max_cards: int = 4):
+    """
+    Checks resolve_trick against the original algorithm for every trump and every round of 2 to max_cards cards
+    :param max_cards: Maximum number of cards in a round
+    :return: Number of checked rounds
+    """
+    checked = 0
+    for trump in range(len(SUITS)):
+        tricks = [[kind] for kind in range(1, NUM_KINDS + 1)]
+        for _ in range(2, max_cards + 1):
+            tricks = [trick + [kind] for trick in tricks for kind in range(1, NUM_KINDS + 1)]
+            for trick in tricks:
+                if resolve_trick(trump, trick) != _reference_trick(trump, trick):
+                    raise AssertionError(f"Trick {trick} with trump {SUITS[trump]} resolved differently")
+            checked += len(tricks)
+
+    return checked
+
+
+if __name__ == '__main__':
+    print(f"[STATUS] Verified {verify_tables()} rounds")
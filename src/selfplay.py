@@ -0,0 +1,481 @@
+"""
+Asynchronous actor/learner self-play. Actor processes play batches of games in a GaigelVectorEnv with a frozen copy of
+the policy for the agents seat and policies from the league for the opponent seats. Their trajectories are written
+into shared memory slots that are handed to the learner through queues. The learner trains the policy with a
+clipped policy gradient (PPO objective) on every slot, publishes the new weights in shared memory and adds a snapshot
+to the league every few updates.
+
+The policy is a small NumPy MLP instead of the stable-baselines3 policy of agent.py. Every actor reloads the flat
+weights from shared memory before each rollout, and the learner trains on slots that are up to a few updates stale.
+SB3 PPO collects and trains synchronously in one process, and importing torch in every actor would cost seconds of
+startup and hundreds of MB per process. The two stacks meet at the opponent model interface of opponents.py: saved
+.npz policies and SB3 checkpoints can both play as opponents (GaigelVectorEnv, ModelPolicy, server.py, cli.py), but a
+.npz policy is not an SB3 checkpoint and can not be trained further with agent.py.
+"""
+import multiprocessing as mp
+import os
+import queue
+import time
+
+import numpy as np
+
+from core import HAND_SIZE
+from simulation import spawn_seeds
+from transposition import KIND_COUNT
+from vector_env import GaigelVectorEnv
+
+NUM_ACTIONS = HAND_SIZE
+
+
+class MLPPolicy:
+    """
+    Policy and value network with one hidden layer. All parameters live in one flat array, so they can be copied
+    from and to shared memory in one operation. Implements the opponent model interface of opponents.py
+    """
+
+    def __init__(self, num_of_players: int, hidden_size: int = 64, seed=None, deterministic: bool = False):
+        self.num_of_players = num_of_players
+        self.input_size = 4 + KIND_COUNT * (HAND_SIZE + num_of_players - 1)
+        self.hidden_size = hidden_size
+        self.deterministic = deterministic
+        self.rng = np.random.default_rng(seed)
+
+        shapes = {"w1": (self.input_size, hidden_size), "b1": (hidden_size,),
+                  "w2": (hidden_size, NUM_ACTIONS), "b2": (NUM_ACTIONS,),
+                  "wv": (hidden_size, 1), "bv": (1,)}
+        self.size = sum(int(np.prod(shape)) for shape in shapes.values())
+        self.params = np.zeros(self.size)
+        self.views = self.layer_views(self.params, shapes)
+
+        self.views["w1"][:] = self.rng.normal(0, 1 / np.sqrt(self.input_size), self.views["w1"].shape)
+        self.views["w2"][:] = self.rng.normal(0, 0.01, self.views["w2"].shape)
+        self.views["wv"][:] = self.rng.normal(0, 0.01, self.views["wv"].shape)
+        self.shapes = shapes
+
+    @staticmethod
+    def layer_views(flat, shapes):
+        views = {}
+        offset = 0
+        for name, shape in shapes.items():
+            size = int(np.prod(shape))
+            views[name] = flat[offset:offset + size].reshape(shape)
+            offset += size
+        return views
+
+    def get_flat(self):
+        return self.params
+
+    def set_flat(self, flat):
+        self.params[:] = flat
+
+    def features(self, observations):
+        """
+        One-hot encodes a batch of observations
+        :param observations: dict with trump (N,), hand (N, 5) and stack (N, players - 1) arrays
+        :return: Float array of shape (N, input_size)
+        """
+        trump = observations["trump"]
+        cards = np.concatenate([observations["hand"], observations["stack"]], axis=1)
+        rows = np.arange(len(trump))
+
+        x = np.zeros((len(trump), self.input_size))
+        x[rows, trump] = 1.0
+        x[rows[:, None], 4 + np.arange(cards.shape[1]) * KIND_COUNT + cards] = 1.0
+        return x
+
+    def forward(self, x, action_masks):
+        """
+        :param x: Features of shape (N, input_size)
+        :param action_masks: Boolean array of shape (N, 5)
+        :return: Tuple of (hidden activations, action probabilities, values)
+        """
+        hidden = np.tanh(x @ self.views["w1"] + self.views["b1"])
+        logits = hidden @ self.views["w2"] + self.views["b2"]
+        logits = np.where(action_masks, logits, -np.inf)
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        values = (hidden @ self.views["wv"] + self.views["bv"])[:, 0]
+        return hidden, probabilities, values
+
+    def act(self, observations, action_masks):
+        """
+        Chooses actions for a batch of observations
+        :return: Tuple of (actions, log probabilities of the actions)
+        """
+        _, probabilities, _ = self.forward(self.features(observations), action_masks)
+
+        if self.deterministic:
+            actions = probabilities.argmax(axis=1)
+        else:
+            cumulative = probabilities.cumsum(axis=1)
+            samples = self.rng.random(len(cumulative)) * cumulative[:, -1]
+            actions = np.minimum((cumulative < samples[:, None]).sum(axis=1), NUM_ACTIONS - 1)
+
+        return actions, np.log(probabilities[np.arange(len(actions)), actions])
+
+    def predict(self, observations, action_masks):
+        return self.act(observations, action_masks)[0]
+
+    def values(self, observations, action_masks):
+        return self.forward(self.features(observations), action_masks)[2]
+
+    def gradient(self, x, action_masks, actions, old_log_probabilities, advantages, returns, clip: float = 0.2,
+                 value_coefficient: float = 0.5, entropy_coefficient: float = 0.01):
+        """
+        Computes the loss and gradient of the clipped policy gradient objective
+        :return: Tuple of (loss, flat gradient)
+        """
+        n = len(actions)
+        rows = np.arange(n)
+        hidden, probabilities, values = self.forward(x, action_masks)
+
+        log_probabilities = np.log(probabilities[rows, actions])
+        ratio = np.exp(log_probabilities - old_log_probabilities)
+        clipped_ratio = np.clip(ratio, 1 - clip, 1 + clip)
+        surrogate = np.minimum(ratio * advantages, clipped_ratio * advantages)
+        unclipped = ratio * advantages <= clipped_ratio * advantages  # Gradient only flows through the unclipped term
+
+        log_p = np.log(np.where(probabilities > 0, probabilities, 1.0))
+        entropy = -(probabilities * log_p).sum(axis=1)
+        loss = (-surrogate.mean() + value_coefficient * ((values - returns) ** 2).mean()
+                - entropy_coefficient * entropy.mean())
+
+        # Gradient of the loss with respect to the logits
+        one_hot = np.zeros_like(probabilities)
+        one_hot[rows, actions] = 1.0
+        d_logits = -(advantages * ratio * unclipped)[:, None] * (one_hot - probabilities) / n
+        d_logits += entropy_coefficient * probabilities * (log_p + entropy[:, None]) / n
+        d_values = 2 * value_coefficient * (values - returns) / n
+
+        gradient = np.zeros(self.size)
+        grads = self.layer_views(gradient, self.shapes)
+        grads["w2"][:] = hidden.T @ d_logits
+        grads["b2"][:] = d_logits.sum(axis=0)
+        grads["wv"][:] = hidden.T @ d_values[:, None]
+        grads["bv"][:] = d_values.sum()
+
+        d_hidden = (d_logits @ self.views["w2"].T + d_values[:, None] @ self.views["wv"].T) * (1 - hidden ** 2)
+        grads["w1"][:] = x.T @ d_hidden
+        grads["b1"][:] = d_hidden.sum(axis=0)
+
+        return loss, gradient
+
+    def save(self, path: str):
+        np.savez(path, params=self.params, num_of_players=self.num_of_players, hidden_size=self.hidden_size)
+
+    @classmethod
+    def load(cls, path: str, deterministic: bool = True, seed=None):
+        data = np.load(path)
+        policy = cls(int(data["num_of_players"]), int(data["hidden_size"]), seed=seed, deterministic=deterministic)
+        policy.set_flat(data["params"])
+        return policy
+
+
+class Adam:
+    def __init__(self, size: int, learning_rate: float = 3e-4, beta1: float = 0.9, beta2: float = 0.999,
+                 epsilon: float = 1e-8):
+        self.learning_rate = learning_rate
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.m = np.zeros(size)
+        self.v = np.zeros(size)
+        self.t = 0
+
+    def step(self, params, gradient):
+        self.t += 1
+        self.m = self.beta1 * self.m + (1 - self.beta1) * gradient
+        self.v = self.beta2 * self.v + (1 - self.beta2) * gradient ** 2
+        m_hat = self.m / (1 - self.beta1 ** self.t)
+        v_hat = self.v / (1 - self.beta2 ** self.t)
+        params -= self.learning_rate * m_hat / (np.sqrt(v_hat) + self.epsilon)
+
+
+def create_shared_state(ctx, num_of_players: int, policy_size: int, num_slots: int, rollout_length: int,
+                        envs_per_actor: int, league_size: int):
+    """
+    Allocates the shared memory of a training run: weights, league and trajectory slots
+    :return: dict of shared memory objects
+    """
+    steps = (num_slots, rollout_length + 1, envs_per_actor)  # One extra step holds the observation to bootstrap from
+    fields = {"trump": ("q", steps), "hand": ("q", steps + (HAND_SIZE,)),
+              "stack": ("q", steps + (num_of_players - 1,)), "action_masks": ("b", steps + (NUM_ACTIONS,)),
+              "actions": ("q", steps), "log_probabilities": ("d", steps), "rewards": ("d", steps),
+              "dones": ("b", steps), "slot_version": ("q", (num_slots,)), "slot_games": ("q", (num_slots,))}
+
+    shared = {name: (ctx.RawArray(typecode, int(np.prod(shape))), typecode, shape)
+              for name, (typecode, shape) in fields.items()}
+    shared["weights"] = (ctx.RawArray("d", policy_size), "d", (policy_size,))
+    shared["league"] = (ctx.RawArray("d", league_size * policy_size), "d", (league_size, policy_size))
+    shared["version"] = ctx.Value("q", 0)
+    shared["league_count"] = ctx.Value("q", 0)
+    return shared
+
+
+def shared_views(shared):
+    """
+    Creates NumPy views of the shared memory arrays
+    """
+    dtypes = {"q": np.int64, "b": np.bool_, "d": np.float64}
+    views = {}
+    for name, value in shared.items():
+        if isinstance(value, tuple):
+            array, typecode, shape = value
+            views[name] = np.frombuffer(array, dtype=dtypes[typecode]).reshape(shape)
+    return views
+
+
+def actor(actor_id: int, config, shared, lock, free_slots, full_slots, stop, seed: int):
+    """
+    Actor process. Plays rollouts with the latest published weights for the agent and league policies for the
+    opponents and hands them to the learner
+    """
+    views = shared_views(shared)
+    rng = np.random.default_rng(seed)
+    policy = MLPPolicy(config["num_of_players"], config["hidden_size"], seed=rng.integers(2 ** 32))
+    opponent = MLPPolicy(config["num_of_players"], config["hidden_size"], seed=rng.integers(2 ** 32))
+    env = GaigelVectorEnv(config["envs_per_actor"], config["num_of_players"], opponents=opponent)
+    observations, info = env.reset(seed=seed)
+    action_masks = info["action_mask"]
+    version = -1
+
+    while not stop.is_set():
+        try:
+            slot = free_slots.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+        # Freeze the latest weights for this rollout. Opponents play the latest weights or a past league policy
+        with lock:
+            if shared["version"].value != version:
+                version = shared["version"].value
+                policy.set_flat(views["weights"])
+            league_count = min(shared["league_count"].value, config["league_size"])
+            if league_count and rng.random() >= config["latest_opponent_probability"]:
+                opponent.set_flat(views["league"][rng.integers(league_count)])
+            else:
+                opponent.set_flat(views["weights"])
+
+        games = 0
+        for t in range(config["rollout_length"] + 1):
+            for name in ("trump", "hand", "stack"):
+                views[name][slot, t] = observations[name]
+            views["action_masks"][slot, t] = action_masks
+            if t == config["rollout_length"]:
+                break
+
+            actions, log_probabilities = policy.act(observations, action_masks)
+            observations, rewards, terminated, _, info = env.step(actions)
+            action_masks = info["action_mask"]
+
+            views["actions"][slot, t] = actions
+            views["log_probabilities"][slot, t] = log_probabilities
+            views["rewards"][slot, t] = rewards
+            views["dones"][slot, t] = terminated
+            games += int(terminated.sum())
+
+        views["slot_version"][slot] = version
+        views["slot_games"][slot] = games
+        full_slots.put(slot)
+
+    env.close()
+
+
+class SelfPlayTrainer:
+    """
+    Trains an MLPPolicy by self-play with asynchronous actor processes and one learner in the calling process
+    """
+
+    def __init__(self, num_of_players: int = 3, num_actors: int = None, envs_per_actor: int = 64,
+                 rollout_length: int = 32, num_slots: int = None, hidden_size: int = 64, learning_rate: float = 1e-3,
+                 gamma: float = 0.5, gae_lambda: float = 0.95, epochs: int = 2, minibatches: int = 4,
+                 league_size: int = 16, league_interval: int = 20, latest_opponent_probability: float = 0.5,
+                 seed: int = 0, context=None, verbose: bool = True):
+        """
+        :param num_of_players: Number of players per game
+        :param num_actors: Number of actor processes. One less than the number of CPUs if None
+        :param envs_per_actor: Games per actor, played as one batch
+        :param rollout_length: Steps per trajectory slot
+        :param num_slots: Number of trajectory slots in shared memory. Twice the number of actors if None
+        :param hidden_size: Hidden layer size of the policy
+        :param gamma: Discount factor. Rewards are round wins, which mostly depend on the card played in the round
+        :param league_size: Number of past policies kept as opponents
+        :param league_interval: Number of learner updates between league snapshots
+        :param latest_opponent_probability: Probability that the opponents of a rollout play the latest weights
+        :param seed: Seed of the training run
+        :param context: multiprocessing start method
+        """
+        self.num_actors = num_actors if num_actors is not None else max((os.cpu_count() or 2) - 1, 1)
+        self.config = {"num_of_players": num_of_players, "envs_per_actor": envs_per_actor,
+                       "rollout_length": rollout_length, "hidden_size": hidden_size, "league_size": league_size,
+                       "latest_opponent_probability": latest_opponent_probability}
+        self.num_slots = num_slots if num_slots is not None else 2 * self.num_actors
+        self.gamma = gamma
+        self.gae_lambda = gae_lambda
+        self.epochs = epochs
+        self.minibatches = minibatches
+        self.league_interval = league_interval
+        self.seed = seed
+        self.verbose = verbose
+        self.ctx = mp.get_context(context)
+
+        self.policy = MLPPolicy(num_of_players, hidden_size, seed=seed)
+        self.optimizer = Adam(self.policy.size, learning_rate)
+        self.rng = np.random.default_rng(seed)
+
+        self.shared = create_shared_state(self.ctx, num_of_players, self.policy.size, self.num_slots, rollout_length,
+                                          envs_per_actor, league_size)
+        self.views = shared_views(self.shared)
+        self.lock = self.ctx.Lock()
+
+        # Statistics
+        self.updates = 0
+        self.samples = 0
+        self.games = 0
+        self.history = []
+
+    def publish(self):
+        """
+        Publishes the current weights to the actors and adds a league snapshot every league_interval updates
+        """
+        with self.lock:
+            self.views["weights"][:] = self.policy.get_flat()
+            self.shared["version"].value = self.updates
+
+            if self.updates % self.league_interval == 0:
+                league_count = self.shared["league_count"].value
+                self.views["league"][league_count % self.config["league_size"]] = self.policy.get_flat()
+                self.shared["league_count"].value = league_count + 1
+
+    def learn(self, slot: int):
+        """
+        Trains the policy on one trajectory slot
+        :return: Mean loss
+        """
+        views = self.views
+        steps = self.config["rollout_length"]
+        observations = {name: views[name][slot] for name in ("trump", "hand", "stack")}
+        action_masks = views["action_masks"][slot]
+        num_envs = action_masks.shape[1]
+
+        # Values of all observations including the bootstrap observation
+        flat_observations = {name: array.reshape((steps + 1) * num_envs, *array.shape[2:])
+                             for name, array in observations.items()}
+        x = self.policy.features(flat_observations)
+        flat_masks = action_masks.reshape((steps + 1) * num_envs, NUM_ACTIONS)
+        values = self.policy.forward(x, flat_masks)[2].reshape(steps + 1, num_envs)
+
+        # Generalized advantage estimation
+        rewards = views["rewards"][slot, :steps]
+        not_done = 1.0 - views["dones"][slot, :steps]
+        advantages = np.zeros((steps, num_envs))
+        last_advantage = np.zeros(num_envs)
+        for t in reversed(range(steps)):
+            delta = rewards[t] + self.gamma * values[t + 1] * not_done[t] - values[t]
+            last_advantage = delta + self.gamma * self.gae_lambda * not_done[t] * last_advantage
+            advantages[t] = last_advantage
+        returns = (advantages + values[:steps]).ravel()
+        advantages = advantages.ravel()
+        advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
+
+        x = x[:steps * num_envs]
+        flat_masks = flat_masks[:steps * num_envs]
+        actions = views["actions"][slot, :steps].ravel()
+        log_probabilities = views["log_probabilities"][slot, :steps].ravel()
+
+        losses = []
+        for _ in range(self.epochs):
+            for batch in np.array_split(self.rng.permutation(len(actions)), self.minibatches):
+                loss, gradient = self.policy.gradient(x[batch], flat_masks[batch], actions[batch],
+                                                      log_probabilities[batch], advantages[batch], returns[batch])
+                self.optimizer.step(self.policy.params, gradient)
+                losses.append(loss)
+
+        return float(np.mean(losses))
+
+    def train(self, total_samples: int = None, duration: float = None, report_interval: float = 5.0):
+        """
+        Runs the actors and trains until the sample or time budget is used up
+        :param total_samples: Number of agent steps to train on
+        :param duration: Training time in seconds
+        :param report_interval: Seconds between status reports
+        :return: List of report dicts
+        """
+        if total_samples is None and duration is None:
+            raise ValueError("Either total_samples or duration has to be set")
+
+        free_slots = self.ctx.Queue()
+        full_slots = self.ctx.Queue()
+        stop = self.ctx.Event()
+        for slot in range(self.num_slots):
+            free_slots.put(slot)
+
+        self.publish()
+        actors = [self.ctx.Process(target=actor, daemon=True,
+                                   args=(i, self.config, self.shared, self.lock, free_slots, full_slots, stop, seed))
+                  for i, seed in enumerate(spawn_seeds(self.seed, self.num_actors))]
+        for process in actors:
+            process.start()
+
+        start = last_report = time.perf_counter()
+        report_samples, report_games, staleness, losses, rewards = 0, 0, [], [], []
+
+        try:
+            while (total_samples is None or self.samples < total_samples) and \
+                    (duration is None or time.perf_counter() - start < duration):
+                try:
+                    slot = full_slots.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+
+                staleness.append(self.updates - int(self.views["slot_version"][slot]))
+                losses.append(self.learn(slot))
+                rewards.append(float(self.views["rewards"][slot, :-1].mean()))
+
+                samples = self.config["rollout_length"] * self.config["envs_per_actor"]
+                self.samples += samples
+                report_samples += samples
+                report_games += int(self.views["slot_games"][slot])
+                self.games += int(self.views["slot_games"][slot])
+                free_slots.put(slot)
+
+                self.updates += 1
+                self.publish()
+
+                now = time.perf_counter()
+                if now - last_report >= report_interval:
+                    self.report(now - start, now - last_report, report_samples, report_games, staleness, losses,
+                                rewards)
+                    last_report = now
+                    report_samples, report_games, staleness, losses, rewards = 0, 0, [], [], []
+
+        finally:
+            stop.set()
+            for process in actors:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+
+        return self.history
+
+    def report(self, elapsed: float, interval: float, samples: int, games: int, staleness, losses, rewards):
+        entry = {"time": elapsed, "updates": self.updates, "samples": self.samples, "games": self.games,
+                 "samples_per_sec": samples / interval, "games_per_sec": games / interval,
+                 "mean_staleness": float(np.mean(staleness)), "max_staleness": int(np.max(staleness)),
+                 "loss": float(np.mean(losses)), "mean_reward": float(np.mean(rewards)),
+                 "league_size": min(self.shared["league_count"].value, self.config["league_size"])}
+        self.history.append(entry)
+
+        if self.verbose:
+            print(f"[STATUS] {elapsed:6.0f}s | update {entry['updates']} | {entry['games_per_sec']:.0f} games/s | "
+                  f"{entry['samples_per_sec']:.0f} samples/s | staleness {entry['mean_staleness']:.1f} "
+                  f"(max {entry['max_staleness']}) | reward {entry['mean_reward']:.3f} | league "
+                  f"{entry['league_size']}")
+
+
+if __name__ == '__main__':
+    trainer = SelfPlayTrainer(num_of_players=3, num_actors=2, seed=0)
+    trainer.train(duration=60)
+    trainer.policy.save("selfplay_policy.npz")
+    print("[STATUS] Saved policy to selfplay_policy.npz")
@@ -0,0 +1,516 @@
+"""
+Asyncio game server hosting many GaigelSim tables in one process. Seats are filled by remote clients or by
+in-process bots. Clients talk to the server over TCP with one JSON object per line:
+
+    client -> server  {"type": "join", "players": 3, "bots": ["greedy", "random"], "name": "alice"}
+                      {"type": "move", "slot": 1-5, "turn_id": 12}
+    server -> client  {"type": "joined", "table": 7, "seat": 0}
+                      {"type": "deal", "trump_card": "h10", "starting_seat": 2}
+                      {"type": "turn", "turn_id": 12, "trump_state": .., "hand_state": [..],
+                       "stack_state": [..], "action_mask": [..], "points": [..], "timeout": 10.0}
+                      {"type": "action", "seat": 1, "slot": 3, "card": "k11", "timeout": false}
+                      {"type": "round_end", "winner": 1, "points": [..]}
+                      {"type": "game_over", "winners": [1], "points": [..]}
+                      {"type": "error", "message": ".."}
+
+A join puts the client on an open table with the same number of players and bots, or opens a new one. Clients take
+the first seats, bots the last ones, the game starts once all client seats are taken. A client that does not move
+within the move timeout (or is disconnected) plays a random legal card. A client that does not read the messages
+sent to it within the move timeout is disconnected. Moves with the turn_id of an earlier turn are rejected, so a late
+move is not played in the next turn. Bots are policy names (see policies.py), which are called directly, or names of
+opponent models (see opponents.py) given to the server. Policies run inside the event loop, so clients can only ask
+for the cheap ones in CLIENT_BOTS. A search policy like ismcts would stall every table. Model moves of all tables are
+collected during one event loop iteration and predicted in one batch.
+"""
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from policies import POLICIES, make_policy
+from simulation import GaigelSim
+
+CLIENT_BOTS = ("random", "greedy")  # Policies that remote clients can ask for
+
+
+class BotBatcher:
+    """
+    Collects the moves requested from one opponent model and predicts them in batches
+    """
+
+    def __init__(self, model, num_of_players: int):
+        self.model = model
+        self.num_of_players = num_of_players
+        self.requests = []
+        self.scheduled = False
+
+        # Statistics
+        self.batches = 0
+        self.moves = 0
+
+    def predict(self, sim, player):
+        """
+        Requests a move
+        :return: Future of the move id (1-5)
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.requests.append((sim.trump_state, list(player.hand_state), list(sim.stack_state),
+                              sim.legal_action_mask(player), future))
+
+        # Flushed after all callbacks that are ready in this loop iteration, so tables resumed together batch together
+        if not self.scheduled:
+            self.scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+        return future
+
+    def flush(self):
+        requests, self.requests, self.scheduled = self.requests, [], False
+
+        observations = {"trump": np.array([request[0] for request in requests], dtype=np.int64),
+                        "hand": np.array([request[1] for request in requests], dtype=np.int64),
+                        "stack": np.array([request[2] for request in requests], dtype=np.int64)}
+        action_masks = np.array([[request[3] >> i & 1 for i in range(5)] for request in requests], dtype=bool)
+        actions = self.model.predict(observations, action_masks)
+
+        for request, action in zip(requests, actions):
+            if not request[4].cancelled():
+                request[4].set_result(int(action) + 1)
+
+        self.batches += 1
+        self.moves += len(requests)
+
+
+class ClientSeat:
+    """
+    Seat of a remote client
+    """
+
+    def __init__(self, connection, name: str):
+        self.connection = connection
+        self.name = name
+        self.move = None  # Future of the requested move while it is the clients turn. Result None on disconnect
+        self.action_mask = 0
+        self.turn_id = 0
+
+    def send(self, message):
+        if self.connection is not None:
+            self.connection.send(message)
+
+    async def drain(self, timeout: float):
+        if self.connection is not None:
+            await self.connection.drain(timeout)
+
+    async def choose(self, table, player):
+        sim = table.sim
+        self.action_mask = sim.legal_action_mask(player)
+
+        if self.connection is not None:
+            self.move = asyncio.get_running_loop().create_future()
+            self.turn_id += 1
+            self.send({"type": "turn", "turn_id": self.turn_id, "trump_state": sim.trump_state,
+                       "hand_state": list(player.hand_state), "stack_state": list(sim.stack_state),
+                       "action_mask": [self.action_mask >> i & 1 for i in range(5)],
+                       "points": [p.points for p in sim.player_list], "timeout": table.server.move_timeout})
+            start = time.perf_counter()
+
+            try:
+                slot = await asyncio.wait_for(self.move, table.server.move_timeout)
+                if slot is not None:
+                    table.server.client_latency += time.perf_counter() - start
+                    table.server.client_moves += 1
+                    return slot, False
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.move = None
+
+        # Slow or disconnected client. Play a random legal card
+        table.server.timeouts += 1
+        return sim.rng.choice([slot for slot in range(1, 6) if self.action_mask >> (slot - 1) & 1]), True
+
+    def receive_move(self, slot, turn_id=None):
+        if self.move is None or self.move.done() or (turn_id is not None and turn_id != self.turn_id):
+            self.send({"type": "error", "message": "It is not your turn"})
+        elif not isinstance(slot, int) or not 1 <= slot <= 5 or not self.action_mask >> (slot - 1) & 1:
+            self.send({"type": "error", "message": f"Illegal move {slot}"})
+        else:
+            self.move.set_result(slot)
+
+
+class PolicySeat:
+    """
+    Seat of a bot that plays a policy from policies.py
+    """
+
+    def __init__(self, policy):
+        self.policy = make_policy(policy)
+
+    async def choose(self, table, player):
+        # Policies never suspend. Give the other tables and the connections a turn after every move
+        await asyncio.sleep(0)
+        return self.policy(table.sim, player), False
+
+
+class ModelSeat:
+    """
+    Seat of a bot that plays an opponent model. Moves are batched over all tables
+    """
+
+    def __init__(self, batcher: BotBatcher):
+        self.batcher = batcher
+
+    async def choose(self, table, player):
+        return await self.batcher.predict(table.sim, player), False
+
+
+class Table:
+    """
+    One game table. Observes its simulation to send the game progress to the clients
+    """
+
+    def __init__(self, server, table_id: int, seats, num_clients: int, seed=None):
+        self.server = server
+        self.table_id = table_id
+        self.seats = seats  # One seat object per player, None for client seats not taken yet
+        self.num_clients = num_clients
+        self.key = None  # Lobby key while the table waits for clients
+        self.num_games = 1
+        self.sim = GaigelSim(len(seats), seed=seed)
+        self.clients = []
+        self.task = None
+
+    def is_full(self):
+        return None not in self.seats
+
+    def add_client(self, seat: ClientSeat):
+        index = self.seats.index(None)
+        self.seats[index] = seat
+        self.clients.append(seat)
+        if not self.sim.observers:
+            self.sim.observers.append(self)
+        return index
+
+    def broadcast(self, message):
+        for client in self.clients:
+            client.send(message)
+
+    def on_deal(self, sim):
+        # The trump card is taken from the stack after three rounds of dealing
+        trump_card = sim.card_stack.queue[3 * len(sim.player_list)]
+        self.broadcast({"type": "deal", "trump_card": sim.cards_by_id[trump_card.kind],
+                        "starting_seat": sim.players.queue[0].seat})
+
+    def on_action(self, sim, player, slot: int, card):
+        pass  # Sent by play, which knows whether the move timed out
+
+    def on_round_end(self, sim, winner):
+        self.broadcast({"type": "round_end", "winner": winner.seat, "points": [p.points for p in sim.player_list]})
+
+    def on_game_over(self, sim):
+        self.broadcast({"type": "game_over", "winners": [p.seat for p in sim.game_winners],
+                        "points": [p.points for p in sim.player_list]})
+
+    async def play(self, num_games: int = 1):
+        """
+        Plays games at the table
+        :param num_games: Number of games
+        """
+        sim = self.sim
+        for _ in range(num_games):
+            sim.reset()
+            while not sim.game_over:
+                player = sim.players.queue[0]
+                slot, timed_out = await self.seats[player.seat].choose(self, player)
+
+                if self.clients:
+                    self.broadcast({"type": "action", "seat": player.seat, "slot": slot,
+                                    "card": sim.cards_by_id[player.hand_state[slot - 1]], "timeout": timed_out})
+
+                player.set_next_action(slot)
+                sim.step()
+                self.server.moves += 1
+
+                # Wait until the messages of the move are sent, so the buffers of slow readers do not grow
+                if self.clients:
+                    await asyncio.gather(*[client.drain(self.server.move_timeout) for client in self.clients])
+
+            self.server.games += 1
+
+
+class Connection:
+    """
+    Connection of a remote client
+    """
+
+    def __init__(self, server, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.seat = None
+
+    def send(self, message):
+        if not self.writer.is_closing():
+            self.writer.write((json.dumps(message) + "\n").encode())
+
+    async def drain(self, timeout: float):
+        """
+        Waits until the write buffer is below its limit. Closes the connection of a client that does not read
+        :param timeout: Seconds to wait
+        """
+        try:
+            await asyncio.wait_for(self.writer.drain(), timeout)
+        except (ConnectionError, asyncio.TimeoutError):
+            self.writer.close()
+
+    async def handle(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+
+                try:
+                    message = json.loads(line)
+                    message_type = message["type"]
+                except (ValueError, KeyError, TypeError):
+                    self.send({"type": "error", "message": "Expected a JSON object with a type"})
+                    continue
+
+                if message_type == "join":
+                    self.join(message)
+                elif message_type == "move" and self.seat is not None:
+                    self.seat.receive_move(message.get("slot"), message.get("turn_id"))
+                else:
+                    self.send({"type": "error", "message": f"Unexpected message {message_type}"})
+
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # The seat keeps playing random moves
+            if self.seat is not None:
+                self.seat.connection = None
+                if self.seat.move is not None and not self.seat.move.done():
+                    self.seat.move.set_result(None)
+            self.writer.close()
+
+    def join(self, message):
+        if self.seat is not None:
+            self.send({"type": "error", "message": "Already seated"})
+            return
+
+        try:
+            num_of_players = int(message.get("players", 3))
+            bots = list(message.get("bots", []))
+            num_games = int(message.get("games", 1))
+            if not 2 <= num_of_players <= 6 or len(bots) >= num_of_players:
+                raise ValueError("Invalid number of players or bots")
+            if not 1 <= num_games <= self.server.max_games:
+                raise ValueError(f"Number of games has to be between 1 and {self.server.max_games}")
+            for bot in bots:
+                if bot not in self.server.client_bots and bot not in self.server.models:
+                    raise ValueError(f"Bot {bot} is not available. Available bots: "
+                                     f"{', '.join(list(self.server.client_bots) + list(self.server.models))}")
+            table = self.server.open_table(num_of_players, bots, num_games)
+        except (ValueError, TypeError) as error:
+            self.send({"type": "error", "message": str(error)})
+            return
+
+        self.seat = ClientSeat(self, str(message.get("name", "client")))
+        seat_index = table.add_client(self.seat)
+        self.send({"type": "joined", "table": table.table_id, "seat": seat_index})
+
+        if table.is_full():
+            self.server.start_table(table)
+
+
+class GaigelServer:
+    """
+    Hosts tables for remote clients and bot sessions
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, move_timeout: float = 10.0, models=None,
+                 seed=None, max_games: int = 100, client_bots=CLIENT_BOTS):
+        """
+        :param host: Host to listen on
+        :param port: Port to listen on. 0 picks a free port
+        :param move_timeout: Seconds a client has for a move
+        :param models: dict of bot name to opponent model (see opponents.py). Moves of models are batched
+        :param seed: Seed of the table seeds
+        :param max_games: Maximum number of games a client can request per table
+        :param client_bots: Policy names that clients can ask for. Models can always be asked for. Bot tables of
+        play_bots can use every policy
+        """
+        self.host = host
+        self.port = port
+        self.move_timeout = move_timeout
+        self.max_games = max_games
+        self.client_bots = tuple(client_bots)
+        self.models = dict(models) if models is not None else {}
+        self.rng = np.random.default_rng(seed)
+        self.server = None
+        self.tables = {}
+        self.lobby = {}  # (players, bots, games) to the open table waiting for clients
+        self.batchers = {}  # (model name, players) to BotBatcher
+        self.next_table_id = 0
+
+        # Statistics
+        self.games = 0
+        self.moves = 0
+        self.timeouts = 0
+        self.client_moves = 0
+        self.client_latency = 0.0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.connect, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        for table in list(self.tables.values()):
+            if table.task is not None:
+                table.task.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def connect(self, reader, writer):
+        await Connection(self, reader, writer).handle()
+
+    def make_seat(self, bot: str, num_of_players: int):
+        if bot in self.models:
+            key = (bot, num_of_players)
+            if key not in self.batchers:
+                self.batchers[key] = BotBatcher(self.models[bot], num_of_players)
+            return ModelSeat(self.batchers[key])
+        if bot in POLICIES:
+            return PolicySeat(bot)
+        raise ValueError(f"Unknown bot {bot}. Available bots: {', '.join(list(POLICIES) + list(self.models))}")
+
+    def create_table(self, num_of_players: int, bots, num_clients: int):
+        seats = [None] * num_clients + [self.make_seat(bot, num_of_players) for bot in bots]
+        table = Table(self, self.next_table_id, seats, num_clients, seed=int(self.rng.integers(1 << 63)))
+        self.tables[table.table_id] = table
+        self.next_table_id += 1
+        return table
+
+    def open_table(self, num_of_players: int, bots, num_games: int):
+        """
+        Gets the open table for a join request or creates a new one
+        """
+        key = (num_of_players, tuple(bots), num_games)
+        table = self.lobby.get(key)
+        if table is None:
+            table = self.create_table(num_of_players, bots, num_of_players - len(bots))
+            table.key = key
+            table.num_games = num_games
+            self.lobby[key] = table
+        return table
+
+    def start_table(self, table: Table, num_games: int = None):
+        if table.key is not None:
+            self.lobby.pop(table.key, None)
+            table.key = None
+        table.task = asyncio.get_running_loop().create_task(self.run_table(table, num_games or table.num_games))
+        return table.task
+
+    async def run_table(self, table: Table, num_games: int):
+        try:
+            await table.play(num_games)
+        except Exception as error:
+            table.broadcast({"type": "error", "message": f"Table stopped: {error}"})
+            raise
+        finally:
+            self.tables.pop(table.table_id, None)
+
+    async def play_bots(self, bots, num_tables: int, num_games: int = 1):
+        """
+        Plays bot-only tables concurrently
+        :param bots: One bot name per seat
+        :param num_tables: Number of tables
+        :param num_games: Games per table
+        """
+        tables = [self.create_table(len(bots), bots, 0) for _ in range(num_tables)]
+        await asyncio.gather(*[self.start_table(table, num_games) for table in tables])
+
+    async def report(self, interval: float = 5.0):
+        """
+        Prints the server statistics every interval seconds until cancelled
+        """
+        last_moves, last_time = self.moves, time.perf_counter()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            print(f"[STATUS] {len(self.tables)} tables | {self.games} games | "
+                  f"{(self.moves - last_moves) / (now - last_time):.0f} moves/s | {self.timeouts} timeouts | "
+                  f"client latency {self.client_latency / max(self.client_moves, 1) * 1000:.1f}ms")
+            last_moves, last_time = self.moves, now
+
+    async def serve_forever(self, report_interval: float = None):
+        await self.start()
+        print(f"[STATUS] Gaigel server listening on {self.host}:{self.port}")
+        reporter = asyncio.create_task(self.report(report_interval)) if report_interval else None
+        try:
+            await self.server.serve_forever()
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+
+async def random_client(host: str, port: int, players: int = 3, bots=("random", "random"), delay: float = 0.0,
+                        seed=None):
+    """
+    Client that joins a table and plays random legal moves. Useful for load tests
+    :param delay: Seconds to wait before each move
+    :return: Final points of the game
+    """
+    rng = np.random.default_rng(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((json.dumps({"type": "join", "players": players, "bots": list(bots)}) + "\n").encode())
+
+    points = None
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        message = json.loads(line)
+
+        if message["type"] == "turn":
+            if delay:
+                await asyncio.sleep(delay)
+            slot = int(rng.choice(np.flatnonzero(message["action_mask"]))) + 1
+            writer.write((json.dumps({"type": "move", "slot": slot, "turn_id": message["turn_id"]}) + "\n").encode())
+        elif message["type"] == "game_over":
+            points = message["points"]
+            break
+
+    writer.close()
+    return points
+
+
+if __name__ == '__main__':
+    from opponents import RandomOpponent
+
+    async def main():
+        server = GaigelServer(port=0, move_timeout=0.05, models={"model": RandomOpponent(seed=0)}, seed=0)
+        await server.start()
+
+        # Bot tables with batched model moves
+        start = time.perf_counter()
+        await server.play_bots(["model", "model", "greedy"], num_tables=2000)
+        batcher = server.batchers[("model", 3)]
+        print(f"[BENCHMARK] 2000 bot tables in {time.perf_counter() - start:.2f}s "
+              f"({server.moves / (time.perf_counter() - start):.0f} moves/s, "
+              f"{batcher.moves / batcher.batches:.0f} model moves per batch)")
+
+        # Remote clients, one of them too slow for the move timeout
+        start = time.perf_counter()
+        results = await asyncio.gather(*[random_client("127.0.0.1", server.port, seed=i) for i in range(200)],
+                                       random_client("127.0.0.1", server.port, bots=["model", "greedy"], delay=0.1))
+        print(f"[BENCHMARK] 201 client tables in {time.perf_counter() - start:.2f}s | {server.timeouts} timeouts | "
+              f"client latency {server.client_latency / server.client_moves * 1000:.2f}ms")
+        print(f"[RESULT] Points of the slow client game: {results[-1]}")
+
+        await server.close()
+
+    asyncio.run(main())
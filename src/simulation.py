@@ -1,6 +1,25 @@
+import hashlib
 import random
+from array import array
 from queue import Queue
 
+from rules import KIND_IDS, KIND_SUIT, KIND_BITS, ALL_CARDS, GameSnapshot, resolve_trick
+from transposition import (HAND_KEYS, ROUND_KEYS, LEAD_KEYS, POINTS_KEYS, STACK_KEYS, TRUMP_KEYS, FRONT_KEYS,
+                           MATCH_COLOR_KEY, KIND_COUNT, MAX_POINTS, compute_hash)
+
+
+def spawn_seeds(seed, count: int, start: int = 0):
+    """
+    Derives independent seeds from one seed, e.g. one per game or worker process. The same seed always gives the
+    same list of seeds, so parallel runs can be reproduced independent of how the games are split between workers
+    :param seed: Integer or string seed
+    :param count: Number of seeds to derive
+    :param start: Index of the first seed. spawn_seeds(seed, n, start) equals spawn_seeds(seed, start + n)[start:]
+    :return: List of 64 bit integer seeds
+    """
+    return [int.from_bytes(hashlib.blake2b(f"{seed}/{i}".encode(), digest_size=8).digest(), "little")
+            for i in range(start, start + count)]
+
 
 class Card:
     card_types = {"k": "karo", "h": "herz", "p": "pik", "z": "kreuz"}
@@ -11,6 +30,8 @@ class Card:
         # Set Card Type and Value
         self.value = card_value
         self.type = card_type
+        self.kind = KIND_IDS[self.val()]  # Card kind id, same as GaigelSim.ids_by_card
+        self.bit = 0  # Bit of the card in bitboards (see rules.KIND_BITS). Set by the simulation that owns the card
 
         # Set ID
         self.id = Card.card_id_count
@@ -28,40 +49,139 @@ class Card:
 
 
 class Player:
+    """
+    Player of a GaigelSim. Actions come from set_next_action, the policy or a random legal move. Subclasses can
+    override get_action, they get the state of the simulation unless they set needs_state to False
+    """
     player_id_count = 0
+    needs_state = False  # Set to True if get_action uses the state. Otherwise the state is not built for the player
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
 
-    def __init__(self, name: str):
+        # Subclasses written before needs_state existed read the state in get_action
+        if "get_action" in cls.__dict__ and "needs_state" not in cls.__dict__:
+            cls.needs_state = True
+
+    def __init__(self, name: str, rng: random.Random = None, policy=None):
         # Set Player Properties
         self.name = name
+        self.rng = rng if rng is not None else random.Random()  # Used for random actions
+        self.policy = policy  # Optional callable policy(sim, player) -> move id. See policies.py
         self.points = 0
         self.cards_hand = {1: None, 2: None, 3: None, 4: None, 5: None}
+        self.hand_state = array("q", [0] * 5)  # Card kind ids of cards_hand. Updated by the simulation
+
+        # Bitboard views of cards_hand. Updated together with cards_hand by add_card and remove_card
+        self.hand_bits = 0  # Bits of the cards on hand
+        self.slot_mask = 0  # Bit i is set if slot i + 1 holds a card
+        self.suit_slots = [0, 0, 0, 0]  # Slot mask of the cards of every suit (rules.SUITS)
+
         self.cards_played = []
+        self.void_suits = 0  # Bitmask of suit indices (rules.SUITS) the player did not follow while matching color
         self.next_action = None
+        self.seat = None  # Seat index in the simulation
 
         # Set ID
         self.id = Player.player_id_count
         Player.player_id_count += 1
 
+    def reset(self):
+        """
+        Resets the player for a new game without creating new objects
+        """
+        self.points = 0
+        self.clear_hand()
+        self.cards_played.clear()
+        self.void_suits = 0
+        self.next_action = None
+
+    def clear_hand(self):
+        """
+        Removes all cards from the hand
+        """
+        for slot in self.cards_hand:
+            self.cards_hand[slot] = None
+            self.hand_state[slot - 1] = 0
+        self.hand_bits = 0
+        self.slot_mask = 0
+        for suit in range(len(self.suit_slots)):
+            self.suit_slots[suit] = 0
+
+    def add_card(self, card, slot: int = None):
+        """
+        Puts a card on the hand
+        :param card: Card class instance
+        :param slot: Hand slot (1-5). The first empty slot if None
+        :return: Slot of the card
+        """
+        if slot is None:
+            empty_slots = ~self.slot_mask & 0b11111
+            slot = (empty_slots & -empty_slots).bit_length()
+
+        self.cards_hand[slot] = card
+        self.hand_state[slot - 1] = card.kind
+        self.hand_bits |= card.bit
+        self.slot_mask |= 1 << (slot - 1)
+        self.suit_slots[KIND_SUIT[card.kind]] |= 1 << (slot - 1)
+        return slot
+
+    def remove_card(self, slot: int):
+        """
+        Takes a card from the hand
+        :param slot: Hand slot (1-5)
+        :return: Card class instance
+        """
+        card = self.cards_hand[slot]
+        self.cards_hand[slot] = None
+        self.hand_state[slot - 1] = 0
+        self.hand_bits &= ~card.bit
+        self.slot_mask &= ~(1 << (slot - 1))
+        self.suit_slots[KIND_SUIT[card.kind]] &= ~(1 << (slot - 1))
+        return card
+
+    def clone(self, rng: random.Random):
+        """
+        Copies the player for a cloned simulation. Keeps the id, the cards are restored by the simulation
+        :param rng: Random number generator of the cloned simulation
+        :return: New Player class instance
+        """
+        player = Player.__new__(Player)
+        player.__dict__.update(self.__dict__)
+        player.rng = rng
+        player.cards_hand = {1: None, 2: None, 3: None, 4: None, 5: None}
+        player.hand_state = array("q", [0] * 5)
+        player.suit_slots = [0, 0, 0, 0]
+        player.cards_played = []
+        return player
+
     def get_num_cards(self):
         """
         Gets the number of cards the player has on hand
         :return: Integer number of cards
         """
-        return sum(1 for value in self.cards_hand.values() if value is not None)
+        return self.slot_mask.bit_count()
 
     def set_next_action(self, action):
         self.next_action = action
 
-    def get_action(self, state):
+    def get_action(self, state=None, sim=None):
         """
         Returns an action for the given state by the simulation. This can be integrated into a RL Agent etc.
-        :param state: State of the current simulation. Array of card value indices
+        :param state: State of the current simulation as returned by GaigelSim.get_state. Only passed if needs_state
+        is set (the default for subclasses that override get_action), otherwise it can be built with sim.get_state
+        :param sim: Simulation the player is playing in. Passed on to the policy of the player
         :return: Player action choice
         """
-        # If no action is given, chose randomly
+        # If no action is given, ask the policy of the player
+        if self.next_action is None and self.policy is not None:
+            return self.policy(sim, self)
+
+        # If no action and no policy is given, chose randomly from the legal moves (any card on hand without a sim)
         if self.next_action is None:
-            possible_moves = [key for key, value in self.cards_hand.items() if value is not None]
-            return random.choice(possible_moves)
+            action_mask = sim.action_mask if sim is not None else self.slot_mask
+            possible_moves = [slot for slot in range(1, 6) if action_mask >> (slot - 1) & 1]
+            return self.rng.choice(possible_moves)
 
         # Return specific action if set
         else:
@@ -81,7 +201,7 @@ class GaigelSim:
     # TODO: Farbe bekennen
     # TODO: Group play (Über kreuz)
 
-    def __init__(self, players: int, verbose: bool = False):
+    def __init__(self, players: int, verbose: bool = False, seed=None):
 
         # General Game state variables
         self.card_stack = Queue(maxsize=48)
@@ -91,14 +211,26 @@ class GaigelSim:
         self.match_color = False  # "Farben bekennen" if card stack is empty
         self.game_over = False
         self.game_winners = []
+        self.stack_bits = ALL_CARDS  # Bitboard of the cards on the card stack (see rules.KIND_BITS)
+        self.played_bits = 0  # Bitboard of all played cards, including the current round stack
         self.verbose = verbose
+        self.rng = random.Random(seed)  # Random number generator for all random decisions in the game
+        self.seed = seed  # Seed of the current game. None if the game continues the random stream of an earlier game
+
+        # Objects notified about the game progress, e.g. records.RecordWriter. Observers implement on_deal(sim),
+        # on_action(sim, player, slot, card), on_round_end(sim, winner) and on_game_over(sim)
+        self.observers = []
 
         # Round variables
         self.card_round_stack = []  # Cards placed in a round. Gets reset each round
+        self.stack_state = array("q", [0] * (players - 1))  # Card kind ids of the first cards in card_round_stack
+        self.trump_state = 0  # Index of the trump type in trump_ids
         self.card_placed_by = []  # Tracks which player placed which card in the card_round_stack
         self.current_player = None  # Player that has the next turn
+        self.action_mask = 0  # Legal action mask of the current player
         self.round_state = "play"  # Can be "play" or "draw"
         self.last_round_winner = None
+        self.zobrist = 0  # Zobrist hash of the state without the player queue. See zobrist_hash
 
         # Game time tracking
         self.current_round = 0
@@ -110,21 +242,30 @@ class GaigelSim:
         self.trump_ids = {item[0]: i for i, item in enumerate(GaigelSim.card_types.items())}
 
         # Create new deck. (Standard "Württembergisches Blatt" 48 cards, 2 of each type)
+        self.deck = []  # All cards in their initial order. Used to refill the card stack on reset
         card_id = 1
         for card_type in GaigelSim.card_types.keys():
             for card_value in GaigelSim.card_values.keys():
                 # Add 2 cards for every possible type to the stack
-                self.card_stack.put(Card(card_value, card_type))
-                self.card_stack.put(Card(card_value, card_type))
+                self.deck.append(Card(card_value, card_type))
+                self.deck.append(Card(card_value, card_type))
 
                 # Assign an id to every card type (Used for observation space)
                 self.ids_by_card[card_type + str(card_value)] = card_id
                 self.cards_by_id[card_id] = card_type + str(card_value)
                 card_id += 1
 
-        # Create players
-        for i in range(players):
-            self.players.put(Player("player_" + str(i + 1)))
+        self.cards_by_kind = [[] for _ in range(len(self.cards_by_id))]  # Both cards of every card kind
+        for i, card in enumerate(self.deck):
+            card.bit = 1 << i  # The deck is in card kind order, so the bits match rules.KIND_BITS
+            self.cards_by_kind[card.kind].append(card)
+            self.card_stack.put(card)
+
+        # Create players (player_list keeps the seat order)
+        self.player_list = [Player("player_" + str(i + 1), rng=self.rng) for i in range(players)]
+        for seat, player in enumerate(self.player_list):
+            player.seat = seat
+            self.players.put(player)
 
     def __str__(self):
         return_string = f"{'='*30} Round {self.current_round} | Turn {self.current_turn} {'='*30}\n"
@@ -149,11 +290,203 @@ class GaigelSim:
 
         return return_string
 
+    def reset(self, seed=None, stack=None, starting_seat: int = None):
+        """
+        Resets the simulation in place for a new game. The existing deck and players are reused, the card stack is
+        reshuffled and the cards are handed out again
+        :param seed: Optional seed for the random number generator. If not set, the current random stream continues
+        :param stack: Optional card kinds of the card stack in deal order, e.g. from a game record. Not shuffled if set
+        :param starting_seat: Optional seat of the starting player. Selected randomly if None
+        """
+        if seed is not None:
+            self.rng.seed(seed)
+            self.seed = seed
+        elif self.trump is not None:
+            self.seed = None
+
+        # Put all cards back on the stack and the players back in their initial order
+        self.card_stack.queue.clear()
+        self.card_stack.queue.extend(self.deck)
+        self.players.queue.clear()
+        self.players.queue.extend(self.player_list)
+        for player in self.player_list:
+            player.reset()
+
+        # Reset game and round state variables
+        self.trump_suit = None
+        self.trump = None
+        self.match_color = False
+        self.game_over = False
+        self.game_winners.clear()
+        self.stack_bits = ALL_CARDS
+        self.played_bits = 0
+        self.card_round_stack.clear()
+        self.card_placed_by.clear()
+        for i in range(len(self.stack_state)):
+            self.stack_state[i] = 0
+        self.trump_state = 0
+        self.current_player = None
+        self.action_mask = 0
+        self.round_state = "play"
+        self.last_round_winner = None
+        self.zobrist = 0
+        self.current_round = 0
+        self.current_turn = 0
+
+        # Initial actions
+        if stack is None:
+            self.shuffle_stack()
+        else:
+            card_copies_used = [0] * len(self.cards_by_kind)
+            self.card_stack.queue.clear()
+            for kind in stack:
+                self.card_stack.queue.append(self.cards_by_kind[kind][card_copies_used[kind]])
+                card_copies_used[kind] += 1
+
+        if starting_seat is None:
+            self.select_starting_player()
+        else:
+            self.current_player = self.player_list[starting_seat]
+            self.rotate_queue_to_player(self.current_player)
+        self.hand_out_cards()
+
+    def snapshot(self, include_rng: bool = False):
+        """
+        Saves the game state in a compact, immutable GameSnapshot. The snapshot can be restored by any GaigelSim or
+        GaigelCore with the same number of players. Player.cards_played and Player.void_suits are not included
+        :param include_rng: Also save the state of the random number generator
+        :return: GameSnapshot
+        """
+        return GameSnapshot(
+            stack=tuple([card.kind for card in self.card_stack.queue]),
+            trump_card=self.trump_suit.kind if self.trump_suit is not None else 0,
+            hands=tuple([kind for player in self.player_list for kind in player.hand_state]),
+            points=tuple([player.points for player in self.player_list]),
+            round_stack=tuple([card.kind for card in self.card_round_stack]),
+            placed_by=tuple([player.seat for player in self.card_placed_by]),
+            front=self.players.queue[0].seat,
+            current_player=self.current_player.seat if self.current_player is not None else -1,
+            last_round_winner=self.last_round_winner.seat if self.last_round_winner is not None else -1,
+            match_color=self.match_color,
+            game_over=self.game_over,
+            game_winners=tuple([player.seat for player in self.game_winners]),
+            current_round=self.current_round,
+            current_turn=self.current_turn,
+            rng_state=self.rng.getstate() if include_rng else None)
+
+    def restore(self, snapshot: GameSnapshot):
+        """
+        Restores a game state saved with snapshot. The existing cards, players and buffers are reused
+        :param snapshot: GameSnapshot
+        """
+        # Hand out physical cards by kind. Every kind exists twice in the deck
+        card_copies_used = [0] * len(self.cards_by_kind)
+
+        def take_card(kind):
+            card = self.cards_by_kind[kind][card_copies_used[kind]]
+            card_copies_used[kind] += 1
+            return card
+
+        self.trump_suit = take_card(snapshot.trump_card) if snapshot.trump_card else None
+        self.trump = self.trump_suit.type if self.trump_suit is not None else None
+        self.trump_state = self.trump_ids[self.trump] if self.trump is not None else 0
+
+        # Players
+        for seat, player in enumerate(self.player_list):
+            player.points = snapshot.points[seat]
+            player.next_action = None
+            player.cards_played.clear()
+            player.void_suits = 0
+            player.clear_hand()
+            for slot in range(5):
+                kind = snapshot.hands[seat * 5 + slot]
+                if kind:
+                    player.add_card(take_card(kind), slot + 1)
+
+        # Round stack
+        self.card_round_stack.clear()
+        self.card_placed_by.clear()
+        for i in range(len(self.stack_state)):
+            self.stack_state[i] = snapshot.round_stack[i] if i < len(snapshot.round_stack) else 0
+        for kind, seat in zip(snapshot.round_stack, snapshot.placed_by):
+            self.card_round_stack.append(take_card(kind))
+            self.card_placed_by.append(self.player_list[seat])
+
+        # Card stack and player queue
+        self.card_stack.queue.clear()
+        self.card_stack.queue.extend([take_card(kind) for kind in snapshot.stack])
+        self.stack_bits = sum(card.bit for card in self.card_stack.queue)
+
+        # Every card that is not on the stack, on a hand or the trump card was played
+        self.played_bits = ALL_CARDS & ~self.stack_bits & ~(self.trump_suit.bit if self.trump_suit is not None else 0)
+        for player in self.player_list:
+            self.played_bits &= ~player.hand_bits
+        self.players.queue.clear()
+        self.players.queue.extend(self.player_list)
+        self.players.queue.rotate(-snapshot.front)
+
+        # Game state variables
+        self.current_player = self.player_list[snapshot.current_player] if snapshot.current_player >= 0 else None
+        self.last_round_winner = (self.player_list[snapshot.last_round_winner]
+                                  if snapshot.last_round_winner >= 0 else None)
+        self.match_color = snapshot.match_color
+        self.game_over = snapshot.game_over
+        self.game_winners.clear()
+        self.game_winners.extend([self.player_list[seat] for seat in snapshot.game_winners])
+        self.current_round = snapshot.current_round
+        self.current_turn = snapshot.current_turn
+        self.action_mask = 0
+
+        self.zobrist = compute_hash(snapshot) ^ FRONT_KEYS[snapshot.front]
+
+        if snapshot.rng_state is not None:
+            self.rng.setstate(snapshot.rng_state)
+
+    def clone(self):
+        """
+        Creates an independent copy of the simulation. Cards and lookup tables are never changed during a game and are
+        shared with the copy, only the players and the containers of the game state are new
+        :return: GaigelSim class instance
+        """
+        sim = GaigelSim.__new__(GaigelSim)
+        sim.__dict__.update(self.__dict__)
+
+        # Methods replaced on the instance, e.g. by the profiler, are bound to this simulation. The copy uses the class
+        for name in [name for name in sim.__dict__ if callable(getattr(GaigelSim, name, None))]:
+            del sim.__dict__[name]
+
+        sim.rng = random.Random(0)  # State is replaced by restore, a fixed seed avoids reading system entropy
+        sim.card_stack = Queue(maxsize=self.card_stack.maxsize)
+        sim.players = Queue(maxsize=self.players.maxsize)
+        sim.player_list = [player.clone(sim.rng) for player in self.player_list]
+        sim.game_winners = []
+        sim.card_round_stack = []
+        sim.card_placed_by = []
+        sim.stack_state = array("q", self.stack_state)
+        sim.observers = []  # Copies are not observed, e.g. by the record writer
+
+        sim.restore(self.snapshot(include_rng=True))
+
+        # The play history is not part of the snapshot
+        for player, original in zip(sim.player_list, self.player_list):
+            player.cards_played.extend(original.cards_played)
+            player.void_suits = original.void_suits
+
+        return sim
+
+    def zobrist_hash(self):
+        """
+        Gets the Zobrist hash of the current game state. Equal positions reached by different move orders have the
+        same hash. The hash is updated incrementally, only the player queue is added here
+        :return: 64 bit integer hash
+        """
+        return self.zobrist ^ FRONT_KEYS[self.players.queue[0].seat]
+
     def shuffle_stack(self):
         """
         Randomly shuffles the card stack
         """
-        random.shuffle(self.card_stack.queue)
+        self.rng.shuffle(self.card_stack.queue)
 
         if self.verbose:
             print("[STATUS] Shuffled card stack")
@@ -167,6 +500,10 @@ class GaigelSim:
         if self.verbose:
             print("[STATUS] Handing out cards to players")
 
+        if self.observers:
+            for observer in self.observers:
+                observer.on_deal(self)
+
         # Hand out first 3 cards for every player
         for i in range(1, 4):
             for _ in range(self.players.qsize()):
@@ -175,6 +512,10 @@ class GaigelSim:
         # Define card under stack (trump suit)
         self.trump_suit = self.card_stack.get()
         self.trump = self.trump_suit.type
+        self.trump_state = self.trump_ids[self.trump]
+        self.stack_bits &= ~self.trump_suit.bit
+        cards_taken = len(self.deck) - self.card_stack.qsize()
+        self.zobrist ^= TRUMP_KEYS[self.trump_suit.kind] ^ STACK_KEYS[cards_taken - 1] ^ STACK_KEYS[cards_taken]
 
         # Hand out last 2 cards for every player
         for i in range(4, 6):
@@ -185,7 +526,7 @@ class GaigelSim:
         """
         Selects a random starting player and rotates queue to that player
         """
-        self.current_player = random.choice(self.players.queue)
+        self.current_player = self.rng.choice(self.players.queue)
 
         # Rotate player queue to selected player
         self.rotate_queue_to_player(self.current_player)
@@ -207,11 +548,19 @@ class GaigelSim:
         Gives the specified player a card from the stack
         :param player: Player class instance
         """
-        empty_slot = list(player.cards_hand.keys())[list(player.cards_hand.values()).index(None)]
-        player.cards_hand[empty_slot] = self.card_stack.get()
+        card = self.card_stack.get()
+        self.stack_bits &= ~card.bit
+
+        # Update hash. The second card of a kind in the hand has its own key
+        cards_taken = len(self.deck) - self.card_stack.qsize()
+        copy = player.hand_bits & KIND_BITS[card.kind] != 0
+        self.zobrist ^= (HAND_KEYS[(player.seat * KIND_COUNT + card.kind) * 2 + copy]
+                         ^ STACK_KEYS[cards_taken - 1] ^ STACK_KEYS[cards_taken])
+
+        player.add_card(card)
 
         if self.verbose:
-            print(f"[ACTION] {player.name} draws card {player.cards_hand[empty_slot].val()}")
+            print(f"[ACTION] {player.name} draws card {card.val()}")
 
     def draw_card_and_rotate(self):
         """
@@ -229,28 +578,16 @@ class GaigelSim:
         Counts up all played cards during current round and selects round winner. Winners points are added.
         :return: Player class instance of winner
         """
-        start_type = self.card_round_stack[0].type
-        card_round_values = []
-
-        # Calculate points for every card
-        for card in self.card_round_stack:
-            card_value = card.value
-            # Add 1000 if it is a trump
-            if card.type == self.trump:
-                card_value += 1000
-            # Add 100 if it is a round start type
-            elif card.type == start_type:
-                card_value += 100
-
-            card_round_values.append(card_value)
-
-        # Determine winner by card score
-        winner_index = card_round_values.index(max(card_round_values))
+        # Look up winner and points in the precomputed rank table
+        kinds = [card.kind for card in self.card_round_stack]
+        winner_index, played_cards_points = resolve_trick(self.trump_state, kinds)
         winner = self.card_placed_by[winner_index]
 
         # Add points for winner
-        played_cards_points = sum([card.value for card in self.card_round_stack])
+        points_index = winner.seat * (MAX_POINTS + 1)
+        self.zobrist ^= POINTS_KEYS[points_index + winner.points]
         winner.points += played_cards_points
+        self.zobrist ^= POINTS_KEYS[points_index + winner.points]
 
         if self.verbose:
             print(f"[STATUS] {winner.name} wins the round (+{played_cards_points} points)")
@@ -271,35 +608,55 @@ class GaigelSim:
 
         return self.game_winners
 
-    def validate_move(self, player, move_id):
+    def legal_action_mask(self, player):
+        """
+        Computes which cards the player is allowed to play in the current state of the game
+        :param player: Player class instance
+        :return: Integer bitmask. Bit i is set if the card in position i + 1 can be played
+        """
+        # If match color is active and the player has the type, only cards of that type can be played
+        if self.match_color and self.card_round_stack:
+            matching_mask = player.suit_slots[KIND_SUIT[self.card_round_stack[0].kind]]
+            if matching_mask:
+                return matching_mask
+
+        return player.slot_mask
+
+    def unseen_cards(self, player):
+        """
+        Gets the cards a player has not seen yet: the card stack and the hands of the other players
+        :param player: Player class instance
+        :return: Bitboard of cards (see rules.KIND_BITS and rules.bitboard_kinds)
+        """
+        return ALL_CARDS & ~(player.hand_bits | self.played_bits | (self.trump_suit.bit if self.trump_suit else 0))
+
+    def validate_move(self, player, move_id, action_mask=None):
         """
         Takes a player and move id and checks if the move is valid in the current state of the game
         :param player: Player class instance
         :param move_id: move id of the players action according to the class variable "moves"
+        :param action_mask: Legal action mask of the player, if already computed for this turn
         :return: Boolean if move is valid or not
         """
 
         # CASE: Play card from hand
         if 1 <= move_id <= 5:
-            # Check if player has card on position
-            if player.cards_hand[move_id] is None:
+            if action_mask is None:
+                action_mask = self.legal_action_mask(player)
+
+            if not action_mask >> (move_id - 1) & 1:
                 if self.verbose:
-                    print(f"[INVALID MOVE] {player.name} tried playing card in position {move_id}, but has no card "
-                          f"in position {move_id}")
+                    # Check if player has card on position
+                    if player.cards_hand[move_id] is None:
+                        print(f"[INVALID MOVE] {player.name} tried playing card in position {move_id}, but has no "
+                              f"card in position {move_id}")
+                    # Otherwise match color was not followed
+                    else:
+                        print(f"[INVALID MOVE] {player.name} tried playing card type "
+                              f"{player.cards_hand[move_id].type}, when type match for type "
+                              f"{self.card_round_stack[0].type} is active")
                 return False
 
-            # Check if match color is followed, if active
-            if self.match_color and len(self.card_round_stack) > 0:
-                type_to_be_matched = self.card_round_stack[0].type
-                player_hand_card_types = [card.type if card is not None else card for card in player.cards_hand.values()]
-                player_has_type = True if type_to_be_matched in player_hand_card_types else False
-
-                if player_has_type and player.cards_hand[move_id].type != type_to_be_matched:
-                    if self.verbose:
-                        print(f"[INVALID MOVE] {player.name} tried playing card type {player.cards_hand[move_id].type},"
-                              f" when type match for type {type_to_be_matched} is active")
-                    return False
-
         # All checks passed
         return True
 
@@ -316,32 +673,24 @@ class GaigelSim:
 
         return self.game_over
 
-    def get_state(self, player):
+    def get_state(self, player, action_mask=None):
         """
         Get state for a player. This can be used to train decision making for a player agent
-        State space: [0-3, 0-24 * 5, 0-24 * (players-1)]
+        State space: [0-3, 0-24 * 5, 0-24 * (players-1)], plus the legal action mask of the player
+        The hand and stack states are the buffers the simulation updates as cards move, not copies. Copy them to
+        keep the state of a specific turn
         :param player: Player class instance
+        :param action_mask: Legal action mask of the player, if already computed for this turn
         :return: state array including ids for all cards on the players hand and cards placed in the round
         """
 
-        # First part: trump
-        trump_state = self.trump_ids[self.trump]
+        # Legal actions (1 if the card in the position can be played)
+        if action_mask is None:
+            action_mask = self.legal_action_mask(player)
+        mask_state = [action_mask >> i & 1 for i in range(5)]
 
-        # Second part: player hand
-        hand_card_vals = [card.val() if card is not None else card for card in player.cards_hand.values()]
-        hand_state = [self.ids_by_card[card_val] for card_val in hand_card_vals]
-
-        # Third part: round stack
-        stack_state = [self.ids_by_card[card.val()] for card in self.card_round_stack]
-
-        if len(stack_state) > self.players.qsize() - 1:
-            stack_state = stack_state[:2]  # TODO Temp fix: Otherwise stack becomes to long at last turn when training
-
-        while len(stack_state) != self.players.qsize() - 1:  # -1 bc a state with all players cards placed is finished
-
-            stack_state.append(0)
-
-        return {"trump_state": trump_state, "hand_state": hand_state, "stack_state": stack_state}
+        return {"trump_state": self.trump_state, "hand_state": player.hand_state, "stack_state": self.stack_state,
+                "action_mask": mask_state}
 
     def new_round_actions(self):
         """
@@ -353,8 +702,14 @@ class GaigelSim:
         self.current_turn = 0
 
         # Reset turn variables
-        self.card_round_stack = []
-        self.card_placed_by = []
+        for position, card in enumerate(self.card_round_stack):
+            self.zobrist ^= ROUND_KEYS[position * KIND_COUNT + card.kind]
+        if self.card_placed_by:
+            self.zobrist ^= LEAD_KEYS[self.card_placed_by[0].seat]
+        self.card_round_stack.clear()
+        self.card_placed_by.clear()
+        for i in range(len(self.stack_state)):
+            self.stack_state[i] = 0
 
         if self.verbose:
             print(f"[STATUS] Starting round {self.current_round}")
@@ -368,11 +723,19 @@ class GaigelSim:
         winner = self.determine_round_winner()
         self.rotate_queue_to_player(winner)
 
+        if self.observers:
+            for observer in self.observers:
+                observer.on_round_end(self, winner)
+
         # Check game over conditions
         if self.validate_game_over():
 
             self.determine_game_winner()
 
+            if self.observers:
+                for observer in self.observers:
+                    observer.on_game_over(self)
+
             if self.verbose:
                 print(f"[STATUS] Game over. {'Winner is' if len(self.game_winners) == 1 else 'Winners are'} "
                       f"{', '.join([winner.name for winner in self.game_winners])}")
@@ -391,8 +754,9 @@ class GaigelSim:
                     print(f"[STATUS] {self.current_player.name} skipped card draw due to empty stack")
 
         # Switch to farbe bekennen, if stack is empty
-        if self.card_stack.qsize() == 0:
+        if self.card_stack.qsize() == 0 and not self.match_color:
             self.match_color = True
+            self.zobrist ^= MATCH_COLOR_KEY
 
     def step(self):
         """
@@ -428,10 +792,14 @@ class GaigelSim:
         # Advance turn count
         self.current_turn += 1
 
+        # Compute legal moves once per turn. The state is only built for players that use it
+        self.action_mask = self.legal_action_mask(self.current_player)
+        state = self.get_state(self.current_player, self.action_mask) if self.current_player.needs_state else None
+
         # Get player action. Repeat if move was not valid
         while True:
-            player_action = self.current_player.get_action(state=self.get_state(self.current_player))
-            if self.validate_move(self.current_player, player_action):
+            player_action = self.current_player.get_action(state=state, sim=self)
+            if self.validate_move(self.current_player, player_action, action_mask=self.action_mask):
                 break
 
         # Place card
@@ -441,10 +809,31 @@ class GaigelSim:
                       f"{self.current_player.cards_hand[player_action].val()}")
 
             # Add selected card to current round stack and remove from players hand
-            self.card_round_stack.append(self.current_player.cards_hand[player_action])
-            self.current_player.cards_hand[player_action] = None
+            card = self.current_player.remove_card(player_action)
+            self.current_player.cards_played.append(card)
+            self.played_bits |= card.bit
+
+            # A player that does not match color has no card of the round start type left
+            if self.match_color and self.card_round_stack and card.type != self.card_round_stack[0].type:
+                self.current_player.void_suits |= 1 << KIND_SUIT[self.card_round_stack[0].kind]
+
+            if len(self.card_round_stack) < len(self.stack_state):
+                self.stack_state[len(self.card_round_stack)] = card.kind
+            self.card_round_stack.append(card)
             self.card_placed_by.append(self.current_player)
 
+            # Update hash. Move the card from the hand key to the round stack key
+            seat = self.current_player.seat
+            copy = self.current_player.hand_bits & KIND_BITS[card.kind] != 0
+            self.zobrist ^= (HAND_KEYS[(seat * KIND_COUNT + card.kind) * 2 + copy]
+                             ^ ROUND_KEYS[(len(self.card_round_stack) - 1) * KIND_COUNT + card.kind])
+            if len(self.card_round_stack) == 1:
+                self.zobrist ^= LEAD_KEYS[seat]
+
+            if self.observers:
+                for observer in self.observers:
+                    observer.on_action(self, self.current_player, player_action, card)
+
     def run(self, manual_player: bool = False):
         """
         Runs a complete gaigel simulation until game over with the step function version
@@ -452,10 +841,11 @@ class GaigelSim:
         if self.verbose:
             print(f"[STATUS] Starting Gaigel simulation with {self.players.qsize()} players")
 
-        # Initial actions
-        self.shuffle_stack()
-        self.select_starting_player()
-        self.hand_out_cards()
+        # Initial actions. Skipped if the cards were already handed out by reset
+        if self.trump is None:
+            self.shuffle_stack()
+            self.select_starting_player()
+            self.hand_out_cards()
         manual_player_instance = self.players.queue[0]
 
         # Game loop
@@ -0,0 +1,270 @@
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from simulation import GaigelSim, spawn_seeds
+from policies import make_policy, policy_name
+from rules import MAX_POINTS
+
+
+class PolicyStats:
+    """
+    Streaming statistics of one policy. Only sums and counts are stored, so partial results from different workers
+    can be merged in any order
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.wins = 0.0  # Shared wins count as a fraction of a win
+        self.points_sum = 0
+        self.points_square_sum = 0
+        self.points_histogram = [0] * (MAX_POINTS + 1)
+
+    def add_game(self, points: int, win_share: float):
+        self.games += 1
+        self.wins += win_share
+        self.points_sum += points
+        self.points_square_sum += points * points
+        self.points_histogram[min(points, MAX_POINTS)] += 1
+
+    def merge(self, other):
+        self.games += other.games
+        self.wins += other.wins
+        self.points_sum += other.points_sum
+        self.points_square_sum += other.points_square_sum
+        for points, count in enumerate(other.points_histogram):
+            self.points_histogram[points] += count
+
+    def win_rate(self):
+        return self.wins / self.games if self.games else 0.0
+
+    def win_rate_interval(self, z: float = 1.96):
+        """
+        Wilson score interval of the win rate
+        :param z: z value of the confidence level. 1.96 for 95%
+        :return: Tuple of lower and upper bound
+        """
+        if not self.games:
+            return 0.0, 1.0
+
+        rate = self.win_rate()
+        denominator = 1 + z * z / self.games
+        center = (rate + z * z / (2 * self.games)) / denominator
+        margin = z * math.sqrt(rate * (1 - rate) / self.games + z * z / (4 * self.games * self.games)) / denominator
+        return max(center - margin, 0.0), min(center + margin, 1.0)
+
+    def mean_points(self):
+        return self.points_sum / self.games if self.games else 0.0
+
+    def points_std(self):
+        if self.games < 2:
+            return 0.0
+        variance = (self.points_square_sum - self.points_sum * self.points_sum / self.games) / (self.games - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def mean_points_interval(self, z: float = 1.96):
+        margin = z * self.points_std() / math.sqrt(self.games) if self.games else 0.0
+        return self.mean_points() - margin, self.mean_points() + margin
+
+    def points_percentile(self, percentile: float):
+        threshold = percentile / 100 * self.games
+        count = 0
+        for points, points_count in enumerate(self.points_histogram):
+            count += points_count
+            if count >= threshold and count > 0:
+                return points
+        return 0
+
+    def to_dict(self):
+        return {"games": self.games, "wins": self.wins, "points_sum": self.points_sum,
+                "points_square_sum": self.points_square_sum, "points_histogram": self.points_histogram}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.games = data["games"]
+        stats.wins = data["wins"]
+        stats.points_sum = data["points_sum"]
+        stats.points_square_sum = data["points_square_sum"]
+        stats.points_histogram = list(data["points_histogram"])
+        return stats
+
+
+def policy_labels(policies):
+    """
+    Gets unique labels of the tournament entries. Entries with the same policy name get their entry number appended,
+    e.g. random#2 and random#3, so the statistics of every label have exactly one sample per game
+    :param policies: List of policies (names or callables), one per seat
+    :return: List of labels
+    """
+    names = [policy_name(policy) for policy in policies]
+    return [f"{name}#{i + 1}" if names.count(name) > 1 else name for i, name in enumerate(names)]
+
+
+def play_chunk(policies, num_of_players: int, seed: int, first_game: int, num_games: int):
+    """
+    Plays a chunk of tournament games in one simulation. The policies rotate through the seats from game to game
+    :param policies: List of policies (names or picklable callables), one per seat
+    :param num_of_players: Number of players per game
+    :param seed: Seed of the chunk
+    :param first_game: Tournament index of the first game in this chunk. Used for the seat rotation
+    :param num_games: Number of games to play
+    :return: dict of entry label to PolicyStats, see policy_labels
+    """
+    labels = policy_labels(policies)
+    policies = [make_policy(policy) for policy in policies]
+    stats = {label: PolicyStats() for label in labels}
+    sim = GaigelSim(num_of_players, seed=seed)
+
+    for game in range(first_game, first_game + num_games):
+        sim.reset()
+
+        # Rotate policies through the seats
+        seat_policies = [(seat + game) % num_of_players for seat in range(num_of_players)]
+        for player, policy_index in zip(sim.player_list, seat_policies):
+            player.policy = policies[policy_index]
+
+        sim.run()
+
+        for player, policy_index in zip(sim.player_list, seat_policies):
+            win_share = 1 / len(sim.game_winners) if player in sim.game_winners else 0.0
+            stats[labels[policy_index]].add_game(player.points, win_share)
+
+    return stats
+
+
+class Tournament:
+    """
+    Plays many games between policies on a process pool. Results are aggregated as the chunks finish and can be
+    checkpointed to a json file, so a long tournament can be resumed after an interruption
+    """
+
+    def __init__(self, policies, num_games: int, seed: int = 0, workers: int = None, chunk_size: int = 1000,
+                 checkpoint_path: str = None, verbose: bool = False):
+        self.policies = list(policies)
+        self.num_of_players = len(self.policies)
+        self.num_games = num_games
+        self.seed = seed
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+        self.verbose = verbose
+
+        self.labels = policy_labels(self.policies)
+        self.stats = {label: PolicyStats() for label in self.labels}
+        self.completed_chunks = set()
+        self.num_chunks = math.ceil(num_games / chunk_size)
+
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            self.load_checkpoint()
+
+    def chunk_games(self, chunk: int):
+        first_game = chunk * self.chunk_size
+        return first_game, min(self.chunk_size, self.num_games - first_game)
+
+    def save_checkpoint(self):
+        data = {"policies": list(self.stats), "num_games": self.num_games, "seed": self.seed,
+                "chunk_size": self.chunk_size, "completed_chunks": sorted(self.completed_chunks),
+                "stats": {name: stats.to_dict() for name, stats in self.stats.items()}}
+
+        # Write to a temporary file first, so an interruption never leaves a broken checkpoint behind
+        temporary_path = self.checkpoint_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(data, file)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def load_checkpoint(self):
+        with open(self.checkpoint_path) as file:
+            data = json.load(file)
+
+        if (data["policies"], data["num_games"], data["seed"], data["chunk_size"]) != \
+                (list(self.stats), self.num_games, self.seed, self.chunk_size):
+            raise ValueError(f"Checkpoint {self.checkpoint_path} belongs to a different tournament")
+
+        self.completed_chunks = set(data["completed_chunks"])
+        self.stats = {name: PolicyStats.from_dict(stats) for name, stats in data["stats"].items()}
+
+        if self.verbose:
+            print(f"[STATUS] Resuming tournament with {len(self.completed_chunks)}/{self.num_chunks} chunks done")
+
+    def add_chunk(self, chunk: int, chunk_stats):
+        for name, stats in chunk_stats.items():
+            self.stats[name].merge(stats)
+        self.completed_chunks.add(chunk)
+
+        if self.checkpoint_path is not None:
+            self.save_checkpoint()
+
+    def run(self):
+        """
+        Plays all remaining chunks of the tournament
+        :return: dict of entry label to PolicyStats, see policy_labels
+        """
+        chunk_seeds = spawn_seeds(self.seed, self.num_chunks)
+        remaining_chunks = [chunk for chunk in range(self.num_chunks) if chunk not in self.completed_chunks]
+        start = time.perf_counter()
+        games_played = 0
+
+        if self.workers <= 1:
+            for chunk in remaining_chunks:
+                self.add_chunk(chunk, play_chunk(self.policies, self.num_of_players, chunk_seeds[chunk],
+                                                 *self.chunk_games(chunk)))
+                games_played += self.chunk_games(chunk)[1]
+                self.print_progress(games_played, start)
+
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(play_chunk, self.policies, self.num_of_players, chunk_seeds[chunk],
+                                           *self.chunk_games(chunk)): chunk for chunk in remaining_chunks}
+
+                for future in as_completed(futures):
+                    chunk = futures[future]
+                    self.add_chunk(chunk, future.result())
+                    games_played += self.chunk_games(chunk)[1]
+                    self.print_progress(games_played, start)
+
+        return self.stats
+
+    def print_progress(self, games_played: int, start: float):
+        if self.verbose:
+            duration = time.perf_counter() - start
+            print(f"[STATUS] {len(self.completed_chunks)}/{self.num_chunks} chunks done "
+                  f"({games_played / duration:.0f} games/s)")
+
+    def summary(self):
+        """
+        Creates a readable summary of the tournament results. Entries with the same policy name are also merged, without
+        confidence intervals, since the seats of one game are not independent samples
+        :return: Summary string
+        """
+        lines = []
+        for name, stats in self.stats.items():
+            low, high = stats.win_rate_interval()
+            points_low, points_high = stats.mean_points_interval()
+            lines.append(f"[RESULT] {name:<10} | {stats.games} games | win rate {stats.win_rate():.4f} "
+                         f"[{low:.4f}, {high:.4f}] | points {stats.mean_points():.2f} "
+                         f"[{points_low:.2f}, {points_high:.2f}] | median {stats.points_percentile(50)} | "
+                         f"p90 {stats.points_percentile(90)}")
+
+        entries_by_name = {}
+        for policy, label in zip(self.policies, self.labels):
+            entries_by_name.setdefault(policy_name(policy), []).append(self.stats[label])
+
+        for name, entries in entries_by_name.items():
+            if len(entries) > 1:
+                merged = PolicyStats()
+                for stats in entries:
+                    merged.merge(stats)
+                lines.append(f"[RESULT] {name:<10} | {len(entries)} entries, {merged.games} seat games | win rate "
+                             f"{merged.win_rate():.4f} | points {merged.mean_points():.2f} | median "
+                             f"{merged.points_percentile(50)} | p90 {merged.points_percentile(90)}")
+
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    tournament = Tournament(["greedy", "random", "random"], num_games=20000, verbose=True)
+    tournament.run()
+    print(tournament.summary())
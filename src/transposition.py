@@ -0,0 +1,167 @@
+"""
+Zobrist hashing of game positions and a bounded transposition table for search agents. The hash covers hands, round
+stack, starting seat of the round, points, number of cards taken from the stack, trump card, match color and the seat
+that moves next. Which cards remain on the card stack and their order are not part of the hash, so positions with
+cards left on the stack only match positions of the same deal. Once the stack is empty (match color phase) the hash
+covers everything that decides how the game continues, and equal hashes mean equal positions across deals and games.
+GaigelSim updates the hash incrementally, compute_hash computes it from a GameSnapshot of any engine.
+"""
+import random
+
+from rules import NUM_KINDS, MAX_POINTS
+
+MAX_SEATS = 9  # 5 cards per player and the trump card have to come from the 48 card deck
+DECK_SIZE = 48
+KIND_COUNT = NUM_KINDS + 1  # Card kinds including 0 (no card)
+
+_rng = random.Random(0x6A16E1)  # Fixed seed, so hashes are the same in every process
+
+
+def _random_keys(count: int):
+    return tuple(_rng.getrandbits(64) for _ in range(count))
+
+
+# Keys of the initial values (0 points, no cards taken from the stack) are 0, so a new game has the hash 0
+HAND_KEYS = _random_keys(MAX_SEATS * KIND_COUNT * 2)  # Index with (seat * 25 + kind) * 2 + copy (0 or 1)
+ROUND_KEYS = _random_keys(MAX_SEATS * KIND_COUNT)  # Index with position * 25 + kind
+LEAD_KEYS = _random_keys(MAX_SEATS)  # Seat that placed the first card of the round
+POINTS_KEYS = tuple(0 if i % (MAX_POINTS + 1) == 0 else key  # Index with seat * 241 + points
+                    for i, key in enumerate(_random_keys(MAX_SEATS * (MAX_POINTS + 1))))
+STACK_KEYS = (0,) + _random_keys(DECK_SIZE)  # Number of cards taken from the stack, including the trump card
+TRUMP_KEYS = (0,) + _random_keys(NUM_KINDS)  # Trump card kind
+FRONT_KEYS = _random_keys(MAX_SEATS)  # Seat at the front of the player queue
+MATCH_COLOR_KEY = _rng.getrandbits(64)
+
+
+def compute_hash(snapshot):
+    """
+    Computes the Zobrist hash of a game state from scratch. Equal to GaigelSim.zobrist_hash of the same state
+    :param snapshot: GameSnapshot
+    :return: 64 bit integer hash
+    """
+    zobrist = FRONT_KEYS[snapshot.front] ^ TRUMP_KEYS[snapshot.trump_card]
+    zobrist ^= STACK_KEYS[DECK_SIZE - len(snapshot.stack)]
+
+    for seat, points in enumerate(snapshot.points):
+        zobrist ^= POINTS_KEYS[seat * (MAX_POINTS + 1) + min(points, MAX_POINTS)]
+
+        seen = set()
+        for kind in snapshot.hands[seat * 5:(seat + 1) * 5]:
+            if kind:
+                zobrist ^= HAND_KEYS[(seat * KIND_COUNT + kind) * 2 + (kind in seen)]
+                seen.add(kind)
+
+    for position, kind in enumerate(snapshot.round_stack):
+        zobrist ^= ROUND_KEYS[position * KIND_COUNT + kind]
+    if snapshot.placed_by:
+        zobrist ^= LEAD_KEYS[snapshot.placed_by[0]]
+
+    if snapshot.match_color:
+        zobrist ^= MATCH_COLOR_KEY
+
+    return zobrist
+
+
+class TranspositionTable:
+    """
+    Fixed size hash table of search results. Every bucket has two entries: the first one keeps the result of the
+    deepest search and is only replaced by deeper or equally deep searches or by results of a newer search, the
+    second one always takes the newest result. Call new_search at the start of every search so old results are
+    replaced first. A table of positions with an empty card stack can be shared over many moves, deals and games, like
+    in EndgameSolver. Results of positions with cards left on the stack are only valid for the same deal, clear the
+    table before searching another deal.
+    """
+
+    def __init__(self, size: int = 1 << 20):
+        """
+        :param size: Maximum number of entries. Rounded up to a power of 2
+        """
+        num_buckets = 1
+        while num_buckets * 2 < size:
+            num_buckets *= 2
+
+        self.mask = num_buckets - 1
+        self.keys = [0] * (2 * num_buckets)
+        self.depths = [-1] * (2 * num_buckets)  # -1 marks an empty entry
+        self.ages = [0] * (2 * num_buckets)
+        self.values = [None] * (2 * num_buckets)
+        self.age = 0
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(1 for depth in self.depths if depth >= 0)
+
+    def new_search(self):
+        """
+        Marks all stored results as old. Old results are replaced before results of the current search
+        """
+        self.age += 1
+
+    def lookup(self, key: int, min_depth: int = 0):
+        """
+        Looks up a stored result
+        :param key: Zobrist hash of the position
+        :param min_depth: Minimum depth of the stored search
+        :return: Stored value or None
+        """
+        index = (key & self.mask) * 2
+        for i in (index, index + 1):
+            if self.keys[i] == key and self.depths[i] >= min_depth:
+                self.ages[i] = self.age
+                self.hits += 1
+                return self.values[i]
+
+        self.misses += 1
+        return None
+
+    def store(self, key: int, value, depth: int = 0):
+        """
+        Stores a result
+        :param key: Zobrist hash of the position
+        :param value: Value to store
+        :param depth: Depth of the search that produced the value. Deeper results are kept longer
+        """
+        index = (key & self.mask) * 2
+
+        # Depth preferred entry
+        if (self.depths[index] < 0 or self.keys[index] == key or self.ages[index] != self.age
+                or depth >= self.depths[index]):
+            i = index
+        # Always replace entry
+        else:
+            i = index + 1
+
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.ages[i] = self.age
+        self.values[i] = value
+
+    def clear(self):
+        for i in range(len(self.keys)):
+            self.keys[i] = 0
+            self.depths[i] = -1
+            self.ages[i] = 0
+            self.values[i] = None
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+
+
+if __name__ == '__main__':
+    from simulation import GaigelSim
+
+    # Check the incremental hash of GaigelSim against the hash computed from scratch
+    sim = GaigelSim(3, seed=0)
+    positions = 0
+    for _ in range(1000):
+        sim.reset()
+        while not sim.game_over:
+            if sim.zobrist_hash() != compute_hash(sim.snapshot()):
+                raise AssertionError("Incremental hash differs from computed hash")
+            sim.step()
+            positions += 1
+
+    print(f"[STATUS] Verified the hash of {positions} positions")
@@ -0,0 +1,357 @@
+import multiprocessing as mp
+
+import numpy as np
+import gymnasium as gym
+from gymnasium.vector.utils import create_shared_memory, read_from_shared_memory
+
+from core import GaigelCore, HAND_SIZE
+from environment import make_observation_space
+from opponents import make_opponents
+from simulation import spawn_seeds
+
+
+def create_buffers(observation_space, num_envs: int, ctx=mp):
+    """
+    Creates the shared memory blocks that hold the batched observations, actions and results of all games
+    :param observation_space: Observation space of a single environment
+    :param num_envs: Number of games
+    :param ctx: multiprocessing context used to allocate the shared memory
+    :return: dict of shared memory objects
+    """
+    return {"observations": create_shared_memory(observation_space, n=num_envs, ctx=ctx),
+            "final_observations": create_shared_memory(observation_space, n=num_envs, ctx=ctx),
+            "actions": ctx.Array("q", num_envs),
+            "rewards": ctx.Array("d", num_envs),
+            "terminated": ctx.Array("b", num_envs),
+            "points": ctx.Array("q", num_envs),
+            "action_masks": ctx.Array("b", num_envs * HAND_SIZE)}
+
+
+def read_buffers(observation_space, shared_buffers, num_envs: int):
+    """
+    Creates NumPy views of the shared memory blocks. Writing to the views writes directly into the shared memory
+    :param observation_space: Observation space of a single environment
+    :param shared_buffers: dict of shared memory objects created by create_buffers
+    :param num_envs: Number of games
+    :return: dict of NumPy arrays
+    """
+    buffers = {}
+    for name, dtype in (("actions", np.int64), ("rewards", np.float64), ("terminated", np.bool_),
+                        ("points", np.int64)):
+        buffers[name] = np.frombuffer(shared_buffers[name].get_obj(), dtype=dtype)
+    buffers["action_masks"] = np.frombuffer(shared_buffers["action_masks"].get_obj(),
+                                            dtype=np.bool_).reshape(num_envs, HAND_SIZE)
+
+    for name in ("observations", "final_observations"):
+        buffers[name] = read_from_shared_memory(observation_space, shared_buffers[name], n=num_envs)
+
+    return buffers
+
+
+class GaigelGameBlock:
+    """
+    Block of games that writes its observations and results into a slice of the shared buffers. Used directly by the
+    synchronous vector env and inside every worker process of the asynchronous one. The agent always plays seat 0
+    with the same step semantics as GaigelEnv. Opponent seats with a model (see opponents.py) are forwarded in
+    lockstep, so every model decides for all games of the block in one batch.
+    """
+
+    def __init__(self, num_of_players: int, buffers, start: int, stop: int, opponents=None):
+        self.num_of_players = num_of_players
+        self.games = [GaigelCore(num_of_players) for _ in range(stop - start)]
+        self.opponents = make_opponents(opponents, num_of_players)
+
+        # Batch buffers for the opponent models. Only the first rows are used if not all games are waiting for a seat
+        self.batch_observations = {"trump": np.zeros(len(self.games), dtype=np.int64),
+                                   "hand": np.zeros((len(self.games), HAND_SIZE), dtype=np.int64),
+                                   "stack": np.zeros((len(self.games), num_of_players - 1), dtype=np.int64)}
+        self.batch_action_masks = np.zeros((len(self.games), HAND_SIZE), dtype=bool)
+
+        # Views of this blocks slice in the shared buffers
+        self.buffers = {name: (buffer[start:stop] if isinstance(buffer, np.ndarray)
+                               else {key: array[start:stop] for key, array in buffer.items()})
+                        for name, buffer in buffers.items()}
+
+    def write_observation(self, index: int, observations):
+        """
+        Writes the observation of the agents player for one game into the given buffers
+        :param index: Index of the game in the block
+        :param observations: Observation buffers to write into
+        """
+        self.write_seat_observation(self.games[index], 0, observations, self.buffers["action_masks"], index)
+
+    def write_seat_observation(self, game: GaigelCore, seat: int, observations, action_masks, row: int):
+        """
+        Writes the observation and the action mask of one seat into a row of the given buffers
+        :param game: GaigelCore instance
+        :param seat: Seat index of the player
+        :param observations: Observation buffers to write into
+        :param action_masks: Action mask buffer to write into
+        :param row: Row of the buffers
+        """
+        observations["trump"][row] = game.trump
+        observations["hand"][row] = game.hands[seat * HAND_SIZE:(seat + 1) * HAND_SIZE]
+
+        stack = observations["stack"][row]
+        stack[:] = game.card_round_stack[:self.num_of_players - 1]
+        stack[game.round_len:] = 0
+
+        action_mask = game.legal_action_mask(seat)
+        for i in range(HAND_SIZE):
+            action_masks[row, i] = action_mask >> i & 1
+
+    def reset_game(self, index: int, seed=None):
+        game = self.games[index]
+        game.reset(seed=seed)
+        game.shuffle_stack()
+        game.select_starting_player()
+        game.hand_out_cards()
+        self.write_observation(index, self.buffers["observations"])
+
+    def reset(self, seeds=None):
+        """
+        Resets all games of the block
+        :param seeds: Optional list with one seed per game
+        """
+        for index in range(len(self.games)):
+            self.reset_game(index, seed=None if seeds is None else seeds[index])
+
+        self.buffers["rewards"][:] = 0
+        self.buffers["terminated"][:] = False
+        self.buffers["points"][:] = 0
+
+    def step(self):
+        """
+        Plays the actions from the action buffer for all games and forwards every game until the agent is next.
+        Finished games are reset automatically, their last observation is kept in the final observation buffer
+        """
+        actions = self.buffers["actions"]
+        rewards = self.buffers["rewards"]
+        terminated = self.buffers["terminated"]
+        points = self.buffers["points"]
+
+        # Set action for agents player and step. Forward simulation till agents player is next in line
+        if any(model is not None for model in self.opponents):
+            for index, game in enumerate(self.games):
+                game.set_next_action(0, int(actions[index]) + 1)
+            self.forward_batched()
+        else:
+            for index, game in enumerate(self.games):
+                game.set_next_action(0, int(actions[index]) + 1)
+                game.step()
+                game.step_to_player_turn(0)
+
+        for index, game in enumerate(self.games):
+            rewards[index] = 1.0 if game.last_round_winner == 0 else 0.0
+            terminated[index] = game.game_over
+            points[index] = game.points[0]
+
+            if game.game_over:
+                self.write_observation(index, self.buffers["final_observations"])
+                self.reset_game(index)
+            else:
+                self.write_observation(index, self.buffers["observations"])
+
+    def forward_batched(self):
+        """
+        Does one step in every game and forwards all games until the agents player is next, like step and
+        step_to_player_turn do for a single game. The games advance seat by seat, the moves of every opponent model
+        are predicted for all waiting games at once
+        """
+        first_step = [True] * len(self.games)
+
+        while True:
+            moved = False
+
+            for seat in range(self.num_of_players):
+                indices = [index for index, game in enumerate(self.games)
+                           if not game.game_over and game.front == seat and (seat != 0 or first_step[index])]
+                if not indices:
+                    continue
+                moved = True
+
+                # One forward pass for all games waiting for this seat. Seats without model play random moves
+                model = self.opponents[seat - 1] if seat != 0 else None
+                if model is not None:
+                    for row, index in enumerate(indices):
+                        self.write_seat_observation(self.games[index], seat, self.batch_observations,
+                                                    self.batch_action_masks, row)
+
+                    batch_size = len(indices)
+                    seat_actions = model.predict({key: array[:batch_size]
+                                                  for key, array in self.batch_observations.items()},
+                                                 self.batch_action_masks[:batch_size])
+                    for row, index in enumerate(indices):
+                        self.games[index].set_next_action(seat, int(seat_actions[row]) + 1)
+
+                for index in indices:
+                    self.games[index].step()
+                    first_step[index] = False
+
+            if not moved:
+                break
+
+
+def _worker(pipe, parent_pipe, shared_buffers, observation_space, num_envs: int, num_of_players: int,
+            start: int, stop: int, opponents=None):
+    """
+    Worker process of the asynchronous vector env. Hosts the games from start to stop and answers commands
+    """
+    parent_pipe.close()
+    buffers = read_buffers(observation_space, shared_buffers, num_envs)
+    block = GaigelGameBlock(num_of_players, buffers, start, stop, opponents=opponents)
+
+    try:
+        while True:
+            command, data = pipe.recv()
+
+            if command == "reset":
+                block.reset(seeds=data)
+                pipe.send(True)
+
+            elif command == "step":
+                block.step()
+                pipe.send(True)
+
+            elif command == "close":
+                pipe.send(True)
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipe.close()
+
+
+class GaigelVectorEnv(gym.vector.VectorEnv):
+    """
+    Vectorized gaigel environment. Steps many games per call and writes the trump, hand and stack observations of
+    all games into preallocated shared memory buffers. With num_workers=0 all games run in the main process,
+    otherwise the games are split between worker processes that write into the same buffers.
+    The returned observations are views of the buffers and are overwritten by the next step.
+    Opponents play random moves unless opponent models are given (see opponents.py). Each worker process gets its
+    own copy of the models and predicts for all games of its block at once. Use the spawn or forkserver context in
+    processes that already ran the parallel JitGaigel engine, forking after its thread pool started is not safe.
+    """
+
+    def __init__(self, num_envs: int, num_of_players: int, num_workers: int = 0, context=None, opponents=None):
+        super().__init__(num_envs, make_observation_space(num_of_players), gym.spaces.Discrete(5))
+        self.num_of_players = num_of_players
+        self.num_workers = num_workers
+
+        ctx = mp.get_context(context)
+        self.shared_buffers = create_buffers(self.single_observation_space, num_envs, ctx=ctx)
+        self.buffers = read_buffers(self.single_observation_space, self.shared_buffers, num_envs)
+
+        # Split games into one block per worker
+        num_blocks = max(num_workers, 1)
+        self.bounds = [round(i * num_envs / num_blocks) for i in range(num_blocks + 1)]
+
+        self.block = None
+        self.pipes = []
+        self.processes = []
+
+        if num_workers == 0:
+            self.block = GaigelGameBlock(num_of_players, self.buffers, 0, num_envs, opponents=opponents)
+
+        else:
+            for start, stop in zip(self.bounds[:-1], self.bounds[1:]):
+                parent_pipe, child_pipe = ctx.Pipe()
+                process = ctx.Process(target=_worker, daemon=True,
+                                      args=(child_pipe, parent_pipe, self.shared_buffers,
+                                            self.single_observation_space, num_envs, num_of_players, start, stop,
+                                            opponents))
+                process.start()
+                child_pipe.close()
+
+                self.pipes.append(parent_pipe)
+                self.processes.append(process)
+
+    def _send(self, command, data=None):
+        for pipe in self.pipes:
+            pipe.send((command, data))
+
+    def _wait(self):
+        for pipe in self.pipes:
+            pipe.recv()
+
+    def reset_async(self, seed=None, options=None):
+        # Every game gets its own random stream, so results do not depend on the number of workers
+        if isinstance(seed, int):
+            seeds = spawn_seeds(seed, self.num_envs)
+        else:
+            seeds = seed
+
+        if self.block is not None:
+            self.block.reset(seeds=seeds)
+        else:
+            for pipe, start, stop in zip(self.pipes, self.bounds[:-1], self.bounds[1:]):
+                pipe.send(("reset", None if seeds is None else seeds[start:stop]))
+
+    def reset_wait(self, seed=None, options=None):
+        self._wait()
+        return self.buffers["observations"], {"action_mask": self.action_masks(),
+                                              "_action_mask": np.ones(self.num_envs, dtype=bool)}
+
+    def action_masks(self):
+        """
+        Legal actions of the agents player in every game
+        :return: Boolean array of shape (num_envs, 5)
+        """
+        return self.buffers["action_masks"].copy()
+
+    def step_async(self, actions):
+        self.buffers["actions"][:] = actions
+
+        if self.block is not None:
+            self.block.step()
+        else:
+            self._send("step")
+
+    def step_wait(self):
+        self._wait()
+
+        terminated = self.buffers["terminated"]
+        infos = {"points": self.buffers["points"].copy(), "_points": np.ones(self.num_envs, dtype=bool),
+                 "action_mask": self.action_masks(), "_action_mask": np.ones(self.num_envs, dtype=bool)}
+
+        # Keep last observation and info of finished games, like the gymnasium vector envs do
+        if terminated.any():
+            final_observations = np.full(self.num_envs, None, dtype=object)
+            final_infos = np.full(self.num_envs, None, dtype=object)
+            for index in np.flatnonzero(terminated):
+                final_observations[index] = {key: array[index].copy()
+                                             for key, array in self.buffers["final_observations"].items()}
+                final_infos[index] = {"points": int(self.buffers["points"][index])}
+
+            infos["final_observation"] = final_observations
+            infos["_final_observation"] = terminated.copy()
+            infos["final_info"] = final_infos
+            infos["_final_info"] = terminated.copy()
+
+        return (self.buffers["observations"], self.buffers["rewards"].copy(), terminated.copy(),
+                np.zeros(self.num_envs, dtype=bool), infos)
+
+    def close_extras(self, **kwargs):
+        for pipe in self.pipes:
+            pipe.send(("close", None))
+        self._wait()
+
+        for process in self.processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    import time
+
+    for workers in (0, 4):
+        env = GaigelVectorEnv(1024, 3, num_workers=workers)
+        env.reset(seed=0)
+
+        num_steps = 200
+        start_time = time.perf_counter()
+        for _ in range(num_steps):
+            env.step(env.action_space.sample())
+        duration = time.perf_counter() - start_time
+        env.close()
+
+        print(f"[STATUS] {workers} workers: {num_steps * env.num_envs / duration:.0f} env steps/s")
@@ -0,0 +1,53 @@
+import random
+
+import numpy as np
+import pytest
+
+from batch import BatchGaigelSim, DECK_SIZE
+from core import INITIAL_DECK
+from simulation import GaigelSim
+
+
+@pytest.mark.parametrize("players", [2, 3, 4, 5, 6])
+def test_batch_matches_sim_card_for_card(players):
+    # Both engines get the same stacks, starting seats and moves, so every game has to stay identical
+    num_games = 40
+    rng = random.Random(players)
+    stacks = []
+    for _ in range(num_games):
+        stack = list(INITIAL_DECK)
+        rng.shuffle(stack)
+        stacks.append(stack)
+    starting_seats = [rng.randrange(players) for _ in range(num_games)]
+
+    batch_sim = BatchGaigelSim(num_games, players, seed=0)
+    batch_sim.reset(stacks=stacks, starting_seats=starting_seats)
+    sims = []
+    for stack, seat in zip(stacks, starting_seats):
+        sim = GaigelSim(players, seed=0)
+        sim.reset(stack=stack, starting_seat=seat)
+        sims.append(sim)
+
+    assert batch_sim.deck_pos == 5 * players + 1
+    assert DECK_SIZE - batch_sim.deck_pos == sims[0].card_stack.qsize()
+
+    while not batch_sim.game_over.all():
+        actions = np.ones(num_games, dtype=np.int64)
+        for i, sim in enumerate(sims):
+            if not sim.game_over:
+                player = sim.players.queue[0]
+                action_mask = sim.legal_action_mask(player)
+                actions[i] = rng.choice([slot for slot in range(1, 6) if action_mask >> (slot - 1) & 1])
+                player.set_next_action(actions[i])
+                sim.step()
+        batch_sim.step(actions)
+
+        for i, sim in enumerate(sims):
+            assert batch_sim.game_over[i] == sim.game_over
+            assert batch_sim.front[i] == sim.players.queue[0].seat
+            for player in sim.player_list:
+                assert batch_sim.hands[i, player.seat].tolist() == list(player.hand_state)
+                assert batch_sim.points[i, player.seat] == player.points
+
+    for i, sim in enumerate(sims):
+        assert batch_sim.game_winners[i].tolist() == [player in sim.game_winners for player in sim.player_list]
@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from cli import build_parser, main, play_chunk
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "cli.py")
+
+
+def test_play_streams_one_json_result_per_game():
+    completed = subprocess.run([sys.executable, CLI, "play", "--policies", "greedy", "random", "--games", "7",
+                                "--seed", "5", "--chunk-size", "3"], capture_output=True, text=True, check=True)
+    results = [json.loads(line) for line in completed.stdout.splitlines()]
+
+    assert [result["game"] for result in results] == list(range(7))
+    for result in results:
+        assert sorted(result["policies"]) == ["greedy", "random"]
+        assert len(result["points"]) == 2
+        assert result["winners"] and all(0 <= seat < 2 for seat in result["winners"])
+    assert "[STATUS] Played 7 games" in completed.stderr
+
+    # A seed from the command line plays the same games as the integer seed
+    assert results == play_chunk(["greedy", "random"], 5, 0, 7)
+
+
+def test_play_writes_the_output_file(tmp_path):
+    path = str(tmp_path / "games.jsonl")
+    assert main(["play", "--policies", "random", "--players", "3", "--games", "4", "--first-game", "10",
+                 "--seed", "1", "--output", path]) == 0
+    with open(path) as file:
+        results = [json.loads(line) for line in file]
+    assert results == play_chunk(["random"] * 3, 1, 10, 4)
+
+
+@pytest.mark.parametrize("command", ["play", "tournament", "record", "export"])
+def test_seeds_are_integers(command):
+    extra = ["--output", "out"] if command in ("record", "export") else []
+    parser = build_parser()
+    assert parser.parse_args([command, "--seed", "5"] + extra).seed == 5
+    assert parser.parse_args([command] + extra).seed == 0
+    with pytest.raises(SystemExit):
+        parser.parse_args([command, "--seed", "five"] + extra)
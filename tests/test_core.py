@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from core import GaigelCore
+from simulation import GaigelSim
+
+
+def deal(game):
+    game.shuffle_stack()
+    game.select_starting_player()
+    game.hand_out_cards()
+
+
+@pytest.mark.parametrize("players", [2, 3, 4, 5, 6])
+def test_core_plays_the_same_games_as_sim(players):
+    for seed in range(100):
+        core = GaigelCore(players, seed=seed)
+        sim = GaigelSim(players, seed=seed)
+        deal(core)
+        deal(sim)
+        assert core.snapshot(include_rng=True) == sim.snapshot(include_rng=True)
+
+        while not sim.game_over:
+            core.step()
+            sim.step()
+            assert core.snapshot(include_rng=True) == sim.snapshot(include_rng=True)
+
+        assert core.game_over
+        assert core.points == [player.points for player in sim.player_list]
+        assert core.game_winners == [player.seat for player in sim.game_winners]
+
+
+@pytest.mark.parametrize("players", [2, 4, 6])
+def test_core_and_sim_agree_on_passed_moves(players):
+    rng = random.Random(players)
+    for seed in range(30):
+        core = GaigelCore(players, seed=seed)
+        sim = GaigelSim(players, seed=seed)
+        deal(core)
+        deal(sim)
+
+        while not sim.game_over:
+            player = sim.players.queue[0]
+            action_mask = sim.legal_action_mask(player)
+            assert core.legal_action_mask(player.seat) == action_mask
+            action = rng.choice([slot for slot in range(1, 6) if action_mask >> (slot - 1) & 1])
+            core.set_next_action(player.seat, action)
+            player.set_next_action(action)
+            core.step()
+            sim.step()
+            assert core.snapshot() == sim.snapshot()
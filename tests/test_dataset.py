@@ -0,0 +1,52 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from dataset import DatasetLoader, export_dataset, shard_paths
+
+
+def test_appending_continues_seeds_and_game_indices(tmp_path):
+    directory = str(tmp_path)
+    export_dataset(directory, ["greedy", "random", "random"], num_games=40, games_per_shard=20, workers=1)
+    export_dataset(directory, ["greedy", "random", "random"], num_games=40, games_per_shard=20, workers=1)
+
+    paths = shard_paths(directory)
+    assert [os.path.basename(path) for path in paths] == [f"shard-{shard:05d}" for shard in range(4)]
+
+    # No shard repeats the games of another shard
+    actions = [np.load(os.path.join(path, "action.npy")).tobytes() for path in paths]
+    assert len(set(actions)) == 4
+
+    games = np.concatenate([np.load(os.path.join(path, "game.npy")) for path in paths])
+    assert np.array_equal(np.unique(games), np.arange(80))
+    with open(os.path.join(directory, "dataset.json")) as file:
+        assert json.load(file)["num_games"] == 80
+
+    loader = DatasetLoader(directory, batch_size=64, seed=0)
+    assert sum(len(batch["action"]) for batch in loader) == loader.num_samples == len(games)
+
+
+def test_appending_other_policies_is_refused(tmp_path):
+    directory = str(tmp_path)
+    export_dataset(directory, ["greedy", "random", "random"], num_games=10, workers=1)
+
+    with pytest.raises(ValueError):
+        export_dataset(directory, ["random", "greedy", "random"], num_games=10, workers=1)
+    with pytest.raises(ValueError):
+        export_dataset(directory, ["greedy", "random", "random"], num_games=10, record=["greedy"], workers=1)
+    assert len(shard_paths(directory)) == 1
+
+
+def test_recording_a_name_records_every_seat_with_that_policy(tmp_path):
+    directory = str(tmp_path)
+    export_dataset(directory, ["random", "greedy", "random"], num_games=12, record=["random"], workers=1)
+    with open(os.path.join(directory, "dataset.json")) as file:
+        assert json.load(file)["recorded"] == [0, 2]
+
+    policies = np.concatenate([np.load(os.path.join(path, "policy.npy")) for path in shard_paths(directory)])
+    assert set(policies.tolist()) == {0, 2}
+
+    with pytest.raises(ValueError):
+        export_dataset(str(tmp_path / "other"), ["random", "greedy"], num_games=2, record=["mcts"], workers=1)
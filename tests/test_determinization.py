@@ -0,0 +1,97 @@
+import collections
+import itertools
+import math
+import random
+
+import pytest
+
+from core import HAND_SIZE
+from determinization import HIDDEN, DealSampler, observe
+from rules import KIND_SUIT
+from simulation import GaigelSim
+
+
+def positions_with_void_suits(players, num_positions, max_hidden=8):
+    # Positions of the match color phase where an opponent is known to have no card of a suit
+    positions = []
+    for seed in range(1000):
+        sim = GaigelSim(players, seed=seed)
+        sim.reset()
+        while not sim.game_over:
+            player = sim.players.queue[0]
+            info_set = observe(sim, player)
+            voids = [suits for seat, suits in enumerate(info_set[3]) if seat != player.seat]
+            if sim.match_color and any(voids) and 3 <= len(info_set[2]) <= max_hidden:
+                positions.append((sim.snapshot(), info_set))
+                break
+            sim.step()
+        if len(positions) == num_positions:
+            return positions
+    raise AssertionError("Not enough positions with void suits")
+
+
+def hidden_slots(info_set):
+    return [i for i, kind in enumerate(info_set[0].hands) if kind == HIDDEN]
+
+
+def consistent_deals(info_set):
+    # All assignments of the hidden cards to the hidden slots that respect the void suits, by brute force
+    _, _, hidden, void_suits = info_set
+    slots = hidden_slots(info_set)
+    deals = collections.Counter()
+    for order in itertools.permutations(hidden):
+        if all(not void_suits[slot // HAND_SIZE] >> KIND_SUIT[kind] & 1 for slot, kind in zip(slots, order)):
+            deals[tuple(sorted(zip((slot // HAND_SIZE for slot in slots), order)))] += 1
+    return deals
+
+
+@pytest.mark.parametrize("players", [3, 4])
+def test_count_matches_brute_force(players):
+    for _, info_set in positions_with_void_suits(players, 6):
+        deals = consistent_deals(info_set)
+
+        # Brute force tells cards of a kind apart and counts the orders within a hand
+        orders = 1
+        for seat in range(players):
+            orders *= math.factorial(sum(1 for slot in hidden_slots(info_set) if slot // HAND_SIZE == seat))
+        assert DealSampler().count(info_set) * orders == sum(deals.values())
+
+
+@pytest.mark.parametrize("players", [3, 4])
+def test_samples_are_uniform_and_respect_void_suits(players):
+    for snapshot, info_set in positions_with_void_suits(players, 4):
+        deals = consistent_deals(info_set)
+        total = sum(deals.values())
+        sampler = DealSampler(random.Random(players))
+        slots = hidden_slots(info_set)
+
+        num_samples = 20 * len(deals) + 2000
+        counts = collections.Counter()
+        for _ in range(num_samples):
+            sample = sampler.sample(info_set)
+            assert sorted(sample.hands[slot] for slot in slots) == list(info_set[2])
+            assert all(sample.hands[i] == snapshot.hands[i] for i in range(len(sample.hands)) if i not in slots)
+            deal = tuple(sorted((slot // HAND_SIZE, sample.hands[slot]) for slot in slots))
+            assert deal in deals
+            counts[deal] += 1
+
+        # Chi-square statistic of the deals against the uniform distribution over consistent deals, 6 sigma bound
+        chi2 = sum((counts[deal] - num_samples * ways / total) ** 2 / (num_samples * ways / total)
+                   for deal, ways in deals.items())
+        dof = len(deals) - 1
+        assert chi2 < dof + 6 * math.sqrt(2 * dof) + 10
+
+
+def test_samples_with_card_stack_hold_the_hidden_cards():
+    sim = GaigelSim(3, seed=0)
+    sim.reset()
+    for _ in range(7):
+        sim.step()
+    info_set = observe(sim, sim.players.queue[0])
+    assert info_set[0].stack
+
+    sampler = DealSampler(random.Random(0))
+    for _ in range(200):
+        sample = sampler.sample(info_set)
+        hidden = [sample.hands[slot] for slot in hidden_slots(info_set)] + list(sample.stack)
+        assert sorted(hidden) == list(info_set[2])
@@ -0,0 +1,33 @@
+import asyncio
+
+import numpy as np
+
+from distributed import Coordinator, LocalCluster, execute_task, spawn_seeds
+
+
+def test_remote_results_match_local_results():
+    async def main():
+        coordinator = Coordinator(port=0, seed=3)
+        await coordinator.start()
+        cluster = LocalCluster(coordinator.host, coordinator.port, num_workers=2)
+        cluster.start()
+        try:
+            for _ in range(6):
+                coordinator.submit("games", policies=["greedy", "random", "random"], num_games=4)
+            coordinator.submit("rollout", num_envs=4, num_of_players=3, steps=16)
+            results = [await coordinator.next_result() for _ in range(7)]
+            return results, set(coordinator.outstanding)
+        finally:
+            cluster.stop()
+            await coordinator.close()
+
+    results, outstanding = asyncio.run(main())
+
+    assert sorted(task["task_id"] for task, _, _ in results) == list(range(7))
+    assert not outstanding
+    for task, _, arrays in results:
+        assert task["seed"] == spawn_seeds(3, 1, task["task_id"])[0]
+        expected = execute_task(task, {})
+        assert arrays.keys() == expected.keys()
+        for name in expected:
+            assert np.array_equal(arrays[name], expected[name])
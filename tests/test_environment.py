@@ -0,0 +1,30 @@
+import numpy as np
+
+from environment import GaigelEnv
+
+
+def play_until_hand_changes(env, observation, info):
+    hand = observation["hand"].copy()
+    while True:
+        observation, _, terminated, _, info = env.step(int(np.flatnonzero(info["action_mask"])[0]))
+        if terminated:
+            observation, info = env.reset()
+        if not np.array_equal(observation["hand"], hand):
+            return hand, observation
+
+
+def test_observations_are_copies_by_default():
+    env = GaigelEnv(3)
+    observation, info = env.reset(seed=0)
+    hand, _ = play_until_hand_changes(env, observation, info)
+
+    assert np.array_equal(observation["hand"], hand)
+
+
+def test_zero_copy_observations_follow_the_simulation():
+    env = GaigelEnv(3, copy_observations=False)
+    observation, info = env.reset(seed=0)
+    _, new_observation = play_until_hand_changes(env, observation, info)
+
+    assert np.shares_memory(observation["hand"], new_observation["hand"])
+    assert np.array_equal(observation["hand"], env.player.hand_state)
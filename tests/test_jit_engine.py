@@ -0,0 +1,95 @@
+import json
+import os
+import random
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from jit_engine import DECK, DECK_SIZE, FRONT, JitGaigel
+from policies import make_policy
+from simulation import GaigelSim
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+CONFIGS = [(2, ["random", "greedy"]), (3, ["greedy", "random", "random"]), (4, ["greedy"] * 4),
+           (6, ["random", "greedy"] * 3)]
+
+
+def test_python_fallback_plays_the_same_games(tmp_path):
+    # Numba is hidden in a fresh interpreter, so the module falls back to plain Python
+    script = (f"import sys\nsys.modules['numba'] = None\nsys.path.insert(0, {SRC!r})\n"
+              "import json\nimport numpy as np\nimport jit_engine\nassert not jit_engine.NUMBA_AVAILABLE\n"
+              "for i, (players, policies) in enumerate(json.loads(sys.argv[1])):\n"
+              "    engine = jit_engine.JitGaigel(50, players, policies, seed=i)\n"
+              "    engine.run()\n"
+              "    np.save(sys.argv[2] + f'/games_{i}.npy', engine.games)\n")
+    subprocess.run([sys.executable, "-c", script, json.dumps(CONFIGS), str(tmp_path)], check=True)
+
+    for i, (players, policies) in enumerate(CONFIGS):
+        engine = JitGaigel(50, players, policies, seed=i)
+        engine.run()
+        assert engine.game_over.all()
+        assert np.array_equal(engine.games, np.load(tmp_path / f"games_{i}.npy"))
+
+
+def compare(engine, sims):
+    hands = engine.hands
+    for i, sim in enumerate(sims):
+        assert engine.game_over[i] == sim.game_over
+        assert engine.points[i].tolist() == [player.points for player in sim.player_list]
+        assert hands[i].tolist() == [list(player.hand_state) for player in sim.player_list]
+        if not sim.game_over:
+            assert engine.games[i, FRONT] == sim.players.queue[0].seat
+
+
+def deal_same_games(engine, players, policies=None):
+    # The engine deals with its own random stream. The simulations get its card stacks and starting seats
+    engine.reset()
+    sims = []
+    for game in engine.games:
+        sim = GaigelSim(players, seed=0)
+        if policies is not None:
+            for player, policy in zip(sim.player_list, policies):
+                player.policy = make_policy(policy)
+        sim.reset(stack=game[DECK:DECK + DECK_SIZE].tolist(), starting_seat=int(game[FRONT]))
+        sims.append(sim)
+    return sims
+
+
+@pytest.mark.parametrize("players", [2, 3, 4, 5, 6])
+def test_greedy_seats_match_greedy_policy(players):
+    engine = JitGaigel(30, players, ["greedy"] * players, seed=players)
+    sims = deal_same_games(engine, players, ["greedy"] * players)
+    compare(engine, sims)
+
+    while not engine.game_over.all():
+        engine.step()
+        for sim in sims:
+            if not sim.game_over:
+                sim.step()
+        compare(engine, sims)
+
+    for i, sim in enumerate(sims):
+        assert engine.winners[i].tolist() == [player in sim.game_winners for player in sim.player_list]
+
+
+@pytest.mark.parametrize("players", [2, 3, 4, 5, 6])
+def test_passed_moves_match_simulation(players):
+    rng = random.Random(players)
+    engine = JitGaigel(30, players, seed=players)
+    sims = deal_same_games(engine, players)
+
+    while not engine.game_over.all():
+        actions = np.zeros(engine.num_games, dtype=np.int64)
+        legal_moves = engine.legal_moves()
+        for i, sim in enumerate(sims):
+            if not sim.game_over:
+                player = sim.players.queue[0]
+                action_mask = sim.legal_action_mask(player)
+                assert legal_moves[i].tolist() == [action_mask >> slot & 1 == 1 for slot in range(5)]
+                actions[i] = rng.choice([slot for slot in range(1, 6) if action_mask >> (slot - 1) & 1])
+                player.set_next_action(actions[i])
+                sim.step()
+        engine.step(actions)
+        compare(engine, sims)
@@ -0,0 +1,35 @@
+from profiling import Profiler
+from simulation import GaigelSim
+
+
+def test_clone_of_profiled_sim_is_not_profiled():
+    sim = GaigelSim(3, seed=0)
+    sim.reset()
+    for _ in range(4):
+        sim.step()
+
+    with Profiler() as profiler:
+        profiler.attach_sim(sim)
+        snapshot = sim.snapshot(include_rng=True)
+        clone = sim.clone()
+        calls = {label: stats.calls for label, stats in profiler.stats.items()}
+
+        # Bounded, a clone calling the wrappers of the original would never finish its game
+        for _ in range(200):
+            if clone.game_over:
+                break
+            clone.step()
+        assert clone.game_over
+
+        assert sim.snapshot(include_rng=True) == snapshot
+        assert {label: stats.calls for label, stats in profiler.stats.items()} == calls
+
+        sim.step()
+        assert profiler.stats["GaigelSim.step"].calls == calls["GaigelSim.step"] + 1
+
+
+def test_detach_restores_class_methods():
+    sim = GaigelSim(3, seed=0)
+    with Profiler() as profiler:
+        profiler.attach_sim(sim)
+    assert not [name for name in sim.__dict__ if hasattr(GaigelSim, name)]
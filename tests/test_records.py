@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+
+from records import RecordReader, RecordWriter, replay, shard_paths
+from simulation import GaigelSim, spawn_seeds
+
+
+def record_games(directory, players, seeds, **kwargs):
+    # Plays and records games, returns the final points, winners and snapshots after every action
+    sim = GaigelSim(players)
+    games = []
+    with RecordWriter(directory, **kwargs) as writer:
+        writer.attach(sim)
+        for seed in seeds:
+            sim.reset(seed)
+            snapshots = [sim.snapshot()]
+            while not sim.game_over:
+                sim.step()
+                snapshots.append(sim.snapshot())
+            games.append(([player.points for player in sim.player_list],
+                          [player.seat for player in sim.game_winners], snapshots))
+    return games
+
+
+def test_records_round_trip_and_replay(tmp_path):
+    games = []
+    for players in (2, 3, 5):
+        games += record_games(str(tmp_path), players, spawn_seeds(players, 12), shard_size=7, chunk_size=4)
+
+    reader = RecordReader(str(tmp_path))
+    assert len(reader) == len(games) == 36
+    assert len(reader.shards) == 3 * 2
+    assert reader[-1]["num_players"] == 5
+
+    for index, (points, winners, snapshots) in enumerate(games):
+        record = reader[index]
+        players = int(record["num_players"])
+        assert list(record["points"][:players]) == points
+        assert record["winners"] == sum(1 << seat for seat in winners)
+        assert record["num_actions"] == len(snapshots) - 1
+
+        sim = reader.replay(index)
+        assert [player.points for player in sim.player_list] == points
+        assert [player.seat for player in sim.game_winners] == winners
+        assert sim.snapshot() == snapshots[-1]
+
+        middle = len(snapshots) // 2
+        assert replay(record, num_actions=middle).snapshot() == snapshots[middle]
+
+
+def test_writer_continues_after_the_highest_shard(tmp_path):
+    directory = str(tmp_path)
+    record_games(directory, 3, spawn_seeds(0, 9), shard_size=3)
+    paths = shard_paths(directory)
+    assert [os.path.basename(path) for path in paths] == ["games-00000.rec", "games-00001.rec", "games-00002.rec"]
+
+    last_shard = np.fromfile(paths[-1], dtype=np.uint8)
+    os.remove(paths[1])
+    record_games(directory, 3, spawn_seeds(1, 2), shard_size=3)
+
+    assert [os.path.basename(path) for path in shard_paths(directory)] == ["games-00000.rec", "games-00002.rec",
+                                                                          "games-00003.rec"]
+    assert np.array_equal(np.fromfile(paths[-1], dtype=np.uint8), last_shard)
+    assert len(RecordReader(directory)) == 8
@@ -0,0 +1,73 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from batch import KIND_SUIT_ARRAY, KIND_VALUE_ARRAY, TRICK_RANK_ARRAY
+from benchmark import load_legacy_simulation
+from rules import SUITS, NUM_KINDS, KIND_NAMES, KIND_SUIT, KIND_VALUE, resolve_trick
+from simulation import GaigelSim
+
+legacy_simulation = load_legacy_simulation()
+
+# Every round of 2 and 3 cards, so every combination of trump, lead and following card is covered
+ROUNDS = [list(kinds) for count in (2, 3) for kinds in itertools.product(range(1, NUM_KINDS + 1), repeat=count)]
+
+
+def legacy_round_winner(trump: int, kinds):
+    """
+    Resolves a round with the original object based GaigelSim.determine_round_winner
+    :return: Tuple of (index of the winning card, sum of the card values)
+    """
+    sim = legacy_simulation.GaigelSim(len(kinds))
+    players = [legacy_simulation.Player(f"player_{i + 1}") for i in range(len(kinds))]
+    sim.trump = SUITS[trump]
+    sim.card_round_stack = [legacy_simulation.Card(KIND_VALUE[kind], SUITS[KIND_SUIT[kind]]) for kind in kinds]
+    sim.card_placed_by = players
+    winner = sim.determine_round_winner()
+    return players.index(winner), winner.points
+
+
+@pytest.fixture(scope="module")
+def legacy_results():
+    return {trump: [legacy_round_winner(trump, kinds) for kinds in ROUNDS] for trump in range(len(SUITS))}
+
+
+def test_card_names_match_legacy_cards():
+    for kind in range(1, NUM_KINDS + 1):
+        card = legacy_simulation.Card(KIND_VALUE[kind], SUITS[KIND_SUIT[kind]])
+        assert card.val() == KIND_NAMES[kind]
+
+
+@pytest.mark.parametrize("trump", range(len(SUITS)))
+def test_resolve_trick_matches_legacy(trump, legacy_results):
+    for kinds, expected in zip(ROUNDS, legacy_results[trump]):
+        assert resolve_trick(trump, kinds) == expected, (SUITS[trump], [KIND_NAMES[kind] for kind in kinds])
+
+
+@pytest.mark.parametrize("trump", range(len(SUITS)))
+def test_sim_round_winner_matches_legacy(trump, legacy_results):
+    sim = GaigelSim(3, seed=0)
+    sim.trump_state = trump
+    for kinds, (winner_index, points) in zip(ROUNDS, legacy_results[trump]):
+        players = sim.player_list[:len(kinds)]
+        for player in players:
+            player.points = 0
+        sim.card_round_stack = [sim.cards_by_kind[kind][0] for kind in kinds]
+        sim.card_placed_by = list(players)
+
+        assert sim.determine_round_winner() is players[winner_index]
+        assert players[winner_index].points == points
+
+
+@pytest.mark.parametrize("trump", range(len(SUITS)))
+def test_batch_rank_table_matches_legacy(trump, legacy_results):
+    for count in (2, 3):
+        rounds = np.array([kinds for kinds in ROUNDS if len(kinds) == count], dtype=np.int8)
+        expected = [result for kinds, result in zip(ROUNDS, legacy_results[trump]) if len(kinds) == count]
+
+        # Same lookup as BatchGaigelSim.determine_round_winner
+        lead = KIND_SUIT_ARRAY[rounds[:, 0]]
+        ranks = TRICK_RANK_ARRAY[trump, lead[:, None], rounds]
+        assert ranks.argmax(axis=1).tolist() == [winner_index for winner_index, _ in expected]
+        assert KIND_VALUE_ARRAY[rounds].sum(axis=1).tolist() == [points for _, points in expected]
@@ -0,0 +1,74 @@
+import numpy as np
+
+from selfplay import NUM_ACTIONS, Adam, MLPPolicy, SelfPlayTrainer
+
+
+def random_batch(policy, rng, size=32):
+    players = policy.num_of_players
+    observations = {"trump": rng.integers(4, size=size), "hand": rng.integers(25, size=(size, 5)),
+                    "stack": rng.integers(25, size=(size, players - 1))}
+    action_masks = rng.random((size, NUM_ACTIONS)) < 0.6
+    action_masks[np.arange(size), rng.integers(NUM_ACTIONS, size=size)] = True
+    actions = np.array([rng.choice(np.flatnonzero(mask)) for mask in action_masks])
+    return observations, action_masks, actions
+
+
+def test_gradient_matches_finite_differences():
+    rng = np.random.default_rng(0)
+    policy = MLPPolicy(3, hidden_size=8, seed=0)
+    policy.params += rng.normal(0, 0.3, policy.size)
+    observations, action_masks, actions = random_batch(policy, rng)
+    x = policy.features(observations)
+
+    # Old log probabilities near the current ones, so most ratios stay inside the clip range
+    _, probabilities, _ = policy.forward(x, action_masks)
+    old_log_probabilities = np.log(probabilities[np.arange(len(actions)), actions]) + rng.normal(0, 0.05, len(actions))
+    advantages = rng.normal(size=len(actions))
+    returns = rng.normal(size=len(actions))
+    args = (x, action_masks, actions, old_log_probabilities, advantages, returns)
+
+    _, gradient = policy.gradient(*args)
+    epsilon = 1e-6
+    for index in rng.choice(policy.size, 200, replace=False):
+        original = policy.params[index]
+        policy.params[index] = original + epsilon
+        loss_plus = policy.gradient(*args)[0]
+        policy.params[index] = original - epsilon
+        loss_minus = policy.gradient(*args)[0]
+        policy.params[index] = original
+        assert np.isclose((loss_plus - loss_minus) / (2 * epsilon), gradient[index], rtol=1e-4, atol=1e-7)
+
+
+def test_adam_minimizes_a_quadratic():
+    target = np.array([1.0, -2.0, 3.0])
+    params = np.zeros(3)
+    optimizer = Adam(3, learning_rate=0.05)
+    for _ in range(1000):
+        optimizer.step(params, 2 * (params - target))
+    assert np.allclose(params, target, atol=1e-2)
+
+
+def test_predictions_are_legal():
+    rng = np.random.default_rng(1)
+    policy = MLPPolicy(4, hidden_size=16, seed=1)
+    observations, action_masks, _ = random_batch(policy, rng, size=200)
+    actions, log_probabilities = policy.act(observations, action_masks)
+    assert action_masks[np.arange(200), actions].all()
+    assert (log_probabilities <= 0).all()
+
+
+def test_trainer_smoke_run(tmp_path):
+    trainer = SelfPlayTrainer(num_of_players=3, num_actors=1, envs_per_actor=8, rollout_length=8, hidden_size=16,
+                              league_interval=2, seed=0, context="spawn", verbose=False)
+    initial = trainer.policy.get_flat().copy()
+    history = trainer.train(total_samples=640, report_interval=0.0)
+
+    assert trainer.samples >= 640
+    assert trainer.updates == trainer.samples // 64
+    assert history and np.isfinite(history[-1]["loss"])
+    assert trainer.shared["league_count"].value > 1
+    assert not np.array_equal(trainer.policy.get_flat(), initial)
+
+    trainer.policy.save(str(tmp_path / "policy.npz"))
+    loaded = MLPPolicy.load(str(tmp_path / "policy.npz"))
+    assert np.array_equal(loaded.get_flat(), trainer.policy.get_flat())
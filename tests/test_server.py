@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from opponents import RandomOpponent
+from server import GaigelServer, random_client
+
+
+def test_policy_tables_let_other_tasks_run():
+    async def main():
+        server = GaigelServer(port=0, seed=0)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.get_running_loop().create_task(ticker())
+        await server.play_bots(["greedy", "random", "random"], num_tables=2, num_games=2)
+        task.cancel()
+        return server, ticks
+
+    server, ticks = asyncio.run(main())
+
+    assert server.games == 4
+    assert ticks >= server.moves // 2
+
+
+def test_join_rejects_too_many_games():
+    async def main():
+        server = GaigelServer(port=0, seed=0, max_games=10)
+        await server.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        replies = []
+        for games in (11, 0):
+            writer.write((json.dumps({"type": "join", "players": 3, "bots": ["random", "random"], "games": games})
+                          + "\n").encode())
+            replies.append(json.loads(await reader.readline()))
+        writer.close()
+        await server.close()
+        return replies
+
+    for reply in asyncio.run(main()):
+        assert reply["type"] == "error"
+
+
+def test_client_game_finishes():
+    async def main():
+        server = GaigelServer(port=0, move_timeout=1.0, seed=0)
+        await server.start()
+        points = await random_client("127.0.0.1", server.port, seed=0)
+        await server.close()
+        return points
+
+    points = asyncio.run(main())
+
+    assert len(points) == 3
+    assert sum(points) > 0
+
+
+def test_clients_can_only_ask_for_cheap_bots():
+    async def main():
+        server = GaigelServer(port=0, seed=0, models={"model": RandomOpponent(seed=0)})
+        await server.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        replies = []
+        for bots in (["ismcts", "random"], ["model", "greedy"]):
+            writer.write((json.dumps({"type": "join", "players": 3, "bots": bots}) + "\n").encode())
+            replies.append(json.loads(await reader.readline()))
+        writer.close()
+        await server.close()
+        return replies
+
+    rejected, joined = asyncio.run(main())
+    assert rejected["type"] == "error" and "ismcts" in rejected["message"]
+    assert joined["type"] == "joined"
@@ -0,0 +1,38 @@
+from simulation import GaigelSim, Player
+
+
+def test_random_action_without_simulation_plays_a_card_on_hand():
+    sim = GaigelSim(3, seed=0)
+    sim.reset()
+    player = sim.player_list[0]
+    player.remove_card(2)
+
+    actions = {player.get_action() for _ in range(200)}
+    assert actions == {1, 3, 4, 5}
+
+
+
+def play_with_first_player(player_class):
+    sim = GaigelSim(3, seed=0)
+    player = player_class("agent", rng=sim.rng)
+    player.seat = 0
+    player.states = []
+    sim.player_list[0] = player
+    sim.reset()
+    sim.run()
+    return player.states
+
+
+def test_subclasses_overriding_get_action_get_the_state():
+    class StatePlayer(Player):
+        def get_action(self, state=None, sim=None):
+            self.states.append(state)
+            return super().get_action(state, sim)
+
+    class LazyPlayer(StatePlayer):
+        needs_state = False
+
+    states = play_with_first_player(StatePlayer)
+    assert states and all(state is not None for state in states)
+    assert all(state is None for state in play_with_first_player(LazyPlayer))
+    assert not Player.needs_state
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from core import GaigelCore
+from simulation import GaigelSim
+from transposition import compute_hash
+
+
+def play_to_random_position(sim, rng):
+    sim.reset()
+    for _ in range(rng.randrange(60)):
+        if sim.game_over:
+            break
+        sim.step()
+
+
+@pytest.mark.parametrize("players", [2, 3, 4, 6])
+def test_clone_plays_the_same_game_and_leaves_the_original_alone(players):
+    rng = random.Random(players)
+    sim = GaigelSim(players, seed=players)
+    for _ in range(30):
+        play_to_random_position(sim, rng)
+        before = sim.snapshot(include_rng=True)
+        clone = sim.clone()
+        assert clone.snapshot(include_rng=True) == before
+        assert clone.zobrist_hash() == sim.zobrist_hash()
+        assert [player.void_suits for player in clone.player_list] == [player.void_suits for player in sim.player_list]
+
+        # The clone continues with a copy of the random stream, the original is not touched by its moves
+        while not clone.game_over:
+            clone.step()
+        assert sim.snapshot(include_rng=True) == before
+
+        while not sim.game_over:
+            sim.step()
+        assert sim.snapshot(include_rng=True) == clone.snapshot(include_rng=True)
+
+
+@pytest.mark.parametrize("players", [2, 3, 5])
+def test_snapshot_round_trips_through_sim_and_core(players):
+    rng = random.Random(players)
+    sim = GaigelSim(players, seed=players)
+    other = GaigelSim(players, seed=0)
+    core = GaigelCore(players, seed=0)
+    for _ in range(30):
+        play_to_random_position(sim, rng)
+        snapshot = sim.snapshot(include_rng=True)
+
+        other.restore(snapshot)
+        assert other.snapshot(include_rng=True) == snapshot
+        assert other.zobrist_hash() == sim.zobrist_hash() == compute_hash(snapshot)
+
+        core.restore(snapshot)
+        assert core.snapshot(include_rng=True) == snapshot
+        assert core.clone().snapshot(include_rng=True) == snapshot
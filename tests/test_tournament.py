@@ -0,0 +1,16 @@
+from tournament import Tournament, policy_labels
+
+
+def test_policy_labels_are_unique():
+    assert policy_labels(["greedy", "random", "random"]) == ["greedy", "random#2", "random#3"]
+    assert policy_labels(["greedy", "random"]) == ["greedy", "random"]
+
+
+def test_every_entry_gets_one_sample_per_game():
+    tournament = Tournament(["greedy", "random", "random"], num_games=20, workers=1, chunk_size=8)
+    stats = tournament.run()
+
+    assert list(stats) == ["greedy", "random#2", "random#3"]
+    assert all(entry.games == 20 for entry in stats.values())
+    assert abs(sum(entry.wins for entry in stats.values()) - 20) < 1e-9
+    assert "random     | 2 entries, 40 seat games" in tournament.summary()
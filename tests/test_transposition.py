@@ -0,0 +1,37 @@
+from endgame import EndgameSolver
+from simulation import GaigelSim
+from transposition import TranspositionTable, compute_hash
+
+
+def test_incremental_hash_matches_computed_hash():
+    sim = GaigelSim(3, seed=0)
+    for _ in range(200):
+        sim.reset()
+        while not sim.game_over:
+            assert sim.zobrist_hash() == compute_hash(sim.snapshot())
+            sim.step()
+        assert sim.zobrist_hash() == compute_hash(sim.snapshot())
+
+
+def test_table_keeps_deep_results_and_replaces_old_ones():
+    table = TranspositionTable(4)
+    table.store(5, "deep", depth=3)
+    table.store(5 + 2 * (table.mask + 1), "shallow", depth=1)
+    assert table.lookup(5) == "deep"
+    assert table.lookup(5, min_depth=4) is None
+
+    table.new_search()
+    table.store(5 + 4 * (table.mask + 1), "new", depth=0)
+    assert table.lookup(5 + 4 * (table.mask + 1)) == "new"
+
+
+def test_endgame_solver_shares_its_table_between_deals():
+    sim = GaigelSim(3, seed=3)
+    solver = EndgameSolver(table_size=1 << 12)
+    for _ in range(3):
+        sim.reset()
+        while not sim.match_color and not sim.game_over:
+            sim.step()
+        if not sim.game_over:
+            values = solver.move_values(sim.snapshot())
+            assert values == EndgameSolver(table_size=1 << 12).move_values(sim.snapshot())
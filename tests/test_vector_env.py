@@ -0,0 +1,74 @@
+import numpy as np
+
+from vector_env import GaigelVectorEnv
+
+
+def legal_actions(rng, action_masks):
+    scores = rng.random(action_masks.shape)
+    scores[~action_masks] = -1.0
+    return scores.argmax(axis=1)
+
+
+def play(num_workers, num_steps=150):
+    # Spawned workers, forking after other tests started the thread pool of Numba can hang the test process
+    env = GaigelVectorEnv(24, 3, num_workers=num_workers, context="spawn")
+    rng = np.random.default_rng(0)
+    observations, info = env.reset(seed=7)
+    history = [{key: array.copy() for key, array in observations.items()}]
+    try:
+        for _ in range(num_steps):
+            observations, rewards, terminated, _, info = env.step(legal_actions(rng, info["action_mask"]))
+            final_observations = [info["final_observation"][index] for index in np.flatnonzero(terminated)]
+            history.append(({key: array.copy() for key, array in observations.items()}, rewards, terminated,
+                            info["points"], info["action_mask"], final_observations))
+    finally:
+        env.close()
+    return history
+
+
+def assert_equal(first, second):
+    if isinstance(first, dict):
+        assert first.keys() == second.keys()
+        for key in first:
+            assert_equal(first[key], second[key])
+    elif isinstance(first, (list, tuple)):
+        assert len(first) == len(second)
+        for a, b in zip(first, second):
+            assert_equal(a, b)
+    else:
+        assert np.array_equal(first, second)
+
+
+def test_workers_give_the_same_results_as_the_main_process():
+    history = play(0)
+    assert any(step[2].any() for step in history[1:])
+    assert_equal(history, play(2))
+    assert_equal(history, play(3))
+
+
+def test_finished_games_reset_and_keep_their_final_observation():
+    env = GaigelVectorEnv(8, 3)
+    rng = np.random.default_rng(1)
+    observations, info = env.reset(seed=1)
+    finished = 0
+    while finished < 8:
+        observations, _, terminated, _, info = env.step(legal_actions(rng, info["action_mask"]))
+        if not terminated.any():
+            assert "final_observation" not in info
+            continue
+
+        assert np.array_equal(info["_final_observation"], terminated)
+        for index in range(env.num_envs):
+            if not terminated[index]:
+                assert info["final_observation"][index] is None
+                continue
+
+            finished += 1
+            final_observation = info["final_observation"][index]
+            assert final_observation.keys() == observations.keys()
+            assert info["final_info"][index]["points"] == info["points"][index]
+
+            # The game was dealt again, the agent has a full hand and a legal move
+            assert np.count_nonzero(observations["hand"][index]) == 5
+            assert info["action_mask"][index].any()
+    env.close()